@@ -1,12 +1,13 @@
 """Shared API dependencies (auth, etc.)."""
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
+from jose import JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import get_settings
+from app.core.dataloader import DataLoader
 from app.core.database import get_db
-from app.core.security import ALGORITHM
+from app.core.security import decode_access_token
 from app.models.user import User
 from app.repositories.user_repository import user_repository
 
@@ -18,14 +19,14 @@ async def get_current_user(
     db: AsyncSession = Depends(get_db),
     token: str = Depends(oauth2_scheme),
 ) -> User:
-    """Lấy user hiện tại từ JWT."""
+    """Lấy user hiện tại từ JWT. User đã xác thực được cache theo ID (user_cache) để tránh query DB mỗi request."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Không xác thực được thông tin đăng nhập",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         user_id = payload.get("sub")
         if user_id is None:
             raise credentials_exception
@@ -33,7 +34,12 @@ async def get_current_user(
     except (JWTError, ValueError):
         raise credentials_exception
 
-    user = await user_repository.get(db, user_id)
+    user = await user_repository.get_cached(db, user_id)
     if user is None:
         raise credentials_exception
     return user
+
+
+async def get_user_loader(db: AsyncSession = Depends(get_db)) -> DataLoader[int, User]:
+    """DataLoader user theo ID cho một request: các get(id) cùng vòng event loop gộp thành một IN query."""
+    return DataLoader(lambda ids: user_repository.get_many(db, ids))
@@ -0,0 +1,24 @@
+"""Admin endpoints: số liệu vận hành."""
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app.api.dependencies import get_current_user
+from app.core.query_stats import query_stats
+from app.models.user import User
+
+router = APIRouter()
+
+
+@router.get("/sql-stats")
+async def get_sql_stats(
+    limit: Optional[int] = Query(50, ge=1, le=500),
+    reset: bool = False,
+    current_user: User = Depends(get_current_user),
+):
+    """Thống kê SQL theo mẫu câu lệnh: count, total/mean/p95/max (ms), sắp theo tổng thời gian (chỉ admin)."""
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Không có quyền")
+    stats = query_stats.snapshot(limit)
+    if reset:
+        query_stats.reset()
+    return {"queries": stats}
@@ -1,18 +1,23 @@
 """Auth endpoints: login, register với OTP, forgot password."""
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, TypeAdapter
 
+from app.core.cache import invalidate_on_commit, user_cache
 from app.core.config import get_settings
-from app.core.database import get_db
-from app.core.security import create_access_token, verify_password, get_password_hash
-from app.models.otp import OTPType
+from app.core.database import get_db, get_primary_db
+from app.core.rate_limit import rate_limiter
+from app.core.serialization import dump_response
+from app.core.security import create_access_token, averify_password, aget_password_hash, needs_rehash
+from app.models.otp import OTP, OTPType
 from app.models.user import User
 from app.schemas.user import User as UserSchema, UserCreate
 from app.services.user_service import user_service
 from app.services.otp_service import otp_service
+from app.services.email_dispatcher import email_dispatcher
 
 router = APIRouter()
 settings = get_settings()
@@ -25,6 +30,9 @@ class TokenResponse(BaseModel):
     user: UserSchema
 
 
+token_response_adapter = TypeAdapter(TokenResponse)
+
+
 class RegisterResponse(BaseModel):
     """Response khi register thành công."""
     message: str
@@ -49,23 +57,34 @@ class ResetPasswordRequest(BaseModel):
     new_password: str
 
 
+def _raise_invalid_otp(otp: Optional[OTP]):
+    """400 cho OTP sai hoặc hết hạn."""
+    if otp and otp.is_expired():
+        raise HTTPException(status_code=400, detail="Mã OTP đã hết hạn")
+    raise HTTPException(status_code=400, detail="Mã OTP không hợp lệ")
+
+
 @router.post("/register", response_model=RegisterResponse, status_code=status.HTTP_201_CREATED)
 async def register(
     user_in: UserCreate,
+    http_request: Request,
     db: AsyncSession = Depends(get_db),
 ):
     """Đăng ký user mới, gửi OTP qua email để kích hoạt."""
+    await rate_limiter.enforce(http_request, "register", account=user_in.email)
     try:
         # Tạo user với is_active=False
         user = await user_service.create_user(db, user_in)
         
-        # Tạo và gửi OTP activation
+        # Tạo và gửi OTP activation; quá hạn mà chưa kích hoạt thì job dọn xóa user
         await otp_service.create_and_send_otp(
             db,
             user.email,
             OTPType.ACTIVATION,
         )
+        otp_service.add_pending_activation(db, user.id)
         await db.commit()
+        email_dispatcher.notify()
         
         return RegisterResponse(
             message="Đăng ký thành công! Vui lòng kiểm tra email để lấy mã OTP kích hoạt tài khoản.",
@@ -79,9 +98,11 @@ async def register(
 @router.post("/verify-otp", response_model=TokenResponse)
 async def verify_otp(
     request: VerifyOTPRequest,
-    db: AsyncSession = Depends(get_db),
+    http_request: Request,
+    db: AsyncSession = Depends(get_primary_db),  # OTP vừa tạo ở request trước: đọc primary, không chờ replica
 ):
     """Verify OTP để kích hoạt tài khoản."""
+    await rate_limiter.enforce(http_request, "verify-otp", account=request.email)
     is_valid, otp = await otp_service.verify_otp(
         db,
         request.email,
@@ -90,9 +111,7 @@ async def verify_otp(
     )
 
     if not is_valid:
-        if otp and otp.is_expired():
-            raise HTTPException(status_code=400, detail="Mã OTP đã hết hạn")
-        raise HTTPException(status_code=400, detail="Mã OTP không hợp lệ")
+        _raise_invalid_otp(otp)
 
     # Activate user
     user = await user_service.repository.get_by_email(db, request.email)
@@ -100,8 +119,9 @@ async def verify_otp(
         raise HTTPException(status_code=404, detail="Không tìm thấy user")
 
     user.is_active = True
+    await otp_service.clear_pending_activation(db, user.id)
+    invalidate_on_commit(db, user_cache, user.id)
     await db.commit()
-    await db.refresh(user)
 
     # Tạo token sau khi activate
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -110,19 +130,20 @@ async def verify_otp(
         expires_delta=access_token_expires,
     )
 
-    return TokenResponse(
-        access_token=access_token,
-        token_type="bearer",
-        user=user,
+    return dump_response(
+        token_response_adapter,
+        {"access_token": access_token, "token_type": "bearer", "user": user},
     )
 
 
 @router.post("/forgot-password")
 async def forgot_password(
     request: ForgotPasswordRequest,
+    http_request: Request,
     db: AsyncSession = Depends(get_db),
 ):
     """Gửi OTP để reset password."""
+    await rate_limiter.enforce(http_request, "forgot-password", account=request.email)
     # Kiểm tra email có tồn tại không
     user = await user_service.repository.get_by_email(db, request.email)
     if not user:
@@ -138,6 +159,7 @@ async def forgot_password(
         OTPType.RESET_PASSWORD,
     )
     await db.commit()
+    email_dispatcher.notify()
 
     return {
         "message": "Nếu email tồn tại, chúng tôi đã gửi mã OTP đến email của bạn."
@@ -147,21 +169,32 @@ async def forgot_password(
 @router.post("/reset-password")
 async def reset_password(
     request: ResetPasswordRequest,
-    db: AsyncSession = Depends(get_db),
+    http_request: Request,
+    db: AsyncSession = Depends(get_primary_db),  # OTP vừa tạo ở request trước: đọc primary, không chờ replica
 ):
     """Reset password với OTP."""
-    # Verify OTP
+    await rate_limiter.enforce(http_request, "reset-password", account=request.email)
+    # Kiểm tra OTP (chỉ đọc) rồi mới hash: transaction không giữ khóa ghi trong lúc chạy bcrypt
     is_valid, otp = await otp_service.verify_otp(
         db,
         request.email,
         request.otp_code,
         OTPType.RESET_PASSWORD,
+        consume=False,
     )
+    if not is_valid:
+        _raise_invalid_otp(otp)
+    hashed_password = await aget_password_hash(request.new_password)
 
+    # Xóa OTP nguyên tử: request song song cùng mã chỉ một request thành công
+    is_valid, otp = await otp_service.verify_otp(
+        db,
+        request.email,
+        request.otp_code,
+        OTPType.RESET_PASSWORD,
+    )
     if not is_valid:
-        if otp and otp.is_expired():
-            raise HTTPException(status_code=400, detail="Mã OTP đã hết hạn")
-        raise HTTPException(status_code=400, detail="Mã OTP không hợp lệ")
+        _raise_invalid_otp(otp)
 
     # Lấy user
     user = await user_service.repository.get_by_email(db, request.email)
@@ -169,7 +202,8 @@ async def reset_password(
         raise HTTPException(status_code=404, detail="Không tìm thấy user")
 
     # Update password
-    user.hashed_password = get_password_hash(request.new_password)
+    user.hashed_password = hashed_password
+    invalidate_on_commit(db, user_cache, user.id)
     await db.commit()
 
     return {"message": "Đổi mật khẩu thành công! Vui lòng đăng nhập lại."}
@@ -177,12 +211,14 @@ async def reset_password(
 
 @router.post("/login", response_model=TokenResponse)
 async def login(
+    http_request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: AsyncSession = Depends(get_db),
 ):
     """Đăng nhập với JWT (email hoặc username + password)."""
+    await rate_limiter.enforce(http_request, "login", account=form_data.username)
     user = await user_service.repository.get_by_email_or_username(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await averify_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email/username hoặc mật khẩu không đúng",
@@ -194,14 +230,17 @@ async def login(
             detail="Tài khoản chưa được kích hoạt. Vui lòng kiểm tra email để lấy mã OTP.",
         )
 
+    # Hash lưu theo cost cũ: hash lại nền theo cost hiện tại (mật khẩu gốc chỉ có lúc login)
+    if settings.PASSWORD_REHASH_ON_LOGIN and needs_rehash(user.hashed_password):
+        user_service.schedule_rehash(user.id, form_data.password, user.hashed_password)
+
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": str(user.id)},
         expires_delta=access_token_expires,
     )
 
-    return TokenResponse(
-        access_token=access_token,
-        token_type="bearer",
-        user=user,
+    return dump_response(
+        token_response_adapter,
+        {"access_token": access_token, "token_type": "bearer", "user": user},
     )
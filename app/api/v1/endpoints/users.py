@@ -1,14 +1,40 @@
 """User endpoints."""
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.dependencies import get_current_user
+from app.api.dependencies import get_current_user, get_user_loader
 from app.core.database import get_db
+from app.core.config import get_settings
+from app.core.dataloader import DataLoader
+from app.core.http_cache import cache_headers, is_not_modified, resource_etag
+from app.core.serialization import dump_response
+from app.core.security import decode_page_cursor, encode_page_cursor
 from app.models.user import User
-from app.schemas.user import User as UserSchema, UserCreate, UserUpdate
+from app.schemas.user import (
+    User as UserSchema,
+    UserBatch,
+    UserCreate,
+    UserPage,
+    UserUpdate,
+    user_adapter,
+    user_batch_adapter,
+    user_page_adapter,
+)
 from app.services.user_service import user_service
 
 router = APIRouter()
+settings = get_settings()
+
+
+def _user_response(request: Request, user: User) -> Response:
+    """Response user có ETag/Last-Modified; client gửi If-None-Match khớp thì trả 304, không serialize."""
+    headers = cache_headers(
+        resource_etag(user.id, user.updated_at), user.updated_at, settings.USER_RESPONSE_CACHE_CONTROL
+    )
+    if is_not_modified(request, headers):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return dump_response(user_adapter, user, headers=headers)
 
 
 @router.post("/", response_model=UserSchema, status_code=status.HTTP_201_CREATED)
@@ -19,28 +45,87 @@ async def create_user(
     """Đăng ký user mới."""
     try:
         user = await user_service.create_user(db, user_in)
-        return user
+        return dump_response(user_adapter, user, status_code=status.HTTP_201_CREATED)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+def _parse_ids(raw: str) -> list[int]:
+    """'3,1,3' → [3, 1, 3]; 400 nếu sai định dạng, rỗng hoặc quá USERS_BATCH_MAX_IDS."""
+    try:
+        ids = [int(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids phải là các số nguyên cách nhau dấu phẩy")
+    if not ids:
+        raise HTTPException(status_code=400, detail="ids không được rỗng")
+    if len(ids) > settings.USERS_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Tối đa {settings.USERS_BATCH_MAX_IDS} ID mỗi lần")
+    return ids
+
+
+@router.get("/", response_model=Union[UserPage, UserBatch])
+async def list_users(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    is_active: Optional[bool] = None,
+    ids: Optional[str] = Query(None, description="Tra nhiều user theo ID, cách nhau dấu phẩy (vd. 3,1,7)"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    user_loader: DataLoader[int, User] = Depends(get_user_loader),
+):
+    """Danh sách user phân trang bằng cursor (chỉ admin). Truyền next_cursor để lấy trang sau.
+
+    Có ids: tra nhiều user (mọi user đã đăng nhập, như GET /users/{id}) bằng một IN query. Kết quả đúng thứ
+    tự ids (ID lặp lại thì lặp lại), ID không có user trả found=false.
+    """
+    if ids is not None:
+        requested = _parse_ids(ids)
+        users = await user_loader.load_many(requested)
+        return dump_response(
+            user_batch_adapter,
+            {
+                "items": [
+                    {"id": id, "found": user is not None, "user": user}
+                    for id, user in zip(requested, users)
+                ]
+            },
+        )
+
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Không có quyền")
+    try:
+        after_id = decode_page_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = {"is_active": is_active} if is_active is not None else None
+    users, next_after_id = await user_service.repository.get_page(db, after_id, limit, filters)
+    return dump_response(
+        user_page_adapter,
+        {
+            "items": users,
+            "next_cursor": encode_page_cursor(next_after_id) if next_after_id is not None else None,
+        },
+    )
+
+
 @router.get("/me", response_model=UserSchema)
-async def read_current_user(current_user: User = Depends(get_current_user)):
-    """Lấy thông tin user đang đăng nhập."""
-    return current_user
+async def read_current_user(request: Request, current_user: User = Depends(get_current_user)):
+    """Lấy thông tin user đang đăng nhập (hỗ trợ If-None-Match; cache user ấm thì 304 không truy vấn DB)."""
+    return _user_response(request, current_user)
 
 
 @router.get("/{user_id}", response_model=UserSchema)
 async def read_user(
     user_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Lấy user theo ID."""
-    user = await user_service.repository.get(db, user_id)
+    """Lấy user theo ID (qua user_cache; hỗ trợ If-None-Match như /me)."""
+    user = await user_service.repository.get_cached(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Không tìm thấy user")
-    return user
+    return _user_response(request, user)
 
 
 @router.patch("/{user_id}", response_model=UserSchema)
@@ -53,10 +138,13 @@ async def update_user(
     """Cập nhật user (chỉ cho chính mình)."""
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Không có quyền")
-    user = await user_service.update_user(db, user_id, user_in)
+    try:
+        user = await user_service.update_user(db, user_id, user_in)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not user:
         raise HTTPException(status_code=404, detail="Không tìm thấy user")
-    return user
+    return dump_response(user_adapter, user)
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
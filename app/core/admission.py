@@ -0,0 +1,141 @@
+"""Admission control: giới hạn số request chạy đồng thời theo nhóm route, quá tải thì trả 503 sớm.
+
+Nhóm "auth" (bcrypt, gửi email: /auth/*, tạo và sửa user) và "db" (còn lại) có pool riêng:
+auth quá tải không làm nghẽn route đọc DB.
+Health check và /metrics không qua pool nào nên luôn được phục vụ, load balancer không đánh dấu node chết.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+
+from starlette.responses import JSONResponse
+
+from app.core import metrics
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# Path luôn được phục vụ (không giới hạn)
+EXEMPT_PATHS = frozenset({"/", "/kaithhealthcheck", "/kaithheathcheck", "/metrics"})
+
+
+class AdmissionPool:
+    """Tối đa max_concurrent request chạy cùng lúc; request khác chờ tối đa max_wait giây, hàng chờ tối đa max_queue."""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> bool:
+        """Lấy slot. Trả về False nếu hàng chờ đầy hoặc chờ quá max_wait (request bị từ chối)."""
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        start = time.perf_counter()
+        try:
+            # asyncio.timeout thay vì wait_for: wait_for (3.11) nuốt CancelledError nếu future vừa xong,
+            # request bị hủy vẫn nhận slot. Ở đây hủy luôn là CancelledError và slot được trả ở dưới
+            async with asyncio.timeout(self.max_wait):
+                await future
+            return True
+        except asyncio.TimeoutError:
+            # Slot được trao đúng lúc hết giờ: vẫn nhận, không thì slot bị mất
+            return future.done() and not future.cancelled()
+        except asyncio.CancelledError:
+            # Đã được trao slot nhưng request bị hủy: trả slot cho request kế tiếp
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            metrics.admission_wait_seconds.observe(time.perf_counter() - start, self.name)
+            if not future.done() or future.cancelled():
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+
+    def release(self):
+        """Trả slot: trao thẳng cho request chờ lâu nhất, không có thì giảm active."""
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+class AdmissionMiddleware:
+    """ASGI middleware: xếp request vào pool theo nhóm route, hết slot thì trả 503 + Retry-After."""
+
+    def __init__(self, app):
+        self.app = app
+        self.auth_prefix = f"{settings.API_V1_STR}/auth/"
+        self.users_path = f"{settings.API_V1_STR}/users/"
+
+    def classify(self, method: str, path: str) -> Optional[AdmissionPool]:
+        """Pool của request, None nếu luôn được phục vụ."""
+        if path in EXEMPT_PATHS:
+            return None
+        # Route auth, tạo user và sửa user (đổi mật khẩu): hash bcrypt, gửi email
+        if path.startswith(self.auth_prefix):
+            return pools["auth"]
+        if (method == "POST" and path == self.users_path) or (method == "PATCH" and path.startswith(self.users_path)):
+            return pools["auth"]
+        return pools["db"]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        pool = self.classify(scope["method"], scope["path"])
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+        if not await pool.acquire():
+            metrics.admission_shed_total.inc(pool.name)
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Server đang quá tải, vui lòng thử lại sau"},
+                headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER_SECONDS)},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release()
+
+
+pools = {
+    "auth": AdmissionPool(
+        "auth",
+        # Mỗi request auth chạy một lần bcrypt: đồng thời bằng số worker hash
+        settings.ADMISSION_AUTH_MAX_CONCURRENT or settings.PASSWORD_HASH_WORKERS,
+        settings.ADMISSION_AUTH_MAX_QUEUE,
+        settings.ADMISSION_AUTH_MAX_WAIT_SECONDS,
+    ),
+    "db": AdmissionPool(
+        "db",
+        settings.ADMISSION_DB_MAX_CONCURRENT,
+        settings.ADMISSION_DB_MAX_QUEUE,
+        settings.ADMISSION_DB_MAX_WAIT_SECONDS,
+    ),
+}
+
+metrics.GaugeFunc(
+    "admission_active", "Số request đang chạy theo pool",
+    lambda: {(name,): pool.active for name, pool in pools.items()}, ("pool",),
+)
+metrics.GaugeFunc(
+    "admission_queued", "Số request đang chờ theo pool",
+    lambda: {(name,): len(pool._waiters) for name, pool in pools.items()}, ("pool",),
+)
@@ -0,0 +1,79 @@
+"""In-process cache: TTL + LRU, có đếm hit/miss."""
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.core.metrics import CounterFunc, GaugeFunc
+
+settings = get_settings()
+
+
+class TTLCache:
+    """Cache LRU giới hạn max_size, mỗi entry hết hạn sau ttl giây. Chỉ dùng trong một event loop."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Lấy giá trị còn hạn, None nếu không có."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """Lưu giá trị; bỏ entry ít dùng nhất nếu vượt max_size."""
+        if self.max_size <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Xóa một entry."""
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        """Số liệu cache: size, hits, misses, hit_ratio."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+def invalidate_on_commit(db: AsyncSession, cache: TTLCache, key: Hashable):
+    """Xóa entry ngay và xóa lại sau khi transaction commit (tránh request khác nạp lại dữ liệu cũ)."""
+    cache.invalidate(key)
+    event.listen(db.sync_session, "after_commit", lambda session: cache.invalidate(key), once=True)
+
+
+# Cache user đã xác thực (serialized, key = user id), dùng trong get_current_user
+user_cache = TTLCache(settings.USER_CACHE_MAX_SIZE, settings.USER_CACHE_TTL_SECONDS)
+
+GaugeFunc("user_cache_size", "Số user trong cache", lambda: len(user_cache._data))
+CounterFunc("user_cache_hits_total", "Số lần cache user hit", lambda: user_cache.hits)
+CounterFunc("user_cache_misses_total", "Số lần cache user miss", lambda: user_cache.misses)
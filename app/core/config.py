@@ -7,6 +7,25 @@ class Settings(BaseSettings):
     """Application settings from environment."""
 
     DATABASE_URL: str = "sqlite+aiosqlite:///./app.db"
+
+    # Replica đọc: SELECT ngoài transaction ghi đi round-robin sang replica khỏe
+    DATABASE_REPLICA_URLS: str = ""  # DSN replica đọc, cách nhau dấu phẩy (rỗng = chỉ dùng primary)
+    DB_REPLICA_RETRY_SECONDS: float = 30.0  # Replica lỗi kết nối bị bỏ qua trong khoảng này
+
+    # Pool kết nối của engine (QueuePool)
+    DB_POOL_SIZE: int = 5  # Số kết nối giữ sẵn
+    DB_MAX_OVERFLOW: int = 10  # Số kết nối mở thêm khi pool hết
+    DB_POOL_TIMEOUT: float = 30.0  # Thời gian chờ lấy kết nối trước khi báo lỗi (giây)
+    DB_POOL_RECYCLE: int = 3600  # Đóng và mở lại kết nối cũ hơn mức này (giây, -1 = không)
+    DB_POOL_PREWARM: int = 2  # Số kết nối mở sẵn lúc khởi động (tối đa DB_POOL_SIZE, 0 = tắt)
+    DB_SCHEMA_FINGERPRINT: bool = True  # Bỏ qua create_all khi fingerprint schema trùng bản đã lưu
+
+    # PRAGMA áp dụng cho mỗi kết nối SQLite
+    SQLITE_JOURNAL_MODE: str = "WAL"  # WAL: đọc không chặn ghi, ghi không chặn đọc
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # NORMAL an toàn với WAL, ít fsync hơn FULL
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # Chờ khóa ghi thay vì báo "database is locked" ngay
+    SQLITE_CACHE_SIZE_KB: int = 20000  # Page cache mỗi kết nối
+    SQLITE_MMAP_SIZE: int = 268435456  # Đọc qua memory-map (256 MB, 0 = tắt)
     SECRET_KEY: str = "keynaykhongaibiet"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 90
     API_V1_STR: str = "/api/v1"
@@ -19,10 +38,103 @@ class Settings(BaseSettings):
     SMTP_PASSWORD: str = ""  # App password (không phải password email thường)
     SMTP_FROM_EMAIL: str = ""  # Email hiển thị người gửi
     SMTP_FROM_NAME: str = "KeBook"
+    SMTP_POOL_SIZE: int = 2  # Số kết nối SMTP giữ sẵn (đã login)
+    SMTP_TIMEOUT: float = 10.0  # Socket timeout của mỗi thao tác SMTP (kết nối, đọc, ghi; giây)
+    SMTP_KEEPALIVE_CHECK_SECONDS: int = 30  # Kết nối rảnh lâu hơn mức này sẽ NOOP kiểm tra trước khi dùng
+    SMTP_CIRCUIT_FAILURES: int = 5  # Số lỗi liên tiếp trước khi ngắt mạch
+    SMTP_CIRCUIT_RESET_SECONDS: int = 30  # Thời gian ngắt mạch trước khi thử lại
+    SMTP_TEST_MODE: bool = False  # True: gửi tới SMTP server giả lập local (không STARTTLS/login)
+
+    # Email outbox (gửi nền theo batch)
+    EMAIL_OUTBOX_BATCH_SIZE: int = 50  # Số email lấy ra mỗi lượt
+    EMAIL_OUTBOX_CONCURRENCY: int = 4  # Số email gửi song song
+    EMAIL_OUTBOX_POLL_SECONDS: float = 2.0  # Chu kỳ quét outbox khi rảnh
+    EMAIL_OUTBOX_MAX_ATTEMPTS: int = 5  # Quá số lần này chuyển sang dead-letter
+    EMAIL_OUTBOX_BACKOFF_SECONDS: float = 5.0  # Backoff lũy thừa: 5s, 10s, 20s, ...
+    EMAIL_OUTBOX_LEASE_SECONDS: int = 120  # Email "sending" quá thời gian này được nhận lại (worker chết)
+    EMAIL_OUTBOX_DEAD_RETENTION_SECONDS: int = 7 * 24 * 3600  # Giữ email dead-letter để tra lỗi, sau đó xóa
+    EMAIL_OUTBOX_PURGE_INTERVAL_SECONDS: float = 3600.0  # Chu kỳ job xóa email dead-letter cũ
     
     # OTP settings
     OTP_EXPIRE_SECONDS: int = 90  # OTP hết hạn sau 90 giây
     OTP_LENGTH: int = 6  # Độ dài OTP (6 số)
+    OTP_EXPIRED_RETENTION_SECONDS: int = 60  # Giữ OTP hết hạn thêm để báo "đã hết hạn" thay vì "không hợp lệ"
+    OTP_CLEANUP_BATCH_SIZE: int = 500  # Số bản ghi xóa mỗi batch khi dọn nền
+    OTP_CLEANUP_TIME_BUDGET_SECONDS: float = 5.0  # Thời gian tối đa mỗi lượt dọn, phần còn lại để lượt sau
+
+    OTP_CLEANUP_INTERVAL_SECONDS: float = 60.0  # Chu kỳ dọn khi có việc
+    OTP_CLEANUP_MAX_INTERVAL_SECONDS: float = 600.0  # Chu kỳ tối đa khi các lượt dọn liên tiếp không thấy gì
+
+    # Scheduler job nền (mỗi job chỉ chạy ở một process trong cụm)
+    SCHEDULER_JITTER: float = 0.1  # Lệch ngẫu nhiên ±10% chu kỳ
+    SCHEDULER_INITIAL_DELAY_SECONDS: float = 10.0  # Lượt chạy đầu sau khởi động (nhường tài nguyên cho request đầu)
+    SCHEDULER_LEASE_SECONDS: float = 300.0  # Thời gian tối đa một lượt chạy giữ lease; quá hạn process khác nhận
+
+    # State store cho dữ liệu ngắn hạn (OTP, counter): "sql", "memory" (1 worker) hoặc "redis"
+    STATE_STORE_BACKEND: str = "sql"
+    REDIS_URL: str = "redis://localhost:6379/0"
+
+    # Rate limit endpoint auth (login/register/forgot-password/verify-otp/reset-password), dạng "số request/giây"
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"  # "memory" (1 process) hoặc "shared" (dùng state store, nhiều worker/node)
+    RATE_LIMIT_ROUTE: str = "300/60"  # Tổng mỗi route (bảo vệ CPU bcrypt và SMTP)
+    RATE_LIMIT_IP: str = "30/60"  # Mỗi IP trên mỗi route
+    RATE_LIMIT_ACCOUNT: str = "5/60"  # Mỗi email/username trên mỗi route (chống dò mật khẩu/OTP)
+    RATE_LIMIT_MAX_KEYS: int = 100000  # Số key tối đa của backend memory (LRU)
+    RATE_LIMIT_TRUST_FORWARDED: bool = False  # True: lấy IP từ X-Forwarded-For (chạy sau load balancer tin cậy)
+
+    # Admission control: giới hạn request đồng thời theo nhóm route, quá tải trả 503 (health check luôn được phục vụ)
+    ADMISSION_ENABLED: bool = True
+    # Route auth/tạo và sửa user (bcrypt, email). 0 = PASSWORD_HASH_WORKERS: nhận thêm chỉ làm request xếp hàng
+    # trong pool hash, ngoài tầm kiểm soát của max wait. Chọn sao cho
+    # MAX_WAIT >= (MAX_QUEUE / MAX_CONCURRENT + 1) * thời gian một request (≈ một lần hash bcrypt)
+    ADMISSION_AUTH_MAX_CONCURRENT: int = 0
+    ADMISSION_AUTH_MAX_QUEUE: int = 32
+    ADMISSION_AUTH_MAX_WAIT_SECONDS: float = 5.0
+    ADMISSION_DB_MAX_CONCURRENT: int = 64  # Các route còn lại (chủ yếu đọc DB)
+    ADMISSION_DB_MAX_QUEUE: int = 256
+    ADMISSION_DB_MAX_WAIT_SECONDS: float = 5.0
+    ADMISSION_RETRY_AFTER_SECONDS: int = 1
+
+    # Số dòng mỗi câu lệnh khi ghi hàng loạt (create_many/update_many/upsert_many)
+    BULK_CHUNK_SIZE: int = 500
+
+    # Cache user đã xác thực (get_current_user)
+    USER_CACHE_MAX_SIZE: int = 10000  # Số user tối đa trong cache (0 = tắt cache)
+    USER_CACHE_TTL_SECONDS: float = 60.0  # Thời gian sống mỗi entry
+
+    # Singleflight cho đọc repository (get/get_by_email...): request đồng thời cùng key dùng chung một query
+    REPOSITORY_SINGLEFLIGHT: bool = False
+
+    # Số ID tối đa mỗi lần GET /users/?ids=...
+    USERS_BATCH_MAX_IDS: int = 100
+
+    # HTTP cache cho GET /users/me, /users/{id} (client luôn hỏi lại bằng ETag, server trả 304 nếu không đổi)
+    USER_RESPONSE_CACHE_CONTROL: str = "private, no-cache"
+
+    # Cache JWT đã verify (key = SHA256 của token, vẫn kiểm tra exp mỗi lần dùng)
+    JWT_VERIFY_CACHE_SIZE: int = 10000
+    JWT_VERIFY_CACHE_TTL_SECONDS: float = 300.0
+
+    # Serialize response
+    RESPONSE_CLASS: str = "json"  # Cho route không có response_model: "json" hoặc "orjson" (cần cài orjson)
+    RESPONSE_FAST_PATH: bool = True  # Handler trả JSON đã validate sẵn, bỏ bước validate lại theo response_model
+
+    # Password hashing (bcrypt chạy trong pool riêng, không chặn event loop)
+    PASSWORD_HASH_EXECUTOR: str = "thread"  # "thread" hoặc "process"
+    PASSWORD_HASH_WORKERS: int = 4  # Số worker hash song song
+    PASSWORD_HASH_QUEUE_SIZE: int = 64  # Số yêu cầu chờ tối đa, vượt quá trả 503
+    PASSWORD_HASH_ROUNDS: int = 12  # Cost bcrypt (4-31), mỗi +1 gấp đôi thời gian hash
+    PASSWORD_HASH_TARGET_MS: float = 0.0  # >0: lúc khởi động tự chọn cost để một lần hash ~ số ms này (thay PASSWORD_HASH_ROUNDS)
+    PASSWORD_HASH_MIN_ROUNDS: int = 10  # Cost tối thiểu khi tự chọn
+    PASSWORD_REHASH_ON_LOGIN: bool = True  # Login thành công với hash khác cost hiện tại thì hash lại (chạy nền)
+
+    # Log/thống kê SQL (thay cho echo=True)
+    SQL_ECHO: bool = False  # True: SQLAlchemy in mọi câu lệnh (chỉ dùng khi debug)
+    SLOW_QUERY_THRESHOLD_MS: float = 200.0  # Câu lệnh chậm hơn mức này được log "slow_query"
+    SQL_SAMPLE_RATE: float = 0.0  # Tỉ lệ câu lệnh (0..1) được log mẫu "sampled_query"
+    SQL_LOG_PARAMETERS: bool = False  # Có ghi tham số vào log không (có thể chứa dữ liệu nhạy cảm)
+    SQL_STATS_MAX_FINGERPRINTS: int = 500  # Số mẫu câu lệnh tối đa được thống kê
 
     class Config:
         env_file = ".env"
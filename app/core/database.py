@@ -1,18 +1,30 @@
 """Database connection and session management."""
+import asyncio
+import hashlib
 import ssl
+import time
+from datetime import datetime
+from typing import Optional
 from urllib.parse import urlparse, parse_qs, urlunparse
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy import Connection, DateTime, MetaData, Select, delete, event, inspect, insert, literal, select
+from sqlalchemy.engine import Dialect, Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.sql.expression import FunctionElement
 
+from app.core import metrics, query_stats
 from app.core.config import get_settings
 
 settings = get_settings()
 
 
-def _get_engine_url_and_connect_args():
-    """Chuẩn hóa DATABASE_URL và trích connect_args (SSL cho MySQL Aiven)."""
-    url = settings.DATABASE_URL
+def _get_engine_url_and_connect_args(url: str):
+    """Chuẩn hóa DSN (DATABASE_URL hoặc replica) và trích connect_args (SSL cho MySQL Aiven)."""
     connect_args = {}
 
     # Sửa lỗi URL dạng mysql+aiomysql://mysql://... -> mysql+aiomysql://...
@@ -49,27 +61,197 @@ def _get_engine_url_and_connect_args():
     return clean_url, connect_args
 
 
-_engine_url, _connect_args = _get_engine_url_and_connect_args()
-_engine_kw = {"echo": True, "future": True}
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Pool mặc định của engine async, có đo thời gian chờ lấy kết nối."""
 
-# MySQL cần pool_pre_ping và pool_recycle
-if "mysql" in _engine_url:
-    _engine_kw["pool_pre_ping"] = True
-    _engine_kw["pool_recycle"] = 3600
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.db_pool_wait_seconds.observe(time.perf_counter() - start)
+
+
+def install_sqlite_pragmas(sync_engine: Engine):
+    """Chạy PRAGMA (WAL, synchronous, busy_timeout, cache_size, mmap_size) mỗi khi pool mở kết nối SQLite mới."""
+    pragmas = (
+        f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}",
+        f"PRAGMA cache_size={-int(settings.SQLITE_CACHE_SIZE_KB)}",
+        f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}",
+    )
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def _create_engine(url: str) -> AsyncEngine:
+    """Tạo engine async cho một DSN: chuẩn hóa URL/SSL, pool, PRAGMA SQLite, đo thời gian SQL."""
+    engine_url, connect_args = _get_engine_url_and_connect_args(url)
+    engine_kw = {"echo": settings.SQL_ECHO, "future": True}
+
+    # SQLite in-memory dùng StaticPool (1 kết nối), không thay pool
+    if ":memory:" not in engine_url:
+        engine_kw["poolclass"] = TimedQueuePool
+        engine_kw["pool_size"] = settings.DB_POOL_SIZE
+        engine_kw["max_overflow"] = settings.DB_MAX_OVERFLOW
+        engine_kw["pool_timeout"] = settings.DB_POOL_TIMEOUT
+        engine_kw["pool_recycle"] = settings.DB_POOL_RECYCLE
+
+    # MySQL cần pool_pre_ping (server tự đóng kết nối rảnh)
+    if "mysql" in engine_url:
+        engine_kw["pool_pre_ping"] = True
+
+    # Thêm SSL connect_args nếu có
+    if connect_args:
+        engine_kw["connect_args"] = connect_args
+
+    new_engine = create_async_engine(engine_url, **engine_kw)
+    query_stats.install(new_engine.sync_engine)
+    if engine_url.startswith("sqlite"):
+        install_sqlite_pragmas(new_engine.sync_engine)
+    return new_engine
+
+
+engine = _create_engine(settings.DATABASE_URL)
+
+metrics.GaugeFunc("db_pool_checked_out", "Số kết nối pool đang được dùng", lambda: engine.pool.checkedout())
+metrics.GaugeFunc("db_pool_overflow", "Số kết nối overflow đang mở", lambda: max(engine.pool.overflow(), 0))
+metrics.GaugeFunc("db_pool_size", "Kích thước pool", lambda: engine.pool.size())
+
+
+class ReplicaSet:
+    """Các replica đọc: chọn round-robin, replica lỗi kết nối bị bỏ qua trong DB_REPLICA_RETRY_SECONDS."""
+
+    def __init__(self, engines: list[AsyncEngine], retry_seconds: float):
+        self.engines = engines
+        self.retry_seconds = retry_seconds
+        self._down_until = [0.0] * len(engines)
+        self._next = 0
+        for index, replica in enumerate(engines):
+            self._watch(index, replica)
+
+    def _watch(self, index: int, replica: AsyncEngine):
+        @event.listens_for(replica.sync_engine, "handle_error")
+        def _mark_down(context):
+            # Không kết nối được hoặc mất kết nối: tạm loại replica, lỗi SQL thường thì không
+            if context.is_disconnect or context.connection is None:
+                self._down_until[index] = time.monotonic() + self.retry_seconds
+                print(f"[DB] Replica {index} lỗi kết nối, chuyển đọc sang replica khác/primary: {context.original_exception}")
+
+    def pick(self) -> Optional[AsyncEngine]:
+        """Replica khỏe kế tiếp, None nếu không còn replica nào khỏe."""
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            index = self._next
+            self._next = (index + 1) % len(self.engines)
+            if self._down_until[index] <= now:
+                return self.engines[index]
+        return None
+
+    async def dispose(self):
+        for replica in self.engines:
+            await replica.dispose()
+
+
+_replica_urls = [url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+replicas = ReplicaSet([_create_engine(url) for url in _replica_urls], settings.DB_REPLICA_RETRY_SECONDS) if _replica_urls else None
+
+# Khóa trong session.info: session đã ghi hoặc được yêu cầu đọc từ primary
+_USE_PRIMARY = "use_primary"
+
+
+class RoutingSession(Session):
+    """Session định tuyến theo câu lệnh.
+
+    SELECT (không FOR UPDATE) đi round-robin sang replica khỏe. Ghi (flush, INSERT/UPDATE/DELETE,
+    text SQL) đi primary và ghim session vào primary: mọi lần đọc sau đó trong session (cùng request)
+    cũng đọc primary, không bị trễ replica. Không cấu hình replica thì luôn dùng primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        is_read = not self._flushing and isinstance(clause, Select) and clause._for_update_arg is None
+        if not is_read:
+            # Đánh dấu cả khi không có replica: can_share_reads dựa vào cờ này
+            self.info[_USE_PRIMARY] = True
+        if replicas is None:
+            return engine.sync_engine
+        if is_read and not self.info.get(_USE_PRIMARY):
+            replica = replicas.pick()
+            if replica is not None:
+                metrics.db_route_total.inc("replica")
+                return replica.sync_engine
+        metrics.db_route_total.inc("primary")
+        return engine.sync_engine
+
+
+def use_primary(session: AsyncSession):
+    """Bắt session đọc từ primary từ giờ (route không chấp nhận dữ liệu trễ của replica)."""
+    session.info[_USE_PRIMARY] = True
+
+
+def can_share_reads(session: AsyncSession) -> bool:
+    """Session nhận được kết quả đọc dùng chung với session khác (singleflight).
+
+    Chỉ session định tuyến chưa ghi, không ghim primary và không có thay đổi chờ flush. Session đã ghi
+    (transaction ghi) hoặc session chỉ dùng primary (get_primary_db, job nền) luôn tự truy vấn.
+    """
+    sync_session = session.sync_session
+    return (
+        isinstance(sync_session, RoutingSession)
+        and not sync_session.info.get(_USE_PRIMARY)
+        and not (sync_session.new or sync_session.dirty or sync_session.deleted)
+    )
+
+
+_session_kw = {"class_": AsyncSession, "expire_on_commit": False, "autocommit": False, "autoflush": False}
+
+# Session cho request: đọc từ replica khi có thể
+AsyncSessionLocal = async_sessionmaker(engine, sync_session_class=RoutingSession, **_session_kw)
+
+# Session luôn dùng primary: job nền, state store, route cần đọc ngay dữ liệu vừa ghi
+PrimarySessionLocal = async_sessionmaker(engine, **_session_kw)
+
+
+class db_utcnow(FunctionElement):
+    """Giờ UTC theo đồng hồ của database, cộng offset giây (dùng trong câu SQL, vd. hạn lease).
+
+    Cùng kiểu lưu với datetime.utcnow() (DateTime naive UTC). Các node so sánh thời hạn theo một đồng
+    hồ chung nên lệch giờ giữa các node không làm lease còn hạn bị coi là hết hạn.
+    """
+
+    type = DateTime()
+    name = "db_utcnow"
+    inherit_cache = True
 
-# Thêm SSL connect_args nếu có
-if _connect_args:
-    _engine_kw["connect_args"] = _connect_args
+    def __init__(self, offset_seconds: float = 0.0):
+        # Offset theo micro giây (số nguyên) để MySQL INTERVAL không làm tròn phần lẻ
+        super().__init__(literal(int(round(offset_seconds * 1_000_000))))
 
-engine = create_async_engine(_engine_url, **_engine_kw)
 
-AsyncSessionLocal = async_sessionmaker(
-    engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autocommit=False,
-    autoflush=False,
-)
+@compiles(db_utcnow, "sqlite")
+def _db_utcnow_sqlite(element, compiler, **kw):
+    # Cùng định dạng chuỗi SQLAlchemy lưu DateTime trên SQLite (so sánh chuỗi đúng thứ tự thời gian)
+    offset = compiler.process(element.clauses, **kw)
+    return f"strftime('%Y-%m-%d %H:%M:%f000', 'now', printf('%+.6f seconds', ({offset}) / 1000000.0))"
+
+
+@compiles(db_utcnow, "mysql")
+def _db_utcnow_mysql(element, compiler, **kw):
+    # UTC_TIMESTAMP: NOW() theo time zone của session, không phải UTC
+    return f"DATE_ADD(UTC_TIMESTAMP(6), INTERVAL {compiler.process(element.clauses, **kw)} MICROSECOND)"
+
+
+@compiles(db_utcnow)
+def _db_utcnow_default(element, compiler, **kw):
+    return f"(CURRENT_TIMESTAMP AT TIME ZONE 'UTC') + ({compiler.process(element.clauses, **kw)}) * INTERVAL '1 microsecond'"
 
 
 class Base(DeclarativeBase):
@@ -77,6 +259,20 @@ class Base(DeclarativeBase):
     pass
 
 
+def schema_fingerprint(metadata: MetaData, dialect: Dialect) -> str:
+    """SHA256 của DDL (CREATE TABLE/INDEX) toàn bộ bảng theo dialect: model đổi thì fingerprint đổi."""
+    parts = []
+    for table in metadata.sorted_tables:
+        parts.append(str(CreateTable(table).compile(dialect=dialect)).strip())
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            parts.append(str(CreateIndex(index).compile(dialect=dialect)).strip())
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+# Tên dòng trong schema_meta cho schema của app
+_SCHEMA_NAME = "app"
+
+
 class Database:
     """Database connection manager."""
 
@@ -84,13 +280,65 @@ class Database:
         self.engine = engine
         self.session_factory = AsyncSessionLocal
 
-    async def connect(self):
-        """Connect to database (create tables)."""
+    @staticmethod
+    def _stored_fingerprint(conn: Connection) -> Optional[str]:
+        from app.models.schema_meta import SchemaMeta
+
+        if not inspect(conn).has_table(SchemaMeta.__tablename__):
+            return None
+        return conn.execute(
+            select(SchemaMeta.fingerprint).where(SchemaMeta.name == _SCHEMA_NAME)
+        ).scalar_one_or_none()
+
+    @staticmethod
+    def _save_fingerprint(conn: Connection, fingerprint: str):
+        from app.models.schema_meta import SchemaMeta
+
+        conn.execute(delete(SchemaMeta).where(SchemaMeta.name == _SCHEMA_NAME))
+        conn.execute(
+            insert(SchemaMeta).values(name=_SCHEMA_NAME, fingerprint=fingerprint, applied_at=datetime.utcnow())
+        )
+
+    async def connect(self) -> bool:
+        """Connect to database (create tables). Trả về True nếu đã chạy DDL.
+
+        Fingerprint schema trùng bản lưu trong schema_meta thì bỏ qua create_all (khởi động chỉ tốn
+        một truy vấn). create_all chỉ tạo bảng còn thiếu (kèm index của bảng đó): không ALTER và không thêm
+        index vào bảng đã có.
+        """
+        if not settings.DB_SCHEMA_FINGERPRINT:
+            async with self.engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            return True
+
+        fingerprint = schema_fingerprint(Base.metadata, self.engine.dialect)
+        async with self.engine.connect() as conn:
+            if await conn.run_sync(self._stored_fingerprint) == fingerprint:
+                return False
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with self.engine.begin() as conn:
+                await conn.run_sync(self._save_fingerprint, fingerprint)
+        except IntegrityError:
+            # Worker khác khởi động cùng lúc đã ghi cùng fingerprint
+            pass
+        return True
+
+    async def prewarm(self, count: int) -> int:
+        """Mở sẵn tối đa count kết nối (không quá pool_size) rồi trả về pool. Trả về số kết nối đã mở."""
+        if count <= 0 or not isinstance(self.engine.pool, AsyncAdaptedQueuePool):
+            return 0
+        count = min(count, self.engine.pool.size())
+        conns = await asyncio.gather(*(self.engine.connect() for _ in range(count)))
+        for conn in conns:
+            await conn.close()
+        return count
 
     async def disconnect(self):
         """Disconnect from database."""
+        if replicas is not None:
+            await replicas.dispose()
         await self.engine.dispose()
 
 
@@ -108,3 +356,16 @@ async def get_db() -> AsyncSession:
             raise
         finally:
             await session.close()
+
+
+async def get_primary_db() -> AsyncSession:
+    """Dependency: database session chỉ dùng primary (đọc không chấp nhận trễ replica)."""
+    async with PrimarySessionLocal() as session:
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
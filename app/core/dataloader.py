@@ -0,0 +1,62 @@
+"""DataLoader: gộp các lần load(key) trong cùng một vòng event loop thành một lần gọi batch.
+
+Dùng theo request (tạo mới mỗi request, xem api.dependencies.get_user_loader): key trùng chỉ load một
+lần và kết quả được nhớ trong vòng đời loader. Key không có trong kết quả batch → None.
+"""
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, Iterable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# Nhận list key (không trùng), trả về {key: value} cho các key tìm thấy
+BatchFunc = Callable[[list[K]], Awaitable[dict[K, V]]]
+
+
+class DataLoader(Generic[K, V]):
+    """Gộp load() theo vòng event loop, bỏ key trùng, nhớ kết quả theo key."""
+
+    def __init__(self, batch_fn: BatchFunc):
+        self.batch_fn = batch_fn
+        self.batches = 0  # Số lần đã gọi batch_fn
+        self._futures: dict[K, asyncio.Future] = {}
+        self._queue: list[K] = []
+        self._tasks: set[asyncio.Task] = set()
+
+    def load(self, key: K) -> "asyncio.Future[Optional[V]]":
+        """Future của value theo key; batch chạy ở cuối vòng event loop hiện tại."""
+        future = self._futures.get(key)
+        if future is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = self._futures[key] = loop.create_future()
+        if not self._queue:
+            loop.call_soon(self._dispatch)
+        self._queue.append(key)
+        return future
+
+    async def load_many(self, keys: Iterable[K]) -> list[Optional[V]]:
+        """Value theo đúng thứ tự keys (None nếu không tìm thấy), một batch cho các key chưa load."""
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def _dispatch(self):
+        keys, self._queue = self._queue, []
+        task = asyncio.create_task(self._run(keys))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, keys: list[K]):
+        self.batches += 1
+        try:
+            results = await self.batch_fn(keys)
+        except Exception as e:
+            for key in keys:
+                # Lỗi không được nhớ: lần load sau thử lại
+                future = self._futures.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key in keys:
+            future = self._futures[key]
+            if not future.done():
+                future.set_result(results.get(key))
@@ -0,0 +1,47 @@
+"""HTTP conditional GET: ETag yếu, Last-Modified, Cache-Control; If-None-Match/If-Modified-Since → 304."""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+def resource_etag(id: int, updated_at: Optional[datetime]) -> str:
+    """ETag yếu từ id + updated_at (micro giây): bản ghi đổi thì updated_at đổi (onupdate)."""
+    version = int(updated_at.replace(tzinfo=timezone.utc).timestamp() * 1_000_000) if updated_at else 0
+    return f'W/"{id}-{version:x}"'
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime], cache_control: str) -> dict[str, str]:
+    """Header ETag, Last-Modified (updated_at lưu theo UTC) và Cache-Control cho response."""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """So khớp yếu (RFC 9110): bỏ tiền tố W/ hai phía; "*" khớp mọi ETag."""
+    if if_none_match.strip() == "*":
+        return True
+    target = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == target for tag in if_none_match.split(","))
+
+
+def is_not_modified(request: Request, headers: dict[str, str]) -> bool:
+    """Client đã có bản mới nhất (trả 304). Có If-None-Match thì bỏ qua If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, headers["ETag"])
+    if_modified_since = request.headers.get("if-modified-since")
+    last_modified = headers.get("Last-Modified")
+    if not if_modified_since or last_modified is None:
+        return False
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
@@ -0,0 +1,284 @@
+"""Metrics in-process xuất theo định dạng text của Prometheus (không cần prometheus_client).
+
+Counter/Histogram chỉ cộng số trong dict, không lock: mọi chỗ ghi chạy trên event loop.
+"""
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Iterable, Sequence
+
+# Bucket mặc định (giây): đủ cho request nhanh (ms) tới bcrypt/SMTP (giây)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Danh sách metric, render ra text format 0.0.4."""
+
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class Counter:
+    """Bộ đếm tăng dần, có thể có label."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        registry.register(self)
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labelvalues, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class _HistogramChild:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Histogram theo bucket cố định; observe là O(log số bucket)."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._children: dict[tuple, _HistogramChild] = {}
+        registry.register(self)
+
+    def observe(self, value: float, *labelvalues: str):
+        child = self._children.get(labelvalues)
+        if child is None:
+            child = self._children[labelvalues] = _HistogramChild(len(self.buckets) + 1)
+        child.counts[bisect_left(self.buckets, value)] += 1
+        child.sum += value
+        child.count += 1
+
+    def time(self, *labelvalues: str) -> "_Timer":
+        """Context manager đo thời gian block: `with histogram.time("label"): ...`."""
+        return _Timer(self, labelvalues)
+
+    def samples(self) -> Iterable[str]:
+        bounds = self.buckets + (float("inf"),)
+        for labelvalues, child in self._children.items():
+            cumulative = 0
+            for bound, n in zip(bounds, child.counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram: Histogram, labelvalues: tuple):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+
+class GaugeFunc:
+    """Gauge đọc giá trị lúc scrape (vd. số kết nối pool đang dùng).
+
+    Có labelnames thì fn trả về dict {tuple giá trị label: giá trị}.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Any], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    def samples(self) -> Iterable[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return
+        if value is None:
+            return
+        if not self.labelnames:
+            yield f"{self.name} {_format_value(value)}"
+            return
+        for labelvalues, labeled in value.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(labeled)}"
+
+
+class CounterFunc(GaugeFunc):
+    """Như GaugeFunc nhưng là counter (giá trị tăng dần do nơi khác đếm, vd. hits của cache)."""
+
+    type = "counter"
+
+
+# HTTP (MetricsMiddleware)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "Thời gian xử lý request theo route", ("method", "route")
+)
+http_requests_total = Counter(
+    "http_requests_total", "Số request theo route và status", ("method", "route", "status")
+)
+
+# Database pool
+db_pool_wait_seconds = Histogram(
+    "db_pool_wait_seconds", "Thời gian chờ lấy kết nối từ pool SQLAlchemy",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+db_route_total = Counter(
+    "db_route_total", "Số lần session chọn engine (primary/replica)", ("target",)
+)
+
+# Password hashing: thời gian bcrypt chạy trong worker và thời gian chờ worker rảnh tách riêng
+password_hash_seconds = Histogram(
+    "password_hash_seconds", "Thời gian hash/verify mật khẩu trong worker (không tính chờ)", ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0),
+)
+password_hash_queue_seconds = Histogram(
+    "password_hash_queue_seconds", "Thời gian chờ worker rảnh trong pool hash", ("operation",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0),
+)
+# Rehash mật khẩu sau login: ok, stale (mật khẩu đã đổi ở request khác), skipped (pool bận), error
+password_rehash_total = Counter("password_rehash_total", "Số lần hash lại mật khẩu theo cost mới", ("result",))
+
+# OTP
+otp_created_total = Counter("otp_created_total", "Số OTP đã tạo", ("type",))
+otp_verified_total = Counter(
+    "otp_verified_total", "Số lần verify OTP theo kết quả (success/invalid/expired)", ("type", "result")
+)
+otp_expired_total = Counter("otp_expired_total", "Số OTP hết hạn đã bị dọn")
+cleanup_duration_seconds = Histogram(
+    "otp_cleanup_duration_seconds", "Thời gian mỗi lượt dọn OTP/user chưa kích hoạt"
+)
+cleanup_users_deleted_total = Counter(
+    "otp_cleanup_users_deleted_total", "Số user chưa kích hoạt đã bị dọn"
+)
+
+# Scheduler (job nền có lease)
+scheduler_job_run_seconds = Histogram("scheduler_job_run_seconds", "Thời gian mỗi lần chạy job", ("job",))
+scheduler_job_runs_total = Counter("scheduler_job_runs_total", "Số lần chạy job theo kết quả (ok/error)", ("job", "result"))
+scheduler_job_skipped_total = Counter(
+    "scheduler_job_skipped_total", "Số lần bỏ qua vì process khác đang giữ lease", ("job",)
+)
+scheduler_job_items_total = Counter("scheduler_job_items_total", "Số bản ghi job đã xử lý", ("job",))
+
+# Singleflight đọc repository: result = query (tự chạy), shared (dùng chung), bypass (session không dùng chung được)
+repository_reads_total = Counter(
+    "repository_reads_total", "Số lần đọc qua singleflight của repository", ("operation", "result")
+)
+
+# Rate limit
+rate_limited_total = Counter(
+    "rate_limited_total", "Số request bị từ chối 429 theo route và loại giới hạn (route/ip/account)", ("route", "scope")
+)
+
+# Admission control
+admission_wait_seconds = Histogram(
+    "admission_wait_seconds", "Thời gian request chờ slot trong pool admission", ("pool",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+admission_shed_total = Counter("admission_shed_total", "Số request bị từ chối 503 do quá tải", ("pool",))
+
+# Email
+email_send_seconds = Histogram("email_send_seconds", "Thời gian gửi một email", ("type",))
+email_send_failures_total = Counter("email_send_failures_total", "Số lần gửi email lỗi", ("type",))
+email_dead_letter_total = Counter("email_dead_letter_total", "Số email chuyển sang dead-letter")
+email_expired_total = Counter("email_expired_total", "Số email OTP không gửi vì mã đã hết hạn")
+
+
+def _route_template(scope) -> str:
+    """Path template của route đã match. Route chưa match (404) gộp chung một label để không bùng nổ số series."""
+    # FastAPI mới giữ router lồng nhau: route.path chỉ là path tương đối, path đầy đủ nằm ở route context
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    path = getattr(context, "path", None) or getattr(scope.get("route"), "path", None)
+    return path or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware ghi latency và status theo route template (vd. /api/v1/users/{user_id})."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            route = _route_template(scope)
+            method = scope["method"]
+            http_request_duration_seconds.observe(duration, method, route)
+            http_requests_total.inc(method, route, str(status))
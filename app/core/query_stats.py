@@ -0,0 +1,129 @@
+"""Đo thời gian SQL: slow-query log, log mẫu theo tỉ lệ và thống kê theo fingerprint câu lệnh."""
+import json
+import math
+import random
+import re
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+_PARAM = r"(?:\?|%s|:\w+)"
+_ROW = rf"\(\s*{_PARAM}(?:\s*,\s*{_PARAM})*\s*\)"
+# IN (?, ?), IN ((?, ?), (?, ?)) (tuple IN của MySQL) và IN (VALUES (?, ?), ...) (tuple IN của SQLite)
+_IN_LIST = re.compile(rf"\bIN \(\s*(?:VALUES )?(?:{_PARAM}|{_ROW})(?:\s*,\s*(?:{_PARAM}|{_ROW}))*\s*\)", re.IGNORECASE)
+# INSERT nhiều dòng: VALUES (?, ?), (?, ?), ...
+_VALUES_ROWS = re.compile(rf"\bVALUES ({_ROW})(?:\s*,\s*{_ROW})+", re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    """Chuẩn hóa câu lệnh để gom nhóm: bỏ khoảng trắng thừa, literal → ?, IN (?, ?, ...) → IN (...),
+    VALUES nhiều dòng → VALUES (?, ?), ... (số phần tử/số dòng khác nhau vẫn cùng một nhóm)."""
+    text = _SPACES.sub(" ", statement).strip()
+    text = _STRING.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _IN_LIST.sub("IN (...)", text)
+    return _VALUES_ROWS.sub(r"VALUES \1, ...", text)
+
+
+class _FingerprintStats:
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self, sample_size: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: deque[float] = deque(maxlen=sample_size)
+
+
+class QueryStats:
+    """Thống kê theo fingerprint: count, tổng thời gian, max, p95 (trên các lần chạy gần nhất)."""
+
+    def __init__(self, max_fingerprints: int = 500, sample_size: int = 256):
+        self.max_fingerprints = max_fingerprints
+        self.sample_size = sample_size
+        self._stats: dict[str, _FingerprintStats] = {}
+
+    def record(self, statement_fingerprint: str, duration: float):
+        stats = self._stats.get(statement_fingerprint)
+        if stats is None:
+            if len(self._stats) >= self.max_fingerprints:
+                return
+            stats = self._stats[statement_fingerprint] = _FingerprintStats(self.sample_size)
+        stats.count += 1
+        stats.total += duration
+        if duration > stats.max:
+            stats.max = duration
+        stats.samples.append(duration)
+
+    def snapshot(self, limit: Optional[int] = None) -> list[dict]:
+        """Danh sách thống kê (ms), sắp theo tổng thời gian giảm dần."""
+        rows = []
+        for statement, stats in self._stats.items():
+            samples = sorted(stats.samples)
+            # Nearest-rank: phần tử thứ ceil(0.95 * n)
+            p95 = samples[math.ceil(len(samples) * 0.95) - 1] if samples else 0.0
+            rows.append({
+                "statement": statement,
+                "count": stats.count,
+                "total_ms": round(stats.total * 1000, 3),
+                "mean_ms": round(stats.total / stats.count * 1000, 3),
+                "p95_ms": round(p95 * 1000, 3),
+                "max_ms": round(stats.max * 1000, 3),
+            })
+        rows.sort(key=lambda row: row["total_ms"], reverse=True)
+        return rows[:limit] if limit else rows
+
+    def reset(self):
+        self._stats.clear()
+
+
+query_stats = QueryStats(settings.SQL_STATS_MAX_FINGERPRINTS)
+
+
+def _log(kind: str, statement: str, duration: float, parameters=None):
+    record = {
+        "event": kind,
+        "duration_ms": round(duration * 1000, 3),
+        "statement": fingerprint(statement),
+    }
+    if parameters is not None and settings.SQL_LOG_PARAMETERS:
+        record["parameters"] = repr(parameters)[:500]
+    print(f"[SQL] {json.dumps(record, ensure_ascii=False)}")
+
+
+def install(engine: Engine):
+    """Gắn event hook đo thời gian vào engine (sync engine của AsyncEngine)."""
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS / 1000
+    sample_rate = settings.SQL_SAMPLE_RATE
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_start"].pop()
+        query_stats.record(fingerprint(statement), duration)
+        if duration >= threshold:
+            _log("slow_query", statement, duration, parameters)
+        elif sample_rate and random.random() < sample_rate:
+            _log("sampled_query", statement, duration, parameters)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        # Câu lệnh lỗi không qua after_cursor_execute: bỏ mốc thời gian để stack không lệch
+        starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+        if starts:
+            starts.pop()
@@ -0,0 +1,150 @@
+"""Rate limit cho endpoint auth: sliding window theo IP, theo tài khoản và theo route.
+
+Thuật toán sliding window counter: đếm theo cửa sổ cố định, ước lượng số request trong `window` giây
+gần nhất = count cửa sổ trước * phần còn chồng lên + count cửa sổ hiện tại. Mỗi lần kiểm tra O(1).
+Backend "memory": dict LRU giới hạn RATE_LIMIT_MAX_KEYS (chỉ trong một process).
+Backend "shared": dùng state store (redis/sql) để các worker/node chia sẻ bộ đếm.
+"""
+import hashlib
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import Request
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.core.state_store import state_store
+
+settings = get_settings()
+
+
+class RateLimitExceeded(Exception):
+    """Vượt giới hạn request; retry_after là số giây nên chờ."""
+
+    def __init__(self, retry_after: int, detail: str = "Quá nhiều yêu cầu, vui lòng thử lại sau"):
+        super().__init__(detail)
+        self.retry_after = retry_after
+
+
+def parse_rule(rule: str) -> tuple[int, float]:
+    """'20/60' → (20 request, 60 giây). Rỗng hoặc '0/...' = không giới hạn."""
+    if not rule:
+        return 0, 0.0
+    limit, window = rule.split("/", 1)
+    return int(limit), float(window)
+
+
+class RateLimitBackend(ABC):
+    """Lưu bộ đếm theo cửa sổ."""
+
+    @abstractmethod
+    async def hit(self, key: str, window: float) -> tuple[int, int, float]:
+        """Ghi một request. Trả về (count cửa sổ trước, count cửa sổ hiện tại, số giây đã qua của cửa sổ hiện tại)."""
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Bộ đếm trong process, LRU: vượt max_keys thì bỏ key ít dùng nhất."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._data: OrderedDict[str, list] = OrderedDict()
+
+    async def hit(self, key: str, window: float) -> tuple[int, int, float]:
+        now = time.time()
+        index = int(now // window)
+        entry = self._data.get(key)
+        if entry is None:
+            # [cửa sổ hiện tại, count hiện tại, count cửa sổ trước]
+            entry = self._data[key] = [index, 0, 0]
+            if len(self._data) > self.max_keys:
+                self._data.popitem(last=False)
+        elif entry[0] != index:
+            entry[2] = entry[1] if entry[0] == index - 1 else 0
+            entry[0], entry[1] = index, 0
+        self._data.move_to_end(key)
+        entry[1] += 1
+        return entry[2], entry[1], now - index * window
+
+
+class SharedRateLimitBackend(RateLimitBackend):
+    """Bộ đếm trên state store: key theo cửa sổ, hết hạn sau 2 cửa sổ."""
+
+    async def hit(self, key: str, window: float) -> tuple[int, int, float]:
+        now = time.time()
+        index = int(now // window)
+        current = await state_store.incr(f"rl:{key}:{index}", ttl=window * 2)
+        previous = int(await state_store.get(f"rl:{key}:{index - 1}") or 0)
+        return previous, current, now - index * window
+
+
+class RateLimiter:
+    """Kiểm tra giới hạn theo route, IP và tài khoản; vượt thì raise RateLimitExceeded (trả 429)."""
+
+    def __init__(self, backend: RateLimitBackend):
+        self.backend = backend
+        self.route_rule = parse_rule(settings.RATE_LIMIT_ROUTE)
+        self.ip_rule = parse_rule(settings.RATE_LIMIT_IP)
+        self.account_rule = parse_rule(settings.RATE_LIMIT_ACCOUNT)
+
+    async def check(self, key: str, limit: int, window: float) -> Optional[int]:
+        """Ghi một request vào key. Trả về Retry-After (giây) nếu vượt limit, None nếu còn trong giới hạn."""
+        previous, current, elapsed = await self.backend.hit(key, window)
+        weight = 1 - elapsed / window
+        estimated = previous * weight + current
+        if estimated <= limit:
+            return None
+        # Thời gian tới khi phần cửa sổ trước trượt ra đủ để số ước lượng về dưới limit
+        if previous and current <= limit:
+            wait = (estimated - limit) / previous * window
+        else:
+            wait = window - elapsed
+        return max(1, math.ceil(wait))
+
+    @staticmethod
+    def client_ip(request: Request) -> str:
+        if settings.RATE_LIMIT_TRUST_FORWARDED:
+            forwarded = request.headers.get("x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",", 1)[0].strip()
+        return request.client.host if request.client else "unknown"
+
+    @staticmethod
+    def _account_key(account: str) -> str:
+        # Băm để key ngắn, cố định độ dài và không lưu email thô
+        return hashlib.blake2b(account.strip().lower().encode(), digest_size=16).hexdigest()
+
+    async def enforce(self, request: Request, route: str, account: Optional[str] = None):
+        """Áp các giới hạn của route. Gọi đầu endpoint, trước khi hash mật khẩu/gửi email.
+
+        Thứ tự IP → tài khoản → route: request bị chặn theo IP/tài khoản không tính vào bộ đếm chung
+        của route, nên một client spam không làm cạn ngân sách của mọi người.
+        """
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        checks = [("ip", f"ip:{route}:{self.client_ip(request)}", self.ip_rule)]
+        if account:
+            checks.append(("account", f"acct:{route}:{self._account_key(account)}", self.account_rule))
+        checks.append(("route", f"route:{route}", self.route_rule))
+        for scope, key, (limit, window) in checks:
+            if limit <= 0:
+                continue
+            retry_after = await self.check(key, limit, window)
+            if retry_after is not None:
+                metrics.rate_limited_total.inc(route, scope)
+                raise RateLimitExceeded(retry_after)
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Tạo rate limiter theo RATE_LIMIT_BACKEND ("memory" hoặc "shared")."""
+    backend = settings.RATE_LIMIT_BACKEND.lower()
+    if backend == "memory":
+        return RateLimiter(MemoryRateLimitBackend(settings.RATE_LIMIT_MAX_KEYS))
+    if backend == "shared":
+        return RateLimiter(SharedRateLimitBackend())
+    raise ValueError(f"RATE_LIMIT_BACKEND không hỗ trợ: {settings.RATE_LIMIT_BACKEND}")
+
+
+rate_limiter = create_rate_limiter()
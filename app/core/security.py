@@ -1,11 +1,21 @@
 """Security: JWT, password hashing (bcrypt 4.3.0)."""
+import asyncio
+import base64
 import hashlib
+import hmac
+import json
+import math
+import time
+from calendar import timegm
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 
 import bcrypt
-from jose import jwt
+from jose.exceptions import ExpiredSignatureError, JWTClaimsError, JWTError
 
+from app.core import metrics
+from app.core.cache import TTLCache
 from app.core.config import get_settings
 
 settings = get_settings()
@@ -20,6 +30,111 @@ def _password_to_bcrypt_input(password: str) -> bytes:
     return digest.encode("utf-8")
 
 
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+class JWTCodec:
+    """Encode/decode JWT HS256 (tương thích python-jose).
+
+    Giữ sẵn HMAC key đã chuẩn bị và header đã encode; token đã verify được cache (LRU, key = SHA256
+    của token) nên client gửi lại cùng bearer token chỉ tốn một lần hash + tra dict. Entry cache
+    vẫn kiểm tra `exp` mỗi lần dùng.
+    """
+
+    def __init__(self, secret_key: str, cache_size: int = 10000, cache_ttl: float = 300.0):
+        self._mac = hmac.new(secret_key.encode("utf-8"), digestmod=hashlib.sha256)
+        self._header = _b64encode(
+            json.dumps({"alg": ALGORITHM, "typ": "JWT"}, separators=(",", ":")).encode("utf-8")
+        )
+        self.cache = TTLCache(cache_size, cache_ttl)
+
+    def _sign(self, signing_input: bytes) -> bytes:
+        mac = self._mac.copy()
+        mac.update(signing_input)
+        return mac.digest()
+
+    def encode(self, claims: dict) -> str:
+        """Tạo token; datetime trong exp/iat/nbf được đổi sang timestamp như jose."""
+        payload = dict(claims)
+        for key in ("exp", "iat", "nbf"):
+            if isinstance(payload.get(key), datetime):
+                payload[key] = timegm(payload[key].utctimetuple())
+        body = _b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+        signing_input = self._header + b"." + body
+        return (signing_input + b"." + _b64encode(self._sign(signing_input))).decode("ascii")
+
+    def decode(self, token: str) -> dict:
+        """Verify chữ ký + exp/nbf, trả về payload. Lỗi: JWTError (ExpiredSignatureError nếu hết hạn)."""
+        raw = token.encode("utf-8")
+        digest = hashlib.sha256(raw).digest()
+        now = time.time()
+        cached = self.cache.get(digest)
+        if cached is not None:
+            exp = cached.get("exp")
+            if exp is not None and now >= exp:
+                self.cache.invalidate(digest)
+                raise ExpiredSignatureError("Signature has expired.")
+            return cached
+
+        try:
+            header_b64, body_b64, sig_b64 = raw.split(b".")
+            if header_b64 != self._header and json.loads(_b64decode(header_b64)).get("alg") != ALGORITHM:
+                raise JWTError("The specified alg value is not allowed")
+            signature = _b64decode(sig_b64)
+            payload = json.loads(_b64decode(body_b64))
+        except JWTError:
+            raise
+        except Exception:
+            raise JWTError("Invalid token")
+        if not hmac.compare_digest(signature, self._sign(header_b64 + b"." + body_b64)):
+            raise JWTError("Signature verification failed.")
+        if not isinstance(payload, dict):
+            raise JWTError("Invalid payload")
+
+        exp = payload.get("exp")
+        if exp is not None:
+            if not isinstance(exp, (int, float)):
+                raise JWTClaimsError("Expiration Time claim (exp) must be an integer.")
+            if now >= exp:
+                raise ExpiredSignatureError("Signature has expired.")
+        nbf = payload.get("nbf")
+        if nbf is not None and (not isinstance(nbf, (int, float)) or now < nbf):
+            raise JWTClaimsError("The token is not yet valid (nbf)")
+
+        self.cache.set(digest, payload)
+        return payload
+
+
+token_codec = JWTCodec(
+    settings.SECRET_KEY,
+    cache_size=settings.JWT_VERIFY_CACHE_SIZE,
+    cache_ttl=settings.JWT_VERIFY_CACHE_TTL_SECONDS,
+)
+
+
+def encode_page_cursor(last_id: int) -> str:
+    """Cursor phân trang keyset (opaque, có chữ ký HMAC) chứa ID cuối của trang trước."""
+    body = _b64encode(str(last_id).encode("ascii"))
+    return (body + b"." + _b64encode(token_codec._sign(b"cursor." + body)[:16])).decode("ascii")
+
+
+def decode_page_cursor(cursor: str) -> int:
+    """Giải cursor phân trang; ValueError nếu cursor sai hoặc bị sửa."""
+    try:
+        body, sig = cursor.encode("ascii").split(b".")
+        expected = token_codec._sign(b"cursor." + body)[:16]
+        if not hmac.compare_digest(_b64decode(sig), expected):
+            raise ValueError
+        return int(_b64decode(body))
+    except Exception:
+        raise ValueError("Cursor không hợp lệ")
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Tạo JWT access token."""
     to_encode = data.copy()
@@ -28,7 +143,12 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
+    return token_codec.encode(to_encode)
+
+
+def decode_access_token(token: str) -> dict:
+    """Verify JWT access token, trả về payload (JWTError nếu không hợp lệ)."""
+    return token_codec.decode(token)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -40,9 +160,157 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 
-def get_password_hash(password: str) -> str:
-    """Hash mật khẩu: SHA256(full password) rồi bcrypt → lưu đầy đủ hashed_password (60 ký tự)."""
+def get_password_hash(password: str, rounds: Optional[int] = None) -> str:
+    """Hash mật khẩu: SHA256(full password) rồi bcrypt → lưu đầy đủ hashed_password (60 ký tự).
+
+    rounds: cost bcrypt, mặc định cost hiện tại của password_hasher (truyền rõ khi chạy trong process pool).
+    """
     pwd_bytes = _password_to_bcrypt_input(password)
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds or password_hasher.rounds)
     hashed = bcrypt.hashpw(pwd_bytes, salt)
     return hashed.decode("utf-8")
+
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    """Cost của hash bcrypt ("$2b$12$..." → 12), None nếu không đọc được."""
+    try:
+        return int(hashed_password.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Hash cần tạo lại theo cost hiện tại.
+
+    Cost tự chọn (PASSWORD_HASH_TARGET_MS) chỉ nâng, không hạ: các worker đo lệch nhau một bậc sẽ không
+    hash đi hash lại cùng một tài khoản. Muốn hạ cost thì đặt PASSWORD_HASH_ROUNDS.
+    """
+    current = hash_rounds(hashed_password)
+    if current is None:
+        return False
+    if settings.PASSWORD_HASH_TARGET_MS > 0:
+        return current < password_hasher.rounds
+    return current != password_hasher.rounds
+
+
+def measure_hash_ms(rounds: int, repeat: int = 3) -> float:
+    """Thời gian (ms) một lần bcrypt với cost rounds trên CPU hiện tại (lần nhanh nhất trong repeat lần)."""
+    pwd_bytes = _password_to_bcrypt_input("calibration")
+    best = math.inf
+    for _ in range(repeat):
+        salt = bcrypt.gensalt(rounds)
+        start = time.perf_counter()
+        bcrypt.hashpw(pwd_bytes, salt)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def calibrate_rounds(target_ms: float, min_rounds: int = 4, max_rounds: int = 20, base_rounds: int = 8) -> int:
+    """Cost lớn nhất có thời gian hash ước lượng ≤ target_ms (không dưới min_rounds).
+
+    Đo ở base_rounds (nhanh) rồi suy ra: thời gian bcrypt tăng gấp đôi mỗi +1 cost.
+    """
+    base_ms = measure_hash_ms(base_rounds)
+    rounds = base_rounds + math.floor(math.log2(target_ms / base_ms))
+    return max(min_rounds, 4, min(rounds, max_rounds, 31))
+
+
+# Hash cost thấp nhất, chỉ để nạp bcrypt trong worker lúc khởi động
+_WARM_UP_HASH = bcrypt.hashpw(b"warm-up", bcrypt.gensalt(4))
+
+
+def _warm_up_bcrypt() -> bool:
+    return bcrypt.checkpw(b"warm-up", _WARM_UP_HASH)
+
+
+def _timed_call(fn, *args):
+    """Chạy trong worker: trả về (kết quả, thời gian fn chạy), tách thời gian bcrypt khỏi thời gian chờ worker."""
+    start = time.perf_counter()
+    return fn(*args), time.perf_counter() - start
+
+
+class PasswordHashQueueFull(RuntimeError):
+    """Pool hash mật khẩu đã đầy (đang chạy + đang chờ vượt giới hạn)."""
+
+
+class PasswordHasher:
+    """Chạy bcrypt trong pool worker riêng (thread hoặc process) với hàng đợi giới hạn."""
+
+    def __init__(self, executor_kind: str, max_workers: int, max_queue: int):
+        self.executor_kind = executor_kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Optional[Executor] = None
+        self._inflight = 0
+        self.rounds = settings.PASSWORD_HASH_ROUNDS  # Cost bcrypt cho hash mới
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="bcrypt"
+                )
+        return self._executor
+
+    async def run(self, fn, *args):
+        """Chạy fn(*args) trong pool; báo PasswordHashQueueFull nếu hàng đợi đã đầy."""
+        if self._inflight >= self.max_workers + self.max_queue:
+            raise PasswordHashQueueFull("Hệ thống đang bận, vui lòng thử lại sau")
+        self._inflight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._inflight -= 1
+
+    async def run_timed(self, operation: str, fn, *args):
+        """Như run, ghi riêng thời gian fn chạy trong worker (password_hash_seconds) và thời gian chờ worker
+        rảnh (password_hash_queue_seconds)."""
+        start = time.perf_counter()
+        result, elapsed = await self.run(_timed_call, fn, *args)
+        metrics.password_hash_seconds.observe(elapsed, operation)
+        metrics.password_hash_queue_seconds.observe(max(0.0, time.perf_counter() - start - elapsed), operation)
+        return result
+
+    async def warm_up(self):
+        """Tạo sẵn worker (process pool spawn chậm) và nạp bcrypt trong từng worker trước request đầu."""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        await asyncio.gather(*(loop.run_in_executor(executor, _warm_up_bcrypt) for _ in range(self.max_workers)))
+
+    @property
+    def has_idle_worker(self) -> bool:
+        """Còn worker rảnh (dùng cho việc nền như rehash: không chiếm chỗ của request)."""
+        return self._inflight < self.max_workers
+
+    async def calibrate(self, target_ms: float, min_rounds: int) -> int:
+        """Đo trong worker của pool và đặt cost để một lần hash ~ target_ms. Trả về cost đã chọn."""
+        self.rounds = await self.run(calibrate_rounds, target_ms, min_rounds)
+        return self.rounds
+
+    def shutdown(self):
+        """Đóng pool (gọi khi tắt app)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    settings.PASSWORD_HASH_EXECUTOR,
+    settings.PASSWORD_HASH_WORKERS,
+    settings.PASSWORD_HASH_QUEUE_SIZE,
+)
+
+metrics.GaugeFunc("password_hash_rounds", "Cost bcrypt cho hash mới", lambda: password_hasher.rounds)
+
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    """Bản async của verify_password, chạy trong pool hash."""
+    return await password_hasher.run_timed("verify", verify_password, plain_password, hashed_password)
+
+
+async def aget_password_hash(password: str) -> str:
+    """Bản async của get_password_hash, chạy trong pool hash."""
+    return await password_hasher.run_timed("hash", get_password_hash, password, password_hasher.rounds)
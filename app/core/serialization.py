@@ -0,0 +1,61 @@
+"""Serialize response: response class mặc định theo cấu hình và đường tắt cho payload đã validate sẵn.
+
+- RESPONSE_CLASS: response class cho route không khai báo response_model (dict...): "json" (stdlib) hoặc
+  "orjson" (cần cài orjson, thiếu thì quay về json). Route có response_model vẫn được FastAPI serialize
+  thẳng ra bytes bằng pydantic-core vì class được bọc trong Default(...).
+- RESPONSE_FAST_PATH: handler gọi dump_response để validate một lần bằng TypeAdapter dựng sẵn và trả bytes
+  JSON; FastAPI nhận Response nên bỏ qua bước validate/serialize lại theo response_model.
+"""
+from typing import Any, Optional
+
+from fastapi.datastructures import Default, DefaultPlaceholder
+from fastapi.responses import JSONResponse, Response
+from pydantic import TypeAdapter
+
+from app.core.config import get_settings
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn
+    orjson = None
+
+settings = get_settings()
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response serialize bằng orjson."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def get_default_response_class() -> DefaultPlaceholder:
+    """default_response_class cho FastAPI theo RESPONSE_CLASS."""
+    name = settings.RESPONSE_CLASS.lower()
+    if name == "orjson":
+        if orjson is not None:
+            return Default(ORJSONResponse)
+        print("[Serialization] Chưa cài orjson, dùng JSONResponse")
+    elif name != "json":
+        raise ValueError(f"RESPONSE_CLASS không hỗ trợ: {settings.RESPONSE_CLASS}")
+    return Default(JSONResponse)
+
+
+def dump_response(
+    adapter: TypeAdapter,
+    value: Any,
+    status_code: int = 200,
+    headers: Optional[dict[str, str]] = None,
+) -> Any:
+    """Validate value bằng adapter rồi trả Response JSON đã serialize.
+
+    ORM object đọc được khi schema có from_attributes (vd. schemas.user.User, kể cả lồng trong dict).
+    Tắt RESPONSE_FAST_PATH thì trả object đã validate để FastAPI xử lý theo response_model như thường
+    (trừ khi có headers: object trả về không mang được header nên vẫn trả Response).
+    """
+    validated = adapter.validate_python(value)
+    if not settings.RESPONSE_FAST_PATH and headers is None:
+        return validated
+    return Response(
+        adapter.dump_json(validated), status_code=status_code, headers=headers, media_type="application/json"
+    )
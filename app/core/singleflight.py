@@ -0,0 +1,37 @@
+"""Singleflight: các lời gọi đồng thời cùng key dùng chung một lần chạy và kết quả của nó.
+
+Lần chạy nằm trong task riêng: request khởi tạo bị hủy (client ngắt kết nối) thì các request đang
+chờ vẫn nhận kết quả. Hết lần chạy thì key được xóa, lời gọi sau chạy lại (không phải cache).
+"""
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Gộp lời gọi đồng thời theo key."""
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """Chạy fn() nếu chưa có lần chạy nào cho key, ngược lại chờ lần đang chạy.
+
+        Trả về (kết quả, shared): shared=True nếu dùng chung kết quả của lời gọi khác. Lỗi của fn được
+        raise cho mọi lời gọi đang chờ.
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task), shared
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mọi lời gọi chờ đã bị hủy: đánh dấu lỗi đã xử lý để asyncio không cảnh báo
+        if not task.cancelled():
+            task.exception()
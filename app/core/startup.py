@@ -0,0 +1,33 @@
+"""Đo thời gian các pha khởi động (schema, pool, warm-up...), in log và xuất qua /metrics."""
+import time
+from contextlib import contextmanager
+
+from app.core import metrics
+
+
+class StartupTimer:
+    """Ghi thời gian từng pha khởi động theo thứ tự chạy."""
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def report(self):
+        total = sum(self.phases.values())
+        parts = ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in self.phases.items())
+        print(f"[Startup] Sẵn sàng sau {total * 1000:.1f}ms ({parts})")
+
+
+startup_timer = StartupTimer()
+
+metrics.GaugeFunc(
+    "startup_phase_seconds", "Thời gian từng pha khởi động (giây)",
+    lambda: {(name,): seconds for name, seconds in startup_timer.phases.items()}, ("phase",),
+)
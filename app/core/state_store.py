@@ -0,0 +1,366 @@
+"""State store: lưu dữ liệu ngắn hạn (OTP, counter) có TTL, tách khỏi các bảng chính.
+
+Backend (STATE_STORE_BACKEND):
+- "memory": dict trong process (chỉ dùng khi chạy 1 worker)
+- "sql": bảng state_entries trong DATABASE_URL (mặc định, giống hành vi cũ)
+- "redis": server nói giao thức Redis (REDIS_URL), client RESP tối giản
+"""
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Optional
+from urllib.parse import urlparse
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import get_settings
+from app.core.database import PrimarySessionLocal
+from app.models.state_entry import StateEntry
+
+settings = get_settings()
+
+
+class StateStore(ABC):
+    """Key-value store có TTL, get-and-delete nguyên tử và counter.
+
+    Tham số db (tùy chọn): session của request; backend SQL sẽ ghi trong transaction đó (caller commit),
+    các backend khác bỏ qua.
+    """
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: float, db: Optional[AsyncSession] = None):
+        """Ghi đè key với TTL (giây)."""
+
+    @abstractmethod
+    async def get(self, key: str, db: Optional[AsyncSession] = None) -> Optional[str]:
+        """Lấy giá trị còn hạn, None nếu không có."""
+
+    @abstractmethod
+    async def get_and_delete(self, key: str, db: Optional[AsyncSession] = None) -> Optional[str]:
+        """Lấy và xóa key nguyên tử: chỉ một caller nhận được giá trị."""
+
+    @abstractmethod
+    async def delete(self, key: str, db: Optional[AsyncSession] = None):
+        """Xóa key."""
+
+    @abstractmethod
+    async def incr(self, key: str, ttl: float) -> int:
+        """Tăng counter; TTL được đặt khi key mới tạo. Trả về giá trị sau khi tăng."""
+
+    async def purge_expired(self, limit: int) -> int:
+        """Xóa tối đa limit key hết hạn (backend không tự hết hạn). Trả về số key đã xóa."""
+        return 0
+
+    async def close(self):
+        """Đóng kết nối (gọi khi tắt app)."""
+
+
+class MemoryStateStore(StateStore):
+    """State store trong process. Không chia sẻ giữa các worker."""
+
+    def __init__(self):
+        self._data: dict[str, tuple[float, str]] = {}
+
+    def _live(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() >= entry[0]:
+            del self._data[key]
+            return None
+        return entry[1]
+
+    async def set(self, key: str, value: str, ttl: float, db: Optional[AsyncSession] = None):
+        self._data[key] = (time.monotonic() + ttl, value)
+
+    async def get(self, key: str, db: Optional[AsyncSession] = None) -> Optional[str]:
+        return self._live(key)
+
+    async def get_and_delete(self, key: str, db: Optional[AsyncSession] = None) -> Optional[str]:
+        value = self._live(key)
+        if value is not None:
+            del self._data[key]
+        return value
+
+    async def delete(self, key: str, db: Optional[AsyncSession] = None):
+        self._data.pop(key, None)
+
+    async def incr(self, key: str, ttl: float) -> int:
+        value = self._live(key)
+        if value is None:
+            self._data[key] = (time.monotonic() + ttl, "1")
+            return 1
+        expires_at = self._data[key][0]
+        count = int(value) + 1
+        self._data[key] = (expires_at, str(count))
+        return count
+
+    async def purge_expired(self, limit: int) -> int:
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._data.items() if expires_at <= now][:limit]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+
+
+class SQLStateStore(StateStore):
+    """State store trên bảng state_entries.
+
+    Có db: chạy trong transaction của caller (không commit). Không có db: transaction ngắn riêng.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker):
+        self.session_factory = session_factory
+
+    @asynccontextmanager
+    async def _session(self, db: Optional[AsyncSession]):
+        if db is not None:
+            yield db
+            return
+        async with self.session_factory() as session:
+            yield session
+            await session.commit()
+
+    async def set(self, key: str, value: str, ttl: float, db: Optional[AsyncSession] = None):
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        async with self._session(db) as session:
+            # Upsert một câu lệnh nếu dialect hỗ trợ, nếu không thì UPDATE rồi INSERT
+            dialect = session.get_bind().dialect.name
+            values = {"key": key, "value": value, "expires_at": expires_at}
+            if dialect == "sqlite":
+                stmt = sqlite_insert(StateEntry).values(**values)
+                await session.execute(stmt.on_conflict_do_update(
+                    index_elements=["key"],
+                    set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+                ))
+                return
+            if dialect == "mysql":
+                stmt = mysql_insert(StateEntry).values(**values)
+                await session.execute(stmt.on_duplicate_key_update(
+                    value=stmt.inserted.value, expires_at=stmt.inserted.expires_at
+                ))
+                return
+            result = await session.execute(
+                update(StateEntry)
+                .where(StateEntry.key == key)
+                .values(value=value, expires_at=expires_at)
+            )
+            if result.rowcount == 0:
+                session.add(StateEntry(key=key, value=value, expires_at=expires_at))
+                await session.flush()
+
+    async def get(self, key: str, db: Optional[AsyncSession] = None) -> Optional[str]:
+        async with self._session(db) as session:
+            result = await session.execute(
+                select(StateEntry.value).where(
+                    StateEntry.key == key, StateEntry.expires_at > datetime.utcnow()
+                )
+            )
+            return result.scalars().first()
+
+    async def get_and_delete(self, key: str, db: Optional[AsyncSession] = None) -> Optional[str]:
+        async with self._session(db) as session:
+            now = datetime.utcnow()
+            result = await session.execute(
+                select(StateEntry.value).where(StateEntry.key == key, StateEntry.expires_at > now)
+            )
+            value = result.scalars().first()
+            if value is None:
+                return None
+            # DELETE có điều kiện: chỉ caller xóa được đúng bản ghi này mới nhận giá trị
+            result = await session.execute(
+                delete(StateEntry).where(
+                    StateEntry.key == key,
+                    StateEntry.value == value,
+                    StateEntry.expires_at > now,
+                )
+            )
+            return value if result.rowcount == 1 else None
+
+    async def delete(self, key: str, db: Optional[AsyncSession] = None):
+        async with self._session(db) as session:
+            await session.execute(delete(StateEntry).where(StateEntry.key == key))
+
+    async def incr(self, key: str, ttl: float) -> int:
+        for _ in range(10):
+            async with self.session_factory() as session:
+                now = datetime.utcnow()
+                row = (
+                    await session.execute(
+                        select(StateEntry.value, StateEntry.expires_at).where(StateEntry.key == key)
+                    )
+                ).first()
+                try:
+                    if row is None or row.expires_at <= now:
+                        if row is not None:
+                            await session.execute(
+                                delete(StateEntry).where(
+                                    StateEntry.key == key, StateEntry.expires_at <= now
+                                )
+                            )
+                        session.add(
+                            StateEntry(key=key, value="1", expires_at=now + timedelta(seconds=ttl))
+                        )
+                        await session.commit()
+                        return 1
+                    # Compare-and-set: chỉ tăng nếu chưa có ai đổi giá trị
+                    count = int(row.value) + 1
+                    result = await session.execute(
+                        update(StateEntry)
+                        .where(StateEntry.key == key, StateEntry.value == row.value)
+                        .values(value=str(count))
+                    )
+                    await session.commit()
+                    if result.rowcount == 1:
+                        return count
+                except IntegrityError:
+                    await session.rollback()
+        raise RuntimeError(f"Không tăng được counter {key}")
+
+    async def purge_expired(self, limit: int) -> int:
+        async with self.session_factory() as session:
+            now = datetime.utcnow()
+            keys = (
+                await session.execute(
+                    select(StateEntry.key).where(StateEntry.expires_at <= now).limit(limit)
+                )
+            ).scalars().all()
+            if not keys:
+                return 0
+            result = await session.execute(
+                delete(StateEntry).where(StateEntry.key.in_(keys), StateEntry.expires_at <= now)
+            )
+            await session.commit()
+            return result.rowcount or 0
+
+
+class RedisError(RuntimeError):
+    """Lỗi trả về từ Redis server (-ERR ...)."""
+
+
+class RedisStateStore(StateStore):
+    """State store trên Redis (RESP2), một kết nối dùng chung, tự kết nối lại khi lỗi."""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @staticmethod
+    def _encode(*args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis đóng kết nối")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            raise RedisError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Phản hồi Redis không hợp lệ: {line!r}")
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._roundtrip("AUTH", self.password)
+        if self.db:
+            await self._roundtrip("SELECT", self.db)
+
+    async def _roundtrip(self, *args):
+        self._writer.write(self._encode(*args))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    def _drop_connection(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def execute(self, *args):
+        """Gửi một lệnh và đọc phản hồi; kết nối lại một lần nếu kết nối cũ đã hỏng."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await asyncio.wait_for(self._connect(), self.timeout)
+                    return await asyncio.wait_for(self._roundtrip(*args), self.timeout)
+                except RedisError:
+                    raise
+                except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    self._drop_connection()
+                    if attempt:
+                        raise
+
+    async def set(self, key: str, value: str, ttl: float, db: Optional[AsyncSession] = None):
+        await self.execute("SET", key, value, "PX", max(1, int(ttl * 1000)))
+
+    async def get(self, key: str, db: Optional[AsyncSession] = None) -> Optional[str]:
+        return await self.execute("GET", key)
+
+    async def get_and_delete(self, key: str, db: Optional[AsyncSession] = None) -> Optional[str]:
+        return await self.execute("GETDEL", key)
+
+    async def delete(self, key: str, db: Optional[AsyncSession] = None):
+        await self.execute("DEL", key)
+
+    async def incr(self, key: str, ttl: float) -> int:
+        # Tạo key với TTL nếu chưa có (NX), INCR giữ nguyên TTL
+        await self.execute("SET", key, 0, "PX", max(1, int(ttl * 1000)), "NX")
+        return await self.execute("INCR", key)
+
+    async def close(self):
+        writer = self._writer
+        self._drop_connection()
+        if writer is not None:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+def create_state_store() -> StateStore:
+    """Tạo state store theo STATE_STORE_BACKEND."""
+    backend = settings.STATE_STORE_BACKEND.lower()
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "redis":
+        return RedisStateStore(settings.REDIS_URL)
+    if backend == "sql":
+        return SQLStateStore(PrimarySessionLocal)
+    raise ValueError(f"STATE_STORE_BACKEND không hợp lệ: {settings.STATE_STORE_BACKEND}")
+
+
+state_store = create_state_store()
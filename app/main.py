@@ -1,57 +1,101 @@
 """Application entry point."""
 import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 import os
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from app.api.v1.router import api_router
-from app.core.database import database, AsyncSessionLocal
+from app.core.admission import AdmissionMiddleware
+from app.core.config import get_settings
+from app.core.database import database, PrimarySessionLocal
+from app.core.metrics import MetricsMiddleware, registry
+from app.core.rate_limit import RateLimitExceeded
+from app.core.serialization import get_default_response_class
+from app.core.security import PasswordHashQueueFull, create_access_token, password_hasher
+from app.core.startup import startup_timer
+from app.core.state_store import state_store
 from app.services.otp_service import otp_service
+from app.services.email_dispatcher import email_dispatcher
+from app.services.scheduler import scheduler
+from app.services.smtp_pool import smtp_pool
 
-# Chu kỳ xóa OTP hết hạn (giây)
-OTP_CLEANUP_INTERVAL = 60
+settings = get_settings()
 
 
-async def _periodic_otp_cleanup(stopped: asyncio.Event):
-    """Chạy nền: định kỳ xóa OTP hết hạn và user chưa kích hoạt có OTP hết hạn."""
-    while not stopped.is_set():
-        try:
-            async with AsyncSessionLocal() as session:
-                users_n, otps_n = await otp_service.cleanup_expired_otps_and_inactive_users(session)
-                await session.commit()
-                if users_n > 0 or otps_n > 0:
-                    if users_n > 0:
-                        print(f"[OTP] Đã xóa {users_n} user chưa kích hoạt (OTP hết hạn).")
-                    if otps_n > 0:
-                        print(f"[OTP] Đã xóa {otps_n} mã OTP hết hạn.")
-        except asyncio.CancelledError:
-            break
-        except Exception as e:
-            print(f"[OTP] Lỗi khi dọn OTP/user hết hạn: {e}")
-        await asyncio.sleep(OTP_CLEANUP_INTERVAL)
+async def _cleanup_otps_job(session_factory: async_sessionmaker) -> int:
+    """Job nền: xóa OTP hết hạn và user chưa kích hoạt có OTP hết hạn."""
+    async with session_factory() as session:
+        users_n, otps_n = await otp_service.cleanup_expired_otps_and_inactive_users(session)
+        await session.commit()
+    if users_n > 0:
+        print(f"[OTP] Đã xóa {users_n} user chưa kích hoạt (OTP hết hạn).")
+    if otps_n > 0:
+        print(f"[OTP] Đã xóa {otps_n} mã OTP hết hạn.")
+    return users_n + otps_n
+
+
+scheduler.add_job(
+    "otp_cleanup",
+    _cleanup_otps_job,
+    interval=settings.OTP_CLEANUP_INTERVAL_SECONDS,
+    max_interval=settings.OTP_CLEANUP_MAX_INTERVAL_SECONDS,
+    jitter=settings.SCHEDULER_JITTER,
+)
+
+
+async def _purge_outbox_job(session_factory: async_sessionmaker) -> int:
+    """Job nền: xóa email dead-letter quá thời gian giữ."""
+    deleted = await email_dispatcher.purge_dead(session_factory)
+    if deleted > 0:
+        print(f"[Outbox] Đã xóa {deleted} email dead-letter cũ.")
+    return deleted
+
+
+scheduler.add_job(
+    "email_outbox_purge",
+    _purge_outbox_job,
+    interval=settings.EMAIL_OUTBOX_PURGE_INTERVAL_SECONDS,
+    jitter=settings.SCHEDULER_JITTER,
+)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan events."""
-    await database.connect()
-    # Xóa OTP hết hạn và user chưa kích hoạt có OTP hết hạn khi khởi động
-    async with AsyncSessionLocal() as session:
-        await otp_service.cleanup_expired_otps_and_inactive_users(session)
-        await session.commit()
-    # Chạy task định kỳ xóa OTP hết hạn
-    stop_cleanup = asyncio.Event()
-    cleanup_task = asyncio.create_task(_periodic_otp_cleanup(stop_cleanup))
+    with startup_timer.phase("schema"):
+        ddl = await database.connect()
+    print(f"[Startup] Schema {'đã tạo/cập nhật' if ddl else 'không đổi, bỏ qua create_all'}")
+    # Mở sẵn kết nối DB, worker bcrypt và JWT để request đầu không trả chi phí khởi tạo
+    with startup_timer.phase("db_pool"):
+        await database.prewarm(settings.DB_POOL_PREWARM)
+    with startup_timer.phase("password_hasher"):
+        await password_hasher.warm_up()
+        if settings.PASSWORD_HASH_TARGET_MS > 0:
+            rounds = await password_hasher.calibrate(settings.PASSWORD_HASH_TARGET_MS, settings.PASSWORD_HASH_MIN_ROUNDS)
+            print(f"[Security] bcrypt cost={rounds} (mục tiêu {settings.PASSWORD_HASH_TARGET_MS:g}ms/hash)")
+    with startup_timer.phase("jwt"):
+        create_access_token({"sub": "warm-up"})
+    # Chạy các job nền (dọn OTP...): mỗi job chỉ một process trong cụm chạy, nhờ lease trong DB
+    stop_background = asyncio.Event()
+    scheduler_task = scheduler.start(PrimarySessionLocal, stop_background)
+    # Chạy dispatcher gửi email từ outbox
+    dispatcher_task = email_dispatcher.start(PrimarySessionLocal, stop_background)
+    startup_timer.report()
     yield
-    stop_cleanup.set()
-    cleanup_task.cancel()
-    try:
-        await cleanup_task
-    except asyncio.CancelledError:
-        pass
+    stop_background.set()
+    for task in (scheduler_task, dispatcher_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    password_hasher.shutdown()
+    await smtp_pool.close()
+    await state_store.close()
     await database.disconnect()
 
 
@@ -60,8 +104,11 @@ app = FastAPI(
     version="1.0.0",
     description="API template với FastAPI, async và dependency injection",
     lifespan=lifespan,
+    default_response_class=get_default_response_class(),
 )
 
+# Thứ tự ngoài → trong: Metrics → CORS → Admission (503 vẫn có header CORS và được đếm vào metrics)
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -69,16 +116,43 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(api_router, prefix="/api/v1")
 
 
+@app.exception_handler(PasswordHashQueueFull)
+async def password_hash_queue_full_handler(request: Request, exc: PasswordHashQueueFull):
+    """Pool hash mật khẩu quá tải: trả 503 để client thử lại."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    """Vượt rate limit: trả 429 kèm thời gian chờ."""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 @app.get("/")
 async def root():
     """Health check (mặc định)."""
     return {"message": "Backend Kebook API", "docs": "/docs"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Metrics cho Prometheus (text format 0.0.4)."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/kaithhealthcheck")
 @app.get("/kaithheathcheck")
 async def kaith_healthcheck():
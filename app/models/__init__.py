@@ -1,5 +1,10 @@
 """SQLAlchemy models."""
 from app.models.user import User
 from app.models.otp import OTP, OTPType
+from app.models.email_outbox import EmailOutbox, OutboxStatus
+from app.models.state_entry import StateEntry
+from app.models.job_lease import JobLease
+from app.models.schema_meta import SchemaMeta
+from app.models.pending_activation import PendingActivation
 
-__all__ = ["User", "OTP", "OTPType"]
+__all__ = ["User", "OTP", "OTPType", "EmailOutbox", "OutboxStatus", "StateEntry", "JobLease", "SchemaMeta", "PendingActivation"]
@@ -0,0 +1,34 @@
+"""Email outbox model: email chờ gửi, ghi cùng transaction với OTP."""
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index, Enum as SQLEnum
+from datetime import datetime
+import enum
+from app.core.database import Base
+
+
+class OutboxStatus(str, enum.Enum):
+    """Trạng thái email trong outbox."""
+    PENDING = "pending"  # Chờ gửi (hoặc chờ retry)
+    SENDING = "sending"  # Đã được dispatcher nhận, đang gửi
+    DEAD = "dead"  # Gửi lỗi quá số lần cho phép hoặc OTP hết hạn trước khi gửi (dead-letter)
+
+
+class EmailOutbox(Base):
+    """Email outbox table. Email gửi thành công bị xóa khỏi bảng; email dead-letter bị xóa mã OTP và được
+    xóa hẳn sau EMAIL_OUTBOX_DEAD_RETENTION_SECONDS."""
+
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        # Dispatcher nhận batch: WHERE status IN (...) AND next_attempt_at <= ? ORDER BY next_attempt_at
+        Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String(255), nullable=False)
+    email_type = Column(String(50), nullable=False)  # activation / reset_password
+    otp_code = Column(String(6), nullable=False)
+    status = Column(SQLEnum(OutboxStatus), nullable=False, default=OutboxStatus.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = Column(String(32), nullable=True, index=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,14 @@
+"""Job lease model: khóa theo thời hạn để chỉ một process trong cụm chạy mỗi job nền."""
+from sqlalchemy import Column, String, DateTime
+from app.core.database import Base
+
+
+class JobLease(Base):
+    """Job leases table. Process giữ lease (owner) tới expires_at; hết hạn thì process khác được nhận."""
+
+    __tablename__ = "job_leases"
+
+    name = Column(String(100), primary_key=True)
+    owner = Column(String(100), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    last_run_at = Column(DateTime, nullable=True)
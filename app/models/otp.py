@@ -1,8 +1,7 @@
-"""OTP model."""
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Enum as SQLEnum
-from datetime import datetime, timedelta
+"""OTP: loại OTP và bản ghi OTP lưu trong StateStore (không còn là bảng SQL)."""
+from dataclasses import dataclass
+from datetime import datetime
 import enum
-from app.core.database import Base
 
 
 class OTPType(str, enum.Enum):
@@ -11,18 +10,15 @@ class OTPType(str, enum.Enum):
     RESET_PASSWORD = "reset_password"  # Reset mật khẩu
 
 
-class OTP(Base):
-    """OTP codes table."""
+@dataclass
+class OTP:
+    """OTP đang lưu trong state store (key theo email + loại)."""
 
-    __tablename__ = "otps"
-
-    id = Column(Integer, primary_key=True, index=True)
-    email = Column(String(255), index=True, nullable=False)
-    code = Column(String(6), nullable=False)  # 6 số
-    otp_type = Column(SQLEnum(OTPType), nullable=False)
-    is_used = Column(Boolean, default=False)
-    expires_at = Column(DateTime, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    email: str
+    code: str
+    otp_type: OTPType
+    expires_at: datetime
+    is_used: bool = False
 
     def is_expired(self) -> bool:
         """Kiểm tra OTP đã hết hạn chưa."""
@@ -0,0 +1,16 @@
+"""Pending activation model: user đăng ký đang chờ kích hoạt bằng OTP (mốc để job dọn xóa user)."""
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from app.core.database import Base
+
+
+class PendingActivation(Base):
+    """Pending activations table. Ghi cùng transaction đăng ký, xóa khi kích hoạt thành công.
+
+    Job dọn chỉ xóa user chưa kích hoạt có dòng ở đây đã quá expires_at (OTP kích hoạt đã hết hạn):
+    user tạo qua POST /users/ hoặc bị admin vô hiệu hóa không có dòng nào nên không bị xóa.
+    """
+
+    __tablename__ = "pending_activations"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
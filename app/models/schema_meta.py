@@ -0,0 +1,13 @@
+"""Schema meta model: fingerprint schema đã áp dụng, để bỏ qua create_all khi model không đổi."""
+from sqlalchemy import Column, String, DateTime
+from app.core.database import Base
+
+
+class SchemaMeta(Base):
+    """Schema meta table. Một dòng mỗi schema (name), fingerprint = SHA256 của DDL các bảng."""
+
+    __tablename__ = "schema_meta"
+
+    name = Column(String(50), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    applied_at = Column(DateTime, nullable=False)
@@ -0,0 +1,13 @@
+"""State entry model: key-value có TTL, dùng cho SQLStateStore (OTP, counter)."""
+from sqlalchemy import Column, String, Text, DateTime
+from app.core.database import Base
+
+
+class StateEntry(Base):
+    """State entries table (dữ liệu ngắn hạn, hết hạn theo expires_at)."""
+
+    __tablename__ = "state_entries"
+
+    key = Column(String(255), primary_key=True)
+    value = Column(Text, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -1,5 +1,5 @@
 """User model - khớp với database: id, email, username, hashed_password, full_name, is_active, is_superuser, created_at, updated_at."""
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index
 from datetime import datetime
 from app.core.database import Base
 
@@ -8,6 +8,10 @@ class User(Base):
     """User table."""
 
     __tablename__ = "users"
+    __table_args__ = (
+        # Phân trang keyset có lọc: WHERE is_active = ? AND id > ? ORDER BY id
+        Index("ix_users_is_active_id", "is_active", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String(255), unique=True, index=True, nullable=False)
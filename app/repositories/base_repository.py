@@ -1,10 +1,19 @@
 """Base repository cho CRUD."""
-from typing import Generic, TypeVar, Type, Optional, List
-from sqlalchemy import select
+from typing import Any, Generic, Hashable, TypeVar, Type, Optional, List, Sequence, Union
+from sqlalchemy import Select, UniqueConstraint, select, insert, update, delete, inspect, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from pydantic import BaseModel
 
-from app.core.database import Base as ModelBase
+from app.core import metrics
+from app.core.cache import TTLCache, invalidate_on_commit
+from app.core.config import get_settings
+from app.core.database import AsyncSessionLocal, Base as ModelBase, can_share_reads
+from app.core.singleflight import SingleFlight
+
+settings = get_settings()
 
 ModelType = TypeVar("ModelType", bound=ModelBase)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
@@ -14,13 +23,61 @@ UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 class BaseRepository(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     """Base repository CRUD."""
 
-    def __init__(self, model: Type[ModelType]):
+    def __init__(self, model: Type[ModelType], cache: Optional[TTLCache] = None, singleflight: bool = False):
         self.model = model
+        self.cache = cache  # Cache theo ID (nếu có) cần xóa khi ghi
+        # Bật: đọc một bản ghi (_read_one) đồng thời cùng key dùng chung một query
+        self.singleflight = SingleFlight() if singleflight else None
+
+    async def _read_one(self, db: AsyncSession, operation: str, key: Hashable, stmt: Select) -> Optional[ModelType]:
+        """Chạy SELECT lấy tối đa một bản ghi.
+
+        Có singleflight và session chưa ghi (can_share_reads): các lời gọi đồng thời cùng (operation, key)
+        dùng chung một query chạy trong session riêng, mỗi caller nhận bản sao gắn vào session của mình
+        (merge load=False, không truy vấn thêm). Session đang trong transaction ghi luôn tự truy vấn.
+        """
+        if self.singleflight is None:
+            return (await db.execute(stmt)).scalars().first()
+        if not can_share_reads(db):
+            metrics.repository_reads_total.inc(operation, "bypass")
+            return (await db.execute(stmt)).scalars().first()
+        row, shared = await self.singleflight.do((operation, key), lambda: self._load_row(stmt))
+        metrics.repository_reads_total.inc(operation, "shared" if shared else "query")
+        if row is None:
+            return None
+        obj = self.model(**row)
+        make_transient_to_detached(obj)
+        return await db.merge(obj, load=False)
+
+    async def _load_row(self, stmt: Select) -> Optional[dict]:
+        """Chạy stmt trong session riêng, trả về giá trị các cột (không giữ object gắn session nào)."""
+        async with AsyncSessionLocal() as session:
+            obj = (await session.execute(stmt)).scalars().first()
+            if obj is None:
+                return None
+            return {attr.key: getattr(obj, attr.key) for attr in inspect(self.model).column_attrs}
 
     async def get(self, db: AsyncSession, id: int) -> Optional[ModelType]:
         """Lấy theo ID."""
-        result = await db.execute(select(self.model).where(self.model.id == id))
-        return result.scalars().first()
+        return await self._read_one(db, "get", id, select(self.model).where(self.model.id == id))
+
+    async def get_many(
+        self,
+        db: AsyncSession,
+        ids: Sequence[int],
+        chunk_size: Optional[int] = None,
+    ) -> dict[int, ModelType]:
+        """Lấy nhiều bản ghi theo ID: WHERE id IN (...), bỏ ID trùng, chia chunk nếu nhiều.
+
+        Trả về {id: object}; ID không tồn tại không có trong dict (caller tự đánh dấu thiếu).
+        """
+        unique_ids = list(dict.fromkeys(ids))
+        found: dict[int, ModelType] = {}
+        for chunk in self._chunks(unique_ids, chunk_size):
+            result = await db.execute(select(self.model).where(self.model.id.in_(chunk)))
+            for obj in result.scalars().all():
+                found[obj.id] = obj
+        return found
 
     async def get_multi(
         self,
@@ -32,33 +89,266 @@ class BaseRepository(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         result = await db.execute(select(self.model).offset(skip).limit(limit))
         return list(result.scalars().all())
 
-    async def create(self, db: AsyncSession, obj_in: CreateSchemaType) -> ModelType:
-        """Tạo mới."""
-        data = obj_in.model_dump() if hasattr(obj_in, "model_dump") else obj_in.dict()
+    async def get_page(
+        self,
+        db: AsyncSession,
+        after_id: Optional[int] = None,
+        limit: int = 100,
+        filters: Optional[dict[str, Any]] = None,
+    ) -> tuple[List[ModelType], Optional[int]]:
+        """Phân trang keyset theo ID (WHERE id > after_id ORDER BY id LIMIT n): trang sâu tốn như trang đầu.
+
+        filters: {tên cột: giá trị} so sánh bằng. Trả về (items, after_id của trang sau hoặc None nếu hết).
+        """
+        query = select(self.model)
+        for field, value in (filters or {}).items():
+            column = getattr(self.model, field, None)
+            if column is None:
+                raise ValueError(f"Không lọc được theo {field}")
+            query = query.where(column == value)
+        if after_id is not None:
+            query = query.where(self.model.id > after_id)
+        result = await db.execute(query.order_by(self.model.id).limit(limit + 1))
+        items = list(result.scalars().all())
+        if len(items) > limit:
+            items = items[:limit]
+            return items, items[-1].id
+        return items, None
+
+    async def create(
+        self, db: AsyncSession, obj_in: Union[CreateSchemaType, dict]
+    ) -> ModelType:
+        """Tạo mới: một round trip (INSERT ... RETURNING nếu dialect hỗ trợ, không refresh)."""
+        data = self._to_dict(obj_in)
+        if db.get_bind().dialect.insert_returning:
+            result = await db.scalars(
+                insert(self.model).values(**data).returning(self.model)
+            )
+            return result.one()
         db_obj = self.model(**data)
         db.add(db_obj)
         await db.flush()
-        await db.refresh(db_obj)
         return db_obj
 
     async def update(
         self,
         db: AsyncSession,
         db_obj: ModelType,
-        obj_in: UpdateSchemaType,
+        obj_in: Union[UpdateSchemaType, dict],
     ) -> ModelType:
-        """Cập nhật."""
-        data = obj_in.model_dump(exclude_unset=True) if hasattr(obj_in, "model_dump") else obj_in.dict(exclude_unset=True)
-        for field, value in data.items():
-            setattr(db_obj, field, value)
-        await db.flush()
-        await db.refresh(db_obj)
+        """Cập nhật: một UPDATE (... RETURNING nếu dialect hỗ trợ), db_obj được đồng bộ, không refresh."""
+        data = self._to_dict(obj_in, exclude_unset=True)
+        if not data:
+            return db_obj
+        if db.get_bind().dialect.update_returning:
+            await db.execute(
+                update(self.model)
+                .where(self.model.id == db_obj.id)
+                .values(**data)
+                .returning(self.model)
+            )
+        else:
+            for field, value in data.items():
+                setattr(db_obj, field, value)
+            await db.flush()
+        if self.cache is not None:
+            invalidate_on_commit(db, self.cache, db_obj.id)
         return db_obj
 
+    async def update_by_id(
+        self, db: AsyncSession, id: int, data: dict
+    ) -> Optional[ModelType]:
+        """Cập nhật theo ID không cần SELECT trước. UPDATE ... RETURNING (1 round trip) nếu dialect hỗ trợ,
+        nếu không thì UPDATE rồi SELECT. Trả về None nếu không có bản ghi."""
+        if not data:
+            return await self.get(db, id)
+        stmt = update(self.model).where(self.model.id == id).values(**data)
+        if db.get_bind().dialect.update_returning:
+            obj = (await db.scalars(stmt.returning(self.model))).first()
+        else:
+            result = await db.execute(stmt)
+            obj = await db.get(self.model, id, populate_existing=True) if result.rowcount else None
+        if obj is not None and self.cache is not None:
+            invalidate_on_commit(db, self.cache, id)
+        return obj
+
     async def delete(self, db: AsyncSession, id: int) -> bool:
-        """Xóa theo ID."""
-        obj = await self.get(db, id)
-        if obj:
-            await db.delete(obj)
-            return True
-        return False
+        """Xóa theo ID: một DELETE (... RETURNING id nếu dialect hỗ trợ), không SELECT trước."""
+        stmt = delete(self.model).where(self.model.id == id)
+        if db.get_bind().dialect.delete_returning:
+            deleted = (await db.execute(stmt.returning(self.model.id))).first() is not None
+        else:
+            deleted = (await db.execute(stmt)).rowcount > 0
+        if deleted and self.cache is not None:
+            invalidate_on_commit(db, self.cache, id)
+        return deleted
+
+    @staticmethod
+    def _to_dict(obj: Union[BaseModel, dict], exclude_unset: bool = False) -> dict:
+        if isinstance(obj, dict):
+            return dict(obj)
+        return obj.model_dump(exclude_unset=exclude_unset)
+
+    @staticmethod
+    def _chunks(rows: list, chunk_size: Optional[int]):
+        size = chunk_size or settings.BULK_CHUNK_SIZE
+        for start in range(0, len(rows), size):
+            yield rows[start:start + size]
+
+    def _select_ids_by_keys(self, conflict_columns: Sequence[str], keys: Sequence[tuple]) -> Select:
+        """SELECT id + conflict_columns của đúng các bộ giá trị keys.
+
+        Nhiều cột thì so sánh cả bộ (tuple IN): IN riêng từng cột là tích Descartes, trả cả dòng không
+        thuộc chunk (vd. (a, 2) khi chunk có (a, 1) và (b, 2)).
+        """
+        columns = [getattr(self.model, c) for c in conflict_columns]
+        if len(columns) == 1:
+            condition = columns[0].in_({key[0] for key in keys})
+        else:
+            condition = tuple_(*columns).in_(set(keys))
+        return select(self.model.id, *columns).where(condition)
+
+    @staticmethod
+    def _ids_in_order(keys: Sequence[tuple], found: Sequence) -> List[int]:
+        """Xếp ID (dòng (id, *conflict_columns)) theo thứ tự keys của input.
+
+        Không khớp chính xác thì so khớp không phân biệt hoa thường (collation mặc định của MySQL coi
+        'A@x.com' trùng 'a@x.com' và giữ giá trị đã lưu).
+        """
+        exact = {tuple(row[1:]): row[0] for row in found}
+        folded = {
+            tuple(v.casefold() if isinstance(v, str) else v for v in key): id for key, id in exact.items()
+        }
+        ids = []
+        for key in keys:
+            id = exact.get(key)
+            if id is None:
+                id = folded.get(tuple(v.casefold() if isinstance(v, str) else v for v in key))
+            if id is None:
+                raise LookupError(
+                    f"Không tìm thấy dòng vừa ghi có khóa {key!r} (dòng bị xóa đồng thời hoặc collation so khớp khác)"
+                )
+            ids.append(id)
+        return ids
+
+    def _unique_key(self, rows: Sequence[dict]) -> Optional[tuple[str, ...]]:
+        """Cột của một ràng buộc unique (ngoài id) mà mọi dòng đều có giá trị khác NULL; None nếu không có."""
+        table = self.model.__table__
+        candidates = [(column.name,) for column in table.columns if column.unique]
+        candidates += [tuple(column.name for column in index.columns) for index in table.indexes if index.unique]
+        candidates += [
+            tuple(column.name for column in constraint.columns)
+            for constraint in table.constraints
+            if isinstance(constraint, UniqueConstraint)
+        ]
+        for columns in candidates:
+            if all(row.get(c) is not None for row in rows for c in columns):
+                return columns
+        return None
+
+    async def create_many(
+        self,
+        db: AsyncSession,
+        objs_in: Sequence[Union[CreateSchemaType, dict]],
+        chunk_size: Optional[int] = None,
+    ) -> List[int]:
+        """Tạo nhiều bản ghi bằng INSERT nhiều dòng theo chunk, không refresh từng object. Trả về list ID.
+
+        Dialect có RETURNING (SQLite) lấy ID từ RETURNING. MySQL không có: ID của câu INSERT nhiều dòng
+        không chắc liên tiếp (innodb_autoinc_lock_mode=2, replication), nên tra lại bằng một SELECT theo
+        cột unique của dòng như upsert_many; model không có cột unique thì INSERT từng dòng.
+        """
+        rows = [self._to_dict(obj) for obj in objs_in]
+        ids: List[int] = []
+        returning = db.get_bind().dialect.insert_executemany_returning
+        key_columns = None if returning else self._unique_key(rows)
+        for chunk in self._chunks(rows, chunk_size):
+            if returning:
+                # executemany + RETURNING không đảm bảo thứ tự dòng: yêu cầu sắp theo thứ tự tham số
+                result = await db.execute(
+                    insert(self.model).returning(self.model.id, sort_by_parameter_order=True), chunk
+                )
+                ids.extend(result.scalars().all())
+            elif key_columns:
+                await db.execute(insert(self.model).values(chunk))
+                keys = [tuple(row[c] for c in key_columns) for row in chunk]
+                found = (await db.execute(self._select_ids_by_keys(key_columns, keys))).all()
+                ids.extend(self._ids_in_order(keys, found))
+            else:
+                for row in chunk:
+                    result = await db.execute(insert(self.model).values(row))
+                    ids.append(result.lastrowid)
+        return ids
+
+    async def update_many(
+        self,
+        db: AsyncSession,
+        rows: Sequence[dict],
+        chunk_size: Optional[int] = None,
+    ) -> List[int]:
+        """Cập nhật nhiều bản ghi theo ID (executemany UPDATE ... WHERE id = ?). Mỗi dict phải có "id".
+
+        Trả về list ID đã gửi cập nhật (không reload bản ghi).
+        """
+        rows = [dict(row) for row in rows]
+        for chunk in self._chunks(rows, chunk_size):
+            await db.execute(update(self.model), chunk)
+        ids = [row["id"] for row in rows]
+        if self.cache is not None:
+            for id in ids:
+                invalidate_on_commit(db, self.cache, id)
+        return ids
+
+    async def upsert_many(
+        self,
+        db: AsyncSession,
+        rows: Sequence[Union[CreateSchemaType, dict]],
+        conflict_columns: Sequence[str],
+        update_columns: Optional[Sequence[str]] = None,
+        chunk_size: Optional[int] = None,
+    ) -> List[int]:
+        """INSERT nhiều dòng, dòng trùng conflict_columns (unique) thì UPDATE update_columns.
+
+        SQLite: ON CONFLICT DO UPDATE ... RETURNING. MySQL: ON DUPLICATE KEY UPDATE, rồi lấy ID bằng
+        một SELECT theo bộ giá trị conflict_columns của chunk. update_columns mặc định: mọi cột được
+        truyền trừ id và conflict_columns. Trả về ID theo đúng thứ tự rows (mỗi dòng một ID).
+        """
+        data = [self._to_dict(row) for row in rows]
+        if not data:
+            return []
+        if update_columns is None:
+            update_columns = [c for c in data[0] if c != "id" and c not in conflict_columns]
+        # Cột có onupdate (vd. updated_at) cũng được cập nhật khi trùng
+        onupdate = {
+            column.name: column.onupdate.arg(None)
+            for column in self.model.__table__.columns
+            if column.onupdate is not None
+            and getattr(column.onupdate, "is_callable", False)
+            and column.name not in update_columns
+        }
+        key_columns = [getattr(self.model, c) for c in conflict_columns]
+        dialect = db.get_bind().dialect.name
+        ids: List[int] = []
+        for chunk in self._chunks(data, chunk_size):
+            keys = [tuple(row[c] for c in conflict_columns) for row in chunk]
+            if dialect == "sqlite":
+                stmt = sqlite_insert(self.model).values(chunk)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=list(conflict_columns),
+                    set_={**{c: stmt.excluded[c] for c in update_columns}, **onupdate},
+                ).returning(self.model.id, *key_columns)
+                found = (await db.execute(stmt)).all()
+            elif dialect == "mysql":
+                stmt = mysql_insert(self.model).values(chunk)
+                stmt = stmt.on_duplicate_key_update(
+                    {**{c: stmt.inserted[c] for c in update_columns}, **onupdate}
+                )
+                await db.execute(stmt)
+                found = (await db.execute(self._select_ids_by_keys(conflict_columns, keys))).all()
+            else:
+                raise NotImplementedError(f"upsert_many chưa hỗ trợ dialect {dialect}")
+            ids.extend(self._ids_in_order(keys, found))
+        if self.cache is not None:
+            for id in ids:
+                invalidate_on_commit(db, self.cache, id)
+        return ids
@@ -1,39 +1,67 @@
 """User repository."""
 from typing import Optional
-from sqlalchemy import select, or_
+from sqlalchemy import select, or_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.cache import invalidate_on_commit, user_cache
+from app.core.config import get_settings
 from app.models.user import User
-from app.schemas.user import UserCreateInDB, UserUpdate
+from app.schemas.user import UserCreateInDB, UserInDB, UserUpdate
 from app.repositories.base_repository import BaseRepository
 
+settings = get_settings()
+
 
 class UserRepository(BaseRepository[User, UserCreateInDB, UserUpdate]):
     """Repository cho User."""
 
+    async def get_cached(self, db: AsyncSession, id: int) -> Optional[User]:
+        """Lấy user theo ID qua user_cache: hit thì không truy vấn DB (trả User tạm, không gắn session)."""
+        cached = user_cache.get(id)
+        if cached is not None:
+            return User(**cached)
+        user = await self.get(db, id)
+        if user is not None:
+            user_cache.set(id, UserInDB.model_validate(user).model_dump())
+        return user
+
     async def get_by_email(self, db: AsyncSession, email: str) -> Optional[User]:
         """Lấy user theo email."""
-        result = await db.execute(select(User).where(User.email == email))
-        return result.scalars().first()
+        return await self._read_one(db, "get_by_email", email, select(User).where(User.email == email))
 
     async def get_by_username(self, db: AsyncSession, username: str) -> Optional[User]:
         """Lấy user theo username."""
-        result = await db.execute(select(User).where(User.username == username))
-        return result.scalars().first()
+        return await self._read_one(db, "get_by_username", username, select(User).where(User.username == username))
 
     async def get_by_email_or_username(
         self, db: AsyncSession, email_or_username: str
     ) -> Optional[User]:
         """Lấy user theo email hoặc username (dùng cho login)."""
-        result = await db.execute(
+        return await self._read_one(
+            db,
+            "get_by_email_or_username",
+            email_or_username,
             select(User).where(
                 or_(
                     User.email == email_or_username,
                     User.username == email_or_username,
                 )
-            )
+            ),
+        )
+
+    async def replace_password_hash(self, db: AsyncSession, id: int, old_hash: str, new_hash: str) -> bool:
+        """Đổi hashed_password nếu vẫn là old_hash (mật khẩu vừa đổi ở request khác thì không ghi đè).
+
+        Giữ nguyên updated_at: đổi cost hash không phải thay đổi dữ liệu user (ETag không đổi).
+        """
+        result = await db.execute(
+            update(User)
+            .where(User.id == id, User.hashed_password == old_hash)
+            .values(hashed_password=new_hash, updated_at=User.updated_at)
         )
-        return result.scalars().first()
+        if result.rowcount:
+            invalidate_on_commit(db, user_cache, id)
+        return bool(result.rowcount)
 
 
-user_repository = UserRepository(User)
+user_repository = UserRepository(User, cache=user_cache, singleflight=settings.REPOSITORY_SINGLEFLIGHT)
@@ -1,6 +1,6 @@
 """User schemas - khớp với database."""
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field, TypeAdapter
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -38,6 +38,8 @@ class UserUpdate(BaseModel):
 class User(UserBase):
     """Schema response user (không có password)."""
 
+    # Email đọc từ DB đã validate lúc ghi: không chạy lại email-validator (~80µs) mỗi lần serialize
+    email: str = Field(json_schema_extra={"format": "email"})
     id: int
     is_active: bool = False
     is_superuser: bool = False
@@ -51,3 +53,30 @@ class UserInDB(User):
     """User với hashed_password (nội bộ)."""
 
     hashed_password: str
+
+
+class UserPage(BaseModel):
+    """Một trang danh sách user (phân trang bằng cursor)."""
+
+    items: List[User]
+    next_cursor: Optional[str] = None
+
+
+class UserLookup(BaseModel):
+    """Kết quả tra một ID: found=False và user=None nếu không có user."""
+
+    id: int
+    found: bool
+    user: Optional[User] = None
+
+
+class UserBatch(BaseModel):
+    """Kết quả GET /users/?ids=...: một phần tử cho mỗi ID, đúng thứ tự yêu cầu."""
+
+    items: List[UserLookup]
+
+
+# TypeAdapter dựng sẵn cho response (dựng adapter phải build schema, không làm lại mỗi request)
+user_adapter = TypeAdapter(User)
+user_page_adapter = TypeAdapter(UserPage)
+user_batch_adapter = TypeAdapter(UserBatch)
@@ -0,0 +1,209 @@
+"""Email dispatcher: chạy nền, lấy email từ outbox theo batch và gửi (retry/backoff, dead-letter)."""
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.models.email_outbox import EmailOutbox, OutboxStatus
+from app.services.email_service import email_service
+
+settings = get_settings()
+
+
+class EmailDispatcher:
+    """Gửi email trong bảng email_outbox. Nhiều worker chạy song song an toàn nhờ claim_token."""
+
+    def __init__(self):
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def enqueue_otp(db: AsyncSession, email: str, otp_code: str, email_type: str) -> EmailOutbox:
+        """Thêm email OTP vào outbox (trong transaction hiện tại của db)."""
+        item = EmailOutbox(
+            email=email,
+            email_type=email_type,
+            otp_code=otp_code,
+            status=OutboxStatus.PENDING,
+            attempts=0,
+            next_attempt_at=datetime.utcnow(),
+        )
+        db.add(item)
+        return item
+
+    def notify(self):
+        """Đánh thức dispatcher ngay (gọi sau khi commit email mới)."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _claim_batch(self, db: AsyncSession) -> tuple[str, list[EmailOutbox]]:
+        """Nhận một batch email đến hạn gửi. Email 'sending' quá lease cũng được nhận lại.
+
+        Trả về (claim_token, các email đã nhận). Caller kết thúc transaction trước khi gửi.
+        """
+        now = datetime.utcnow()
+        ids = (
+            await db.execute(
+                select(EmailOutbox.id)
+                .where(
+                    EmailOutbox.status.in_([OutboxStatus.PENDING, OutboxStatus.SENDING]),
+                    EmailOutbox.next_attempt_at <= now,
+                )
+                .order_by(EmailOutbox.next_attempt_at)
+                .limit(settings.EMAIL_OUTBOX_BATCH_SIZE)
+            )
+        ).scalars().all()
+        if not ids:
+            return "", []
+
+        token = uuid.uuid4().hex
+        await db.execute(
+            update(EmailOutbox)
+            .where(
+                EmailOutbox.id.in_(ids),
+                EmailOutbox.status.in_([OutboxStatus.PENDING, OutboxStatus.SENDING]),
+                EmailOutbox.next_attempt_at <= now,
+            )
+            .values(
+                status=OutboxStatus.SENDING,
+                claim_token=token,
+                next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS),
+            )
+        )
+        await db.commit()
+        result = await db.execute(select(EmailOutbox).where(EmailOutbox.claim_token == token))
+        return token, list(result.scalars().all())
+
+    @staticmethod
+    def _is_expired(item: EmailOutbox, now: datetime) -> bool:
+        """OTP trong email đã hết hạn (gửi cũng vô ích: người dùng phải yêu cầu mã mới)."""
+        return item.created_at is not None and item.created_at + timedelta(seconds=settings.OTP_EXPIRE_SECONDS) <= now
+
+    async def _send(self, item: EmailOutbox, slots: asyncio.Semaphore) -> tuple[int, Optional[str]]:
+        async with slots:
+            start = time.perf_counter()
+            try:
+                ok = await email_service.send_otp_email(item.email, item.otp_code, item.email_type)
+                error = None if ok else "Gửi email thất bại"
+            except Exception as e:
+                error = str(e)
+            metrics.email_send_seconds.observe(time.perf_counter() - start, item.email_type)
+            if error is not None:
+                metrics.email_send_failures_total.inc(item.email_type)
+            return item.id, error
+
+    async def dispatch_once(self, session_factory: async_sessionmaker) -> int:
+        """Gửi một batch email. Trả về số email đã xử lý (thành công + lỗi + bỏ vì OTP hết hạn).
+
+        Ba bước, không giữ transaction/kết nối DB trong lúc gửi SMTP: nhận batch (transaction ngắn),
+        gửi, ghi kết quả (transaction ngắn mới). Mọi câu ghi lọc theo claim_token: worker hết lease
+        không ghi đè email mà worker khác đã nhận lại.
+        """
+        async with session_factory() as db:
+            token, items = await self._claim_batch(db)
+            await db.commit()
+        if not items:
+            return 0
+
+        now = datetime.utcnow()
+        expired = [item for item in items if self._is_expired(item, now)]
+        to_send = [item for item in items if not self._is_expired(item, now)]
+        slots = asyncio.Semaphore(settings.EMAIL_OUTBOX_CONCURRENCY)
+        results = await asyncio.gather(*(self._send(item, slots) for item in to_send))
+        by_id = {item.id: item for item in items}
+
+        async with session_factory() as db:
+            sent_ids = [item_id for item_id, error in results if error is None]
+            if sent_ids:
+                await db.execute(
+                    delete(EmailOutbox).where(EmailOutbox.id.in_(sent_ids), EmailOutbox.claim_token == token)
+                )
+            if expired:
+                metrics.email_expired_total.inc(amount=len(expired))
+                await db.execute(
+                    update(EmailOutbox)
+                    .where(EmailOutbox.id.in_([item.id for item in expired]), EmailOutbox.claim_token == token)
+                    .values(**self._dead_values(now), last_error="OTP đã hết hạn trước khi gửi")
+                )
+
+            now = datetime.utcnow()
+            for item_id, error in results:
+                if error is None:
+                    continue
+                item = by_id[item_id]
+                attempts = item.attempts + 1
+                values = {"attempts": attempts, "last_error": error[:1000], "claim_token": None}
+                if attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                    values.update(self._dead_values(now))
+                    metrics.email_dead_letter_total.inc()
+                    print(f"[Outbox] Email tới {item.email} chuyển sang dead-letter sau {attempts} lần: {error}")
+                else:
+                    backoff = settings.EMAIL_OUTBOX_BACKOFF_SECONDS * (2 ** (attempts - 1))
+                    values["status"] = OutboxStatus.PENDING
+                    values["next_attempt_at"] = now + timedelta(seconds=backoff)
+                await db.execute(
+                    update(EmailOutbox)
+                    .where(EmailOutbox.id == item_id, EmailOutbox.claim_token == token)
+                    .values(**values)
+                )
+            await db.commit()
+        return len(items)
+
+    @staticmethod
+    def _dead_values(now: datetime) -> dict:
+        """Chuyển sang dead-letter: xóa mã OTP (không lưu plaintext), next_attempt_at = thời điểm chuyển
+        (purge_dead xóa theo mốc này)."""
+        return {"status": OutboxStatus.DEAD, "otp_code": "", "claim_token": None, "next_attempt_at": now}
+
+    async def purge_dead(self, session_factory: async_sessionmaker) -> int:
+        """Xóa email dead-letter cũ hơn EMAIL_OUTBOX_DEAD_RETENTION_SECONDS theo batch. Trả về số email đã xóa."""
+        before = datetime.utcnow() - timedelta(seconds=settings.EMAIL_OUTBOX_DEAD_RETENTION_SECONDS)
+        deleted = 0
+        async with session_factory() as db:
+            while True:
+                ids = (
+                    await db.execute(
+                        select(EmailOutbox.id)
+                        .where(EmailOutbox.status == OutboxStatus.DEAD, EmailOutbox.next_attempt_at < before)
+                        .limit(settings.OTP_CLEANUP_BATCH_SIZE)
+                    )
+                ).scalars().all()
+                if not ids:
+                    break
+                result = await db.execute(delete(EmailOutbox).where(EmailOutbox.id.in_(ids)))
+                deleted += result.rowcount or 0
+                await db.commit()
+                if len(ids) < settings.OTP_CLEANUP_BATCH_SIZE:
+                    break
+        return deleted
+
+    async def run(self, session_factory: async_sessionmaker, stopped: asyncio.Event):
+        """Vòng lặp nền: gửi liên tục khi còn email, nghỉ EMAIL_OUTBOX_POLL_SECONDS khi rảnh."""
+        self._wakeup = asyncio.Event()
+        while not stopped.is_set():
+            self._wakeup.clear()
+            try:
+                if await self.dispatch_once(session_factory) >= settings.EMAIL_OUTBOX_BATCH_SIZE:
+                    continue
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"[Outbox] Lỗi khi gửi email outbox: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.EMAIL_OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, session_factory: async_sessionmaker, stopped: asyncio.Event) -> asyncio.Task:
+        """Khởi chạy dispatcher nền (gọi từ lifespan)."""
+        self._task = asyncio.create_task(self.run(session_factory, stopped))
+        return self._task
+
+
+email_dispatcher = EmailDispatcher()
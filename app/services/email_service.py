@@ -1,8 +1,8 @@
 """Email service để gửi OTP."""
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from app.core.config import get_settings
+from app.services.smtp_pool import smtp_pool
 
 settings = get_settings()
 
@@ -13,7 +13,7 @@ class EmailService:
     @staticmethod
     async def send_otp_email(email: str, otp_code: str, otp_type: str = "activation"):
         """Gửi email chứa OTP."""
-        if not settings.SMTP_USER or not settings.SMTP_PASSWORD:
+        if not settings.SMTP_TEST_MODE and (not settings.SMTP_USER or not settings.SMTP_PASSWORD):
             # Development mode: in OTP ra console thay vì gửi email
             print(f"\n[SMTP] Không cấu hình SMTP_USER/SMTP_PASSWORD - in OTP ra console:")
             print(f"  OTP cho {email}: {otp_code} (loại: {otp_type})")
@@ -42,10 +42,7 @@ class EmailService:
             """
             msg.attach(MIMEText(body, "html"))
 
-            with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-                server.starttls()
-                server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-                server.send_message(msg)
+            await smtp_pool.send(msg)
 
             print(f"[SMTP] Đã gửi email OTP tới {email}.")
             return True
@@ -1,13 +1,18 @@
-"""OTP service: tạo và verify OTP."""
+"""OTP service: tạo và verify OTP (lưu trong state store, không ghi vào bảng SQL chính)."""
 import random
+import time
 from datetime import datetime, timedelta
+from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, delete
+from sqlalchemy import select, delete
 
 from app.models.otp import OTP, OTPType
+from app.models.pending_activation import PendingActivation
 from app.models.user import User
+from app.core import metrics
 from app.core.config import get_settings
-from app.services.email_service import email_service
+from app.core.state_store import state_store
+from app.services.email_dispatcher import email_dispatcher
 
 settings = get_settings()
 
@@ -20,64 +25,113 @@ class OTPService:
         """Tạo OTP code 6 số."""
         return str(random.randint(100000, 999999))
 
-    async def delete_expired_otps(self, db: AsyncSession) -> int:
-        """Xóa tất cả OTP đã hết hạn. Trả về số bản ghi đã xóa."""
-        result = await db.execute(delete(OTP).where(OTP.expires_at < datetime.utcnow()))
-        return result.rowcount
+    @staticmethod
+    def _key(email: str, otp_type: OTPType) -> str:
+        return f"otp:{otp_type.value}:{email}"
+
+    @staticmethod
+    def _dump(otp: OTP) -> str:
+        return f"{otp.code}:{(otp.expires_at - datetime(1970, 1, 1)).total_seconds()}"
+
+    @staticmethod
+    def _load(email: str, otp_type: OTPType, value: str) -> OTP:
+        code, expires_ts = value.split(":", 1)
+        expires_at = datetime(1970, 1, 1) + timedelta(seconds=float(expires_ts))
+        return OTP(email=email, code=code, otp_type=otp_type, expires_at=expires_at)
 
     async def cleanup_expired_otps_and_inactive_users(
-        self, db: AsyncSession
+        self,
+        db: AsyncSession,
+        batch_size: int | None = None,
+        time_budget: float | None = None,
+    ) -> tuple[int, int]:
+        """Dọn toàn cục theo từng batch: xóa user chưa kích hoạt có OTP kích hoạt đã hết hạn, rồi xóa OTP hết hạn.
+
+        User cần dọn lấy từ bảng pending_activations (ghi lúc đăng ký, xóa khi kích hoạt): chỉ user đăng
+        ký qua /auth/register mà không kích hoạt kịp; user tạo qua POST /users/ hoặc bị vô hiệu hóa không
+        bị xóa. Mỗi batch: 1 SELECT user_id + 2 DELETE set-based, commit sau mỗi batch; dừng khi hết dữ
+        liệu hoặc vượt time_budget giây. OTP hết hạn trong state store được purge (backend SQL) hoặc tự
+        hết hạn (memory/redis). Trả về (số user đã xóa, số OTP đã xóa).
+        """
+        with metrics.cleanup_duration_seconds.time():
+            users_deleted, otps_deleted = await self._cleanup(db, batch_size, time_budget)
+        metrics.cleanup_users_deleted_total.inc(amount=users_deleted)
+        metrics.otp_expired_total.inc(amount=otps_deleted)
+        return users_deleted, otps_deleted
+
+    async def _cleanup(
+        self,
+        db: AsyncSession,
+        batch_size: int | None,
+        time_budget: float | None,
     ) -> tuple[int, int]:
-        """Xóa user chưa kích hoạt (is_active=False) có OTP kích hoạt đã hết hạn, rồi xóa OTP hết hạn. Trả về (số user đã xóa, số OTP đã xóa)."""
+        batch_size = batch_size or settings.OTP_CLEANUP_BATCH_SIZE
+        time_budget = time_budget if time_budget is not None else settings.OTP_CLEANUP_TIME_BUDGET_SECONDS
+        deadline = time.monotonic() + time_budget
         now = datetime.utcnow()
-        # Lấy email có OTP kích hoạt đã hết hạn
-        result = await db.execute(
-            select(OTP.email).where(
-                OTP.expires_at < now,
-                OTP.otp_type == OTPType.ACTIVATION,
-            ).distinct()
-        )
-        emails = [row[0] for row in result.fetchall()]
         users_deleted = 0
-        for email in emails:
-            r = await db.execute(select(User).where(User.email == email, User.is_active == False))
-            user = r.scalars().first()
-            if user:
-                await db.delete(user)
-                users_deleted += 1
-        await db.flush()
-        otps_deleted = (await self.delete_expired_otps(db)) or 0
+        while time.monotonic() < deadline:
+            result = await db.execute(
+                select(PendingActivation.user_id)
+                .where(PendingActivation.expires_at < now)
+                .limit(batch_size)
+            )
+            ids = list(result.scalars().all())
+            if not ids:
+                break
+            result = await db.execute(
+                delete(User)
+                .where(User.id.in_(ids), User.is_active == False)
+                .execution_options(synchronize_session=False)
+            )
+            users_deleted += result.rowcount or 0
+            await db.execute(delete(PendingActivation).where(PendingActivation.user_id.in_(ids)))
+            await db.commit()
+            if len(ids) < batch_size:
+                break
+
+        otps_deleted = 0
+        while time.monotonic() < deadline:
+            n = await state_store.purge_expired(batch_size)
+            otps_deleted += n
+            if n < batch_size:
+                break
         return users_deleted, otps_deleted
 
+    @staticmethod
+    def add_pending_activation(db: AsyncSession, user_id: int):
+        """Ghi user chờ kích hoạt (cùng transaction đăng ký): quá hạn OTP mà chưa kích hoạt thì bị dọn."""
+        expires_at = datetime.utcnow() + timedelta(seconds=settings.OTP_EXPIRE_SECONDS)
+        db.add(PendingActivation(user_id=user_id, expires_at=expires_at))
+
+    @staticmethod
+    async def clear_pending_activation(db: AsyncSession, user_id: int):
+        """Xóa mốc chờ kích hoạt (kích hoạt thành công)."""
+        await db.execute(delete(PendingActivation).where(PendingActivation.user_id == user_id))
+
     async def create_and_send_otp(
         self,
         db: AsyncSession,
         email: str,
         otp_type: OTPType,
     ) -> str:
-        """Tạo OTP, lưu vào DB và gửi email."""
-        # Xóa user chưa kích hoạt có OTP hết hạn + xóa OTP hết hạn trước khi tạo mới
-        await self.cleanup_expired_otps_and_inactive_users(db)
+        """Tạo OTP (ghi đè OTP cũ cùng loại của email) và ghi email vào outbox.
 
-        # Tạo OTP mới
+        Với backend SQL, OTP và outbox nằm cùng transaction của db; caller commit.
+        """
         otp_code = self.generate_otp()
         expires_at = datetime.utcnow() + timedelta(seconds=settings.OTP_EXPIRE_SECONDS)
-
-        otp = OTP(
-            email=email,
-            code=otp_code,
-            otp_type=otp_type,
-            expires_at=expires_at,
+        otp = OTP(email=email, code=otp_code, otp_type=otp_type, expires_at=expires_at)
+        await state_store.set(
+            self._key(email, otp_type),
+            self._dump(otp),
+            settings.OTP_EXPIRE_SECONDS + settings.OTP_EXPIRED_RETENTION_SECONDS,
+            db=db,
         )
-        db.add(otp)
-        await db.flush()
 
-        # Gửi email
-        await email_service.send_otp_email(
-            email,
-            otp_code,
-            otp_type.value,
-        )
+        email_dispatcher.enqueue_otp(db, email, otp_code, otp_type.value)
+        await db.flush()
+        metrics.otp_created_total.inc(otp_type.value)
 
         return otp_code
 
@@ -87,30 +141,50 @@ class OTPService:
         email: str,
         code: str,
         otp_type: OTPType,
-    ) -> tuple[bool, OTP | None]:
-        """Verify OTP. Trả về (is_valid, otp_object)."""
-        result = await db.execute(
-            select(OTP).where(
-                and_(
-                    OTP.email == email,
-                    OTP.code == code,
-                    OTP.otp_type == otp_type,
-                    OTP.is_used == False,
-                )
-            ).order_by(OTP.created_at.desc())
-        )
-        otp = result.scalars().first()
-
-        if not otp:
+        consume: bool = True,
+    ) -> tuple[bool, Optional[OTP]]:
+        """Verify OTP. Trả về (is_valid, otp_object). OTP đúng và còn hạn bị xóa (dùng một lần).
+
+        consume=False: chỉ đọc để kiểm tra, không xóa. Dùng trước bước chậm (bcrypt) để transaction
+        không giữ khóa ghi trong lúc hash; sau đó gọi lại với consume=True để xóa nguyên tử.
+        """
+        is_valid, otp = await self._verify(db, email, code, otp_type, consume)
+        if is_valid and not consume:
+            # Lần consume sau mới tính vào metrics, tránh đếm hai lần
+            return True, otp
+        if is_valid:
+            result = "success"
+        elif otp is not None and otp.is_expired():
+            result = "expired"
+        else:
+            result = "invalid"
+        metrics.otp_verified_total.inc(otp_type.value, result)
+        return is_valid, otp
+
+    async def _verify(
+        self,
+        db: AsyncSession,
+        email: str,
+        code: str,
+        otp_type: OTPType,
+        consume: bool,
+    ) -> tuple[bool, Optional[OTP]]:
+        key = self._key(email, otp_type)
+        value = await state_store.get(key, db=db)
+        if value is None:
+            return False, None
+        otp = self._load(email, otp_type, value)
+        if otp.code != code:
             return False, None
-
         if otp.is_expired():
             return False, otp
+        if not consume:
+            return True, otp
 
-        # Đánh dấu đã dùng
+        # Lấy và xóa nguyên tử: request song song cùng mã chỉ một request thành công
+        if await state_store.get_and_delete(key, db=db) != value:
+            return False, None
         otp.is_used = True
-        await db.flush()
-
         return True, otp
 
 
@@ -0,0 +1,167 @@
+"""Scheduler job nền: mỗi job chỉ chạy ở một process trong cụm nhờ lease trong bảng job_leases.
+
+Process chạy job giữ lease trong lúc chạy, chạy xong đặt hạn lease tới lần chạy kế tiếp: process khác
+thức dậy trước hạn đó sẽ bỏ qua, nên chu kỳ là của cả cụm chứ không phải của từng worker. Process giữ
+lease chết thì lease hết hạn và process khác nhận thay.
+"""
+import asyncio
+import os
+import random
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core import metrics
+from app.core.config import get_settings
+from app.core.database import db_utcnow
+from app.models.job_lease import JobLease
+
+settings = get_settings()
+
+# Job nhận session_factory, trả về số bản ghi đã xử lý (0 = không có việc, scheduler giãn chu kỳ)
+JobFunc = Callable[[async_sessionmaker], Awaitable[int]]
+
+
+class ScheduledJob:
+    """Cấu hình một job: chu kỳ cơ bản, chu kỳ tối đa khi không có việc, jitter và thời hạn lease."""
+
+    def __init__(
+        self,
+        name: str,
+        func: JobFunc,
+        interval: float,
+        max_interval: Optional[float] = None,
+        jitter: float = 0.1,
+        lease_seconds: Optional[float] = None,
+    ):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.max_interval = max(max_interval or interval, interval)
+        self.jitter = jitter
+        self.lease_seconds = lease_seconds or settings.SCHEDULER_LEASE_SECONDS
+        self.current_interval = interval
+
+    def next_interval(self, processed: int) -> float:
+        """Có việc: về chu kỳ cơ bản. Không có việc: nhân đôi, tối đa max_interval."""
+        if processed > 0:
+            self.current_interval = self.interval
+        else:
+            self.current_interval = min(self.current_interval * 2, self.max_interval)
+        return self.current_interval
+
+    def jittered(self, seconds: float) -> float:
+        """Thêm jitter ±jitter (tỉ lệ) để các worker không thức dậy cùng lúc."""
+        return max(seconds * (1 + random.uniform(-self.jitter, self.jitter)), 0.0)
+
+
+class Scheduler:
+    """Chạy các job đã đăng ký; mỗi job một vòng lặp, chỉ chạy khi giành được lease."""
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs: dict[str, ScheduledJob] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add_job(self, name: str, func: JobFunc, interval: float, **kwargs) -> ScheduledJob:
+        """Đăng ký job (gọi trước start)."""
+        job = ScheduledJob(name, func, interval, **kwargs)
+        self.jobs[name] = job
+        return job
+
+    async def try_acquire(self, session_factory: async_sessionmaker, job: ScheduledJob) -> bool:
+        """Giành lease của job: được khi chưa ai giữ, lease đã hết hạn hoặc chính process này đang giữ.
+
+        Hạn lease tính và so sánh bằng đồng hồ database (db_utcnow), không dùng giờ của từng node.
+        """
+        async with session_factory() as db:
+            result = await db.execute(
+                update(JobLease)
+                .where(
+                    JobLease.name == job.name,
+                    or_(JobLease.owner == self.owner, JobLease.expires_at <= db_utcnow()),
+                )
+                .values(owner=self.owner, expires_at=db_utcnow(job.lease_seconds))
+            )
+            if result.rowcount == 1:
+                await db.commit()
+                return True
+            if await db.get(JobLease, job.name) is not None:
+                return False
+            # Lần đầu chạy job: tạo lease; process khác tạo cùng lúc thì một bên nhận IntegrityError
+            db.add(JobLease(name=job.name, owner=self.owner, expires_at=db_utcnow(job.lease_seconds)))
+            try:
+                await db.commit()
+                return True
+            except IntegrityError:
+                await db.rollback()
+                return False
+
+    async def release(self, session_factory: async_sessionmaker, job: ScheduledJob, next_in: float):
+        """Giữ lease tới lần chạy kế tiếp (process khác bỏ qua trước thời điểm đó)."""
+        async with session_factory() as db:
+            await db.execute(
+                update(JobLease)
+                .where(JobLease.name == job.name, JobLease.owner == self.owner)
+                .values(expires_at=db_utcnow(next_in), last_run_at=db_utcnow())
+            )
+            await db.commit()
+
+    async def run_job_once(self, session_factory: async_sessionmaker, job: ScheduledJob) -> Optional[float]:
+        """Chạy job một lần nếu giành được lease. Trả về chu kỳ kế tiếp, None nếu process khác đang giữ."""
+        if not await self.try_acquire(session_factory, job):
+            metrics.scheduler_job_skipped_total.inc(job.name)
+            return None
+        start = time.perf_counter()
+        try:
+            processed = await job.func(session_factory)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[Scheduler] Job {job.name} lỗi: {e}")
+            metrics.scheduler_job_runs_total.inc(job.name, "error")
+            next_in = job.interval
+        else:
+            metrics.scheduler_job_runs_total.inc(job.name, "ok")
+            metrics.scheduler_job_items_total.inc(job.name, amount=processed or 0)
+            next_in = job.next_interval(processed or 0)
+        finally:
+            metrics.scheduler_job_run_seconds.observe(time.perf_counter() - start, job.name)
+        await self.release(session_factory, job, next_in)
+        return next_in
+
+    async def _run_job(self, session_factory: async_sessionmaker, job: ScheduledJob, stopped: asyncio.Event):
+        # Lượt đầu chạy sau SCHEDULER_INITIAL_DELAY_SECONDS (không tranh tài nguyên với request đầu sau
+        # khởi động), cộng lệch ngẫu nhiên trong khoảng jitter để các worker khởi động cùng lúc không tranh nhau
+        delay = settings.SCHEDULER_INITIAL_DELAY_SECONDS + random.uniform(0, job.interval * job.jitter)
+        while not stopped.is_set():
+            try:
+                await asyncio.wait_for(stopped.wait(), delay)
+                break
+            except asyncio.TimeoutError:
+                pass
+            try:
+                next_in = await self.run_job_once(session_factory, job)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"[Scheduler] Lỗi lease job {job.name}: {e}")
+                next_in = None
+            # Không giữ lease: thử lại sau chu kỳ cơ bản (process đang giữ chết thì nhận thay)
+            delay = job.jittered(job.interval if next_in is None else next_in)
+
+    async def run(self, session_factory: async_sessionmaker, stopped: asyncio.Event):
+        await asyncio.gather(*(self._run_job(session_factory, job, stopped) for job in self.jobs.values()))
+
+    def start(self, session_factory: async_sessionmaker, stopped: asyncio.Event) -> asyncio.Task:
+        """Khởi chạy scheduler nền (gọi từ lifespan)."""
+        self._task = asyncio.create_task(self.run(session_factory, stopped))
+        return self._task
+
+
+scheduler = Scheduler()
@@ -0,0 +1,199 @@
+"""SMTP transport async: pool kết nối đã login, giữ sống và tái sử dụng, có circuit breaker."""
+import asyncio
+import smtplib
+import time
+from email.message import Message
+from typing import Optional
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+class SMTPCircuitOpen(RuntimeError):
+    """Circuit breaker đang mở: tạm ngừng gửi tới SMTP relay."""
+
+
+class CircuitBreaker:
+    """Ngắt mạch sau N lỗi liên tiếp, cho thử lại (half-open) sau reset_timeout giây."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        if self.opened_at is None:
+            return False
+        return time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        """Cho phép gửi không (đóng, hoặc đã hết thời gian chờ half-open)."""
+        return not self.is_open
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class _PooledConnection:
+    """Một kết nối smtplib đã STARTTLS + login, kèm thời điểm dùng gần nhất."""
+
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.last_used = time.monotonic()
+
+    def is_alive(self) -> bool:
+        """Kiểm tra kết nối bằng NOOP (chạy trong thread)."""
+        try:
+            return self.smtp.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except Exception:
+            try:
+                self.smtp.close()
+            except Exception:
+                pass
+
+
+class SMTPConnectionPool:
+    """Pool kết nối SMTP dùng chung; smtplib chạy trong thread nên không chặn event loop."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        size: int = 2,
+        timeout: float = 10.0,
+        keepalive_check_seconds: float = 30.0,
+        use_tls: bool = True,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = size
+        self.timeout = timeout
+        self.keepalive_check_seconds = keepalive_check_seconds
+        self.use_tls = use_tls
+        self.breaker = breaker or CircuitBreaker(5, 30)
+        self._idle: list[_PooledConnection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _open(self) -> _PooledConnection:
+        """Mở kết nối mới (blocking, chạy trong thread)."""
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                smtp.starttls()
+            if self.user and self.password:
+                smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        return _PooledConnection(smtp)
+
+    async def _in_thread(self, func, *args, on_abandon):
+        """Chạy func (blocking smtplib) trong thread và chờ kết quả.
+
+        Thread không dừng được: không bọc wait_for (timeout do socket timeout của smtplib lo). Caller bị
+        hủy thì không chờ nữa, nhưng on_abandon(future) chỉ chạy khi thread đã xong, để đóng kết nối
+        khi không còn thread nào dùng socket.
+        """
+        future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(on_abandon)
+            raise
+
+    def _discard_opened(self, future: asyncio.Future):
+        """Đóng kết nối mở xong sau khi caller đã bị hủy (không ai nhận)."""
+        if not future.cancelled() and future.exception() is None:
+            self._discard(future.result())
+
+    async def _acquire(self) -> _PooledConnection:
+        while self._idle:
+            conn = self._idle.pop()
+            if time.monotonic() - conn.last_used < self.keepalive_check_seconds:
+                return conn
+            if await self._in_thread(conn.is_alive, on_abandon=lambda _, conn=conn: self._discard(conn)):
+                return conn
+            self._discard(conn)
+        return await self._in_thread(self._open, on_abandon=self._discard_opened)
+
+    def _release(self, conn: _PooledConnection):
+        conn.last_used = time.monotonic()
+        self._idle.append(conn)
+
+    def _discard(self, conn: Optional[_PooledConnection]):
+        """Bỏ kết nối lỗi; đóng ở thread nền, không chờ. Chỉ gọi khi không còn thread nào dùng kết nối."""
+        if conn is not None:
+            asyncio.get_running_loop().run_in_executor(None, conn.close)
+
+    async def send(self, msg: Message):
+        """Gửi email qua một kết nối trong pool. Lỗi/timeout sẽ mở lại kết nối ở lần sau.
+
+        Timeout là socket timeout của smtplib (self.timeout cho mỗi thao tác đọc/ghi), không phải
+        wait_for: hết giờ thì chính thread gửi nhận lỗi và trả kết nối, không có socket bị đóng từ
+        thread khác khi đang gửi dở.
+        """
+        if not self.breaker.allow():
+            raise SMTPCircuitOpen("SMTP relay tạm thời bị ngắt mạch")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        async with self._slots:
+            conn = None
+            try:
+                conn = await self._acquire()
+                await self._in_thread(
+                    conn.smtp.send_message, msg, on_abandon=lambda _, conn=conn: self._discard(conn)
+                )
+            except Exception:
+                self._discard(conn)
+                self.breaker.record_failure()
+                raise
+            self._release(conn)
+            self.breaker.record_success()
+
+    async def close(self):
+        """Đóng tất cả kết nối đang rảnh (gọi khi tắt app)."""
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await asyncio.to_thread(conn.close)
+
+
+def create_pool_from_settings() -> SMTPConnectionPool:
+    """Tạo pool SMTP theo Settings. SMTP_TEST_MODE: không STARTTLS, dùng SMTP server local."""
+    return SMTPConnectionPool(
+        host=settings.SMTP_HOST,
+        port=settings.SMTP_PORT,
+        user=settings.SMTP_USER,
+        password=settings.SMTP_PASSWORD,
+        size=settings.SMTP_POOL_SIZE,
+        timeout=settings.SMTP_TIMEOUT,
+        keepalive_check_seconds=settings.SMTP_KEEPALIVE_CHECK_SECONDS,
+        use_tls=not settings.SMTP_TEST_MODE,
+        breaker=CircuitBreaker(
+            settings.SMTP_CIRCUIT_FAILURES, settings.SMTP_CIRCUIT_RESET_SECONDS
+        ),
+    )
+
+
+smtp_pool = create_pool_from_settings()
@@ -1,11 +1,38 @@
 """User service (business logic)."""
+import asyncio
+import re
 from typing import Optional
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.user import User
-from app.schemas.user import UserCreate, UserCreateInDB, UserUpdate
+from app.schemas.user import UserCreate, UserUpdate
 from app.repositories.user_repository import user_repository
-from app.core.security import get_password_hash
+from app.core import metrics
+from app.core.database import PrimarySessionLocal
+from app.core.security import PasswordHashQueueFull, aget_password_hash, password_hasher
+
+
+# Tên constraint/index trong thông báo lỗi unique của từng dialect
+_UNIQUE_KEY_PATTERNS = (
+    re.compile(r"for key '([^']+)'"),  # MySQL 1062: Duplicate entry 'x' for key 'users.ix_users_email'
+    re.compile(r'unique constraint "([^"]+)"'),  # PostgreSQL: ... violates unique constraint "ix_users_email"
+    re.compile(r"unique constraint failed: ([\w.]+)", re.IGNORECASE),  # SQLite: UNIQUE constraint failed: users.email
+)
+
+
+def _unique_field(message: str) -> Optional[str]:
+    """Cột unique bị trùng ("email"/"username") theo tên constraint/index, None nếu không nhận ra."""
+    for pattern in _UNIQUE_KEY_PATTERNS:
+        match = pattern.search(message)
+        if match is None:
+            continue
+        name = match.group(1).rsplit(".", 1)[-1].lower()
+        for field in ("email", "username"):
+            if name in (field, f"ix_users_{field}", f"users_{field}_key"):
+                return field
+        return None
+    return None
 
 
 class UserService:
@@ -13,26 +40,33 @@ class UserService:
 
     def __init__(self):
         self.repository = user_repository
+        self._background: set[asyncio.Task] = set()
 
-    async def create_user(self, db: AsyncSession, user_in: UserCreate) -> User:
-        """Tạo user mới (hash password)."""
-        existing_email = await self.repository.get_by_email(db, user_in.email)
-        if existing_email:
-            raise ValueError("Email đã được đăng ký")
+    @staticmethod
+    def _unique_violation(error: IntegrityError) -> ValueError:
+        """Đổi lỗi unique constraint (email/username) của DB thành lỗi nghiệp vụ.
 
-        existing_username = await self.repository.get_by_username(db, user_in.username)
-        if existing_username:
-            raise ValueError("Username đã được sử dụng")
+        Chỉ xét tên constraint/index trong thông báo lỗi, không xét cả thông báo: MySQL kèm giá trị bị
+        trùng (username "myemail" không được báo thành trùng email).
+        """
+        field = _unique_field(str(error.orig))
+        if field == "email":
+            return ValueError("Email đã được đăng ký")
+        if field == "username":
+            return ValueError("Username đã được sử dụng")
+        return ValueError("Dữ liệu bị trùng")
 
+    async def create_user(self, db: AsyncSession, user_in: UserCreate) -> User:
+        """Tạo user mới (hash password). Một INSERT; trùng email/username do unique constraint báo lỗi."""
         data = user_in.model_dump()
         password = data.pop("password")
-        data["hashed_password"] = get_password_hash(password)
-        user = await self.repository.create(db, UserCreateInDB(**data))
-        user.is_active = False
-        user.is_superuser = False
-        await db.flush()
-        await db.refresh(user)
-        return user
+        data["hashed_password"] = await aget_password_hash(password)
+        data["is_active"] = False
+        data["is_superuser"] = False
+        try:
+            return await self.repository.create(db, data)
+        except IntegrityError as e:
+            raise self._unique_violation(e)
 
     async def update_user(
         self,
@@ -40,20 +74,46 @@ class UserService:
         user_id: int,
         user_in: UserUpdate,
     ) -> Optional[User]:
-        """Cập nhật user."""
-        user = await self.repository.get(db, user_id)
-        if not user:
-            return None
-
+        """Cập nhật user (UPDATE ... RETURNING, không SELECT trước)."""
         data = user_in.model_dump(exclude_unset=True)
         if "password" in data:
-            data["hashed_password"] = get_password_hash(data.pop("password"))
-            data.pop("password", None)
-        for key, value in data.items():
-            setattr(user, key, value)
-        await db.flush()
-        await db.refresh(user)
-        return user
+            data["hashed_password"] = await aget_password_hash(data.pop("password"))
+        try:
+            return await self.repository.update_by_id(db, user_id, data)
+        except IntegrityError as e:
+            raise self._unique_violation(e)
+
+    async def rehash_password(self, user_id: int, password: str, old_hash: str) -> bool:
+        """Hash lại mật khẩu theo cost hiện tại (sau login thành công).
+
+        Hash xong mới mở transaction: UPDATE có điều kiện, không giữ khóa ghi trong lúc chạy bcrypt.
+        """
+        new_hash = await aget_password_hash(password)
+        async with PrimarySessionLocal() as db:
+            replaced = await self.repository.replace_password_hash(db, user_id, old_hash, new_hash)
+            await db.commit()
+        return replaced
+
+    def schedule_rehash(self, user_id: int, password: str, old_hash: str):
+        """Chạy rehash_password nền (không làm chậm response login). Pool hash không còn worker rảnh thì
+        bỏ qua, lần login sau thử lại."""
+        if not password_hasher.has_idle_worker:
+            metrics.password_rehash_total.inc("skipped")
+            return
+        task = asyncio.create_task(self._rehash(user_id, password, old_hash))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _rehash(self, user_id: int, password: str, old_hash: str):
+        try:
+            replaced = await self.rehash_password(user_id, password, old_hash)
+        except PasswordHashQueueFull:
+            metrics.password_rehash_total.inc("skipped")
+        except Exception as e:
+            print(f"[Auth] Rehash mật khẩu user {user_id} lỗi: {e}")
+            metrics.password_rehash_total.inc("error")
+        else:
+            metrics.password_rehash_total.inc("ok" if replaced else "stale")
 
 
 user_service = UserService()
@@ -0,0 +1 @@
+"""Benchmarks (chạy thủ công, không thuộc test suite)."""
@@ -0,0 +1,292 @@
+"""Benchmark luồng auth/user: chạy app in-process trên SQLite tạm, email ở chế độ console.
+
+Mỗi user ảo chạy: register → verify-otp → login → GET /users/me → PATCH /users/{id}
+→ forgot-password → reset-password. OTP đọc thẳng từ state store (không cần SMTP).
+Kết quả: throughput và latency p50/p90/p99 theo route, lưu JSON làm baseline; so sánh với baseline
+và báo regression vượt ngưỡng (exit code 1). Rate limit và admission control mặc định tắt để số đo là
+latency chứ không phải load shedding; response 503 (bị shed) đếm riêng, không tính vào latency.
+
+Chạy:
+    python -m benchmarks.bench_auth_flows run --users 100 --concurrency 10 --save baseline.json
+    python -m benchmarks.bench_auth_flows run --users 100 --concurrency 10 --compare baseline.json
+    python -m benchmarks.bench_auth_flows compare baseline.json current.json --threshold 0.15
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional
+
+
+def _prepare_env(rate_limit: bool, admission: bool):
+    """Cấu hình trước khi import app: SQLite tạm, email console, tắt rate limit và admission control
+    (trừ khi yêu cầu)."""
+    tmp = tempfile.mkdtemp(prefix="kebook-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ["SMTP_USER"] = ""
+    os.environ["SMTP_PASSWORD"] = ""
+    os.environ["SMTP_TEST_MODE"] = "false"
+    os.environ["STATE_STORE_BACKEND"] = "sql"
+    os.environ["DATABASE_REPLICA_URLS"] = ""
+    if not rate_limit:
+        os.environ["RATE_LIMIT_ENABLED"] = "false"
+    if not admission:
+        os.environ["ADMISSION_ENABLED"] = "false"
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Percentile theo nearest-rank (values đã sắp xếp)."""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+class Recorder:
+    """Ghi latency, lỗi và số request bị shed (503) theo route."""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.shed: dict[str, int] = {}
+
+    async def call(self, route: str, request, expected: int):
+        start = time.perf_counter()
+        response = await request
+        elapsed = time.perf_counter() - start
+        if response.status_code == 503:
+            # Bị từ chối sớm (admission/pool hash đầy): không phải latency của route
+            self.shed[route] = self.shed.get(route, 0) + 1
+            raise RuntimeError(f"{route}: 503 (shed)")
+        self.latencies.setdefault(route, []).append(elapsed)
+        if response.status_code != expected:
+            self.errors[route] = self.errors.get(route, 0) + 1
+            raise RuntimeError(f"{route}: {response.status_code} {response.text[:200]}")
+        return response
+
+    def summary(self, wall_seconds: float) -> dict:
+        routes = {}
+        for route in {**self.latencies, **self.shed}:
+            values = sorted(self.latencies.get(route, []))
+            if not values:
+                routes[route] = {"count": 0, "errors": 0, "shed": self.shed[route], "throughput_rps": 0.0,
+                                 "mean_ms": 0.0, "p50_ms": 0.0, "p90_ms": 0.0, "p99_ms": 0.0}
+                continue
+            routes[route] = {
+                "count": len(values),
+                "errors": self.errors.get(route, 0),
+                "shed": self.shed.get(route, 0),
+                "throughput_rps": round(len(values) / wall_seconds, 2),
+                "mean_ms": round(sum(values) / len(values) * 1000, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p90_ms": round(percentile(values, 90) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+            }
+        return routes
+
+
+async def _user_flow(client, recorder: Recorder, index: int, password: str):
+    from app.core.state_store import state_store
+    from app.models.otp import OTPType
+    from app.services.otp_service import otp_service
+
+    async def read_otp(email: str, otp_type: OTPType) -> str:
+        value = await state_store.get(otp_service._key(email, otp_type))
+        return value.split(":", 1)[0]
+
+    email = f"bench{index}@example.com"
+    username = f"bench{index}"
+    api = "/api/v1"
+
+    await recorder.call(
+        "POST /auth/register",
+        client.post(f"{api}/auth/register", json={"email": email, "username": username, "password": password}),
+        201,
+    )
+    code = await read_otp(email, OTPType.ACTIVATION)
+    await recorder.call(
+        "POST /auth/verify-otp",
+        client.post(f"{api}/auth/verify-otp", json={"email": email, "otp_code": code}),
+        200,
+    )
+    response = await recorder.call(
+        "POST /auth/login",
+        client.post(f"{api}/auth/login", data={"username": username, "password": password}),
+        200,
+    )
+    body = response.json()
+    headers = {"Authorization": f"Bearer {body['access_token']}"}
+    await recorder.call("GET /users/me", client.get(f"{api}/users/me", headers=headers), 200)
+    await recorder.call(
+        "PATCH /users/{user_id}",
+        client.patch(f"{api}/users/{body['user']['id']}", json={"full_name": f"Bench {index}"}, headers=headers),
+        200,
+    )
+    await recorder.call(
+        "POST /auth/forgot-password",
+        client.post(f"{api}/auth/forgot-password", json={"email": email}),
+        200,
+    )
+    code = await read_otp(email, OTPType.RESET_PASSWORD)
+    await recorder.call(
+        "POST /auth/reset-password",
+        client.post(f"{api}/auth/reset-password", json={"email": email, "otp_code": code, "new_password": password + "x"}),
+        200,
+    )
+
+
+async def run(users: int, concurrency: int, rate_limit: bool = False, admission: bool = False) -> dict:
+    """Chạy benchmark, trả về kết quả (dict có thể lưu JSON)."""
+    _prepare_env(rate_limit, admission)
+    import httpx
+    from app.main import app
+
+    recorder = Recorder()
+    failed_flows = 0
+    failures: list[str] = []
+    slots = asyncio.Semaphore(concurrency)
+
+    # App in OTP/log ra stdout ở chế độ console: bỏ đi để không ảnh hưởng số đo
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+
+                async def one(index: int):
+                    nonlocal failed_flows
+                    async with slots:
+                        try:
+                            await _user_flow(client, recorder, index, "bench-password")
+                        except Exception as e:
+                            failed_flows += 1
+                            if len(failures) < 10:
+                                failures.append(f"user {index}: {type(e).__name__}: {e}")
+
+                start = time.perf_counter()
+                await asyncio.gather(*(one(i) for i in range(users)))
+                wall = time.perf_counter() - start
+
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "users": users,
+            "concurrency": concurrency,
+            "rate_limit": rate_limit,
+            "admission": admission,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "total": {
+            "wall_seconds": round(wall, 3),
+            "flows_per_second": round((users - failed_flows) / wall, 2),
+            "failed_flows": failed_flows,
+            "shed_requests": sum(recorder.shed.values()),
+            "failures": failures,
+        },
+        "routes": recorder.summary(wall),
+    }
+
+
+def print_report(result: dict):
+    meta, total = result["meta"], result["total"]
+    print(f"{meta['users']} user, {meta['concurrency']} đồng thời: {total['wall_seconds']}s, "
+          f"{total['flows_per_second']} flow/s, {total['failed_flows']} flow lỗi, "
+          f"{total.get('shed_requests', 0)} request bị shed (503)")
+    for failure in total["failures"]:
+        print(f"  ! {failure}")
+    print(f"{'route':<28}{'count':>7}{'lỗi':>6}{'503':>6}{'req/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}")
+    for route, r in result["routes"].items():
+        print(f"{route:<28}{r['count']:>7}{r['errors']:>6}{r.get('shed', 0):>6}{r['throughput_rps']:>9}"
+              f"{r['p50_ms']:>9}{r['p90_ms']:>9}{r['p99_ms']:>9}")
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """So sánh theo route: p50/p90/p99 tăng hoặc throughput giảm quá threshold (tỉ lệ) là regression."""
+    regressions = []
+    for key in ("users", "concurrency", "cpu_count", "rate_limit", "admission"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"⚠ {key} khác baseline: {baseline['meta'].get(key)} → {current['meta'].get(key)} (so sánh có thể không công bằng)")
+    print(f"{'route':<28}{'metric':>16}{'baseline':>11}{'current':>11}{'thay đổi':>11}")
+    for route, base in baseline["routes"].items():
+        now = current["routes"].get(route)
+        if now is None:
+            regressions.append(f"{route}: không có trong kết quả hiện tại")
+            continue
+        for metric, higher_is_worse in (("p50_ms", True), ("p90_ms", True), ("p99_ms", True), ("throughput_rps", False)):
+            old, new = base[metric], now[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            worse = change > threshold if higher_is_worse else change < -threshold
+            flag = "  ⚠" if worse else ""
+            print(f"{route:<28}{metric:>16}{old:>11}{new:>11}{change:>+10.1%}{flag}")
+            if worse:
+                regressions.append(f"{route} {metric}: {old} → {new} ({change:+.1%})")
+        if now["errors"] > base["errors"]:
+            regressions.append(f"{route} errors: {base['errors']} → {now['errors']}")
+        if now.get("shed", 0) > base.get("shed", 0):
+            regressions.append(f"{route} 503 (shed): {base.get('shed', 0)} → {now.get('shed', 0)}")
+    return regressions
+
+
+def _load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _report_regressions(regressions: list[str], threshold: float) -> int:
+    print()
+    if regressions:
+        print(f"❌ {len(regressions)} regression vượt ngưỡng {threshold:.0%}:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print(f"✅ Không có regression vượt ngưỡng {threshold:.0%}")
+    return 0
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark luồng auth/user in-process")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Chạy benchmark")
+    run_parser.add_argument("--users", type=int, default=50, help="Số user ảo (mỗi user chạy đủ một flow)")
+    run_parser.add_argument("--concurrency", type=int, default=10, help="Số flow chạy đồng thời")
+    run_parser.add_argument("--rate-limit", action="store_true", help="Giữ rate limit (mặc định tắt)")
+    run_parser.add_argument("--admission", action="store_true", help="Giữ admission control (mặc định tắt)")
+    run_parser.add_argument("--save", help="Lưu kết quả JSON (làm baseline)")
+    run_parser.add_argument("--compare", help="So sánh với baseline JSON sau khi chạy")
+    run_parser.add_argument("--threshold", type=float, default=0.15, help="Ngưỡng regression (tỉ lệ, mặc định 0.15)")
+
+    compare_parser = sub.add_parser("compare", help="So sánh hai file kết quả")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.15)
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        regressions = compare(_load(args.baseline), _load(args.current), args.threshold)
+        return _report_regressions(regressions, args.threshold)
+
+    result = asyncio.run(run(args.users, args.concurrency, args.rate_limit, args.admission))
+    print_report(result)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Đã lưu kết quả: {args.save}")
+    if args.compare:
+        print()
+        regressions = compare(_load(args.compare), result, args.threshold)
+        return _report_regressions(regressions, args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+"""Chọn cost bcrypt theo CPU hiện tại và ước lượng năng lực login.
+
+In thời gian một lần hash theo từng cost, số hash/giây một worker và số login/giây tối đa của pool hash
+(PASSWORD_HASH_WORKERS worker, bcrypt nhả GIL nên song song tới số CPU). Gợi ý PASSWORD_HASH_ROUNDS cho
+mục tiêu --target-ms.
+
+Chạy: python -m benchmarks.bench_bcrypt --target-ms 250 [--min-rounds 10] [--max-rounds 14]
+"""
+import argparse
+import os
+import sys
+from typing import Optional
+
+from app.core.config import get_settings
+from app.core.security import calibrate_rounds, measure_hash_ms
+
+settings = get_settings()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Chọn cost bcrypt theo thời gian hash mục tiêu")
+    parser.add_argument("--target-ms", type=float, default=250.0, help="Thời gian mục tiêu một lần hash (ms)")
+    parser.add_argument("--min-rounds", type=int, default=settings.PASSWORD_HASH_MIN_ROUNDS)
+    parser.add_argument("--max-rounds", type=int, default=14, help="Cost lớn nhất được đo trong bảng")
+    parser.add_argument("--workers", type=int, default=settings.PASSWORD_HASH_WORKERS, help="Số worker pool hash")
+    args = parser.parse_args(argv)
+
+    cpus = os.cpu_count() or 1
+    parallel = min(args.workers, cpus)
+    print(f"{cpus} CPU, {args.workers} worker hash (song song thực tế {parallel})")
+    print(f"{'cost':>5}{'ms/hash':>10}{'hash/s/worker':>15}{'login/s tối đa':>16}")
+    for rounds in range(max(args.min_rounds - 2, 4), args.max_rounds + 1):
+        ms = measure_hash_ms(rounds, repeat=1 if rounds >= 13 else 3)
+        print(f"{rounds:>5}{ms:>10.1f}{1000 / ms:>15.1f}{parallel * 1000 / ms:>16.1f}")
+
+    rounds = calibrate_rounds(args.target_ms, args.min_rounds)
+    ms = measure_hash_ms(rounds, repeat=1)
+    print()
+    print(f"Gợi ý: PASSWORD_HASH_ROUNDS={rounds} (~{ms:.0f}ms/hash, tối đa ~{parallel * 1000 / ms:.1f} login/s)")
+    print(f"Hoặc đặt PASSWORD_HASH_TARGET_MS={args.target_ms:g} để mỗi process tự chọn lúc khởi động")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
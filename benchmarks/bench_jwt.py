@@ -0,0 +1,37 @@
+"""Micro-benchmark JWT: python-jose so với JWTCodec (có và không có cache token đã verify).
+
+Chạy: python -m benchmarks.bench_jwt [số vòng]
+"""
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+from jose import jwt
+
+from app.core.config import get_settings
+from app.core.security import ALGORITHM, JWTCodec
+
+settings = get_settings()
+
+
+def main(number: int = 20000):
+    claims = {"sub": "42", "exp": datetime.utcnow() + timedelta(minutes=90)}
+    token = jwt.encode(claims, settings.SECRET_KEY, algorithm=ALGORITHM)
+    codec = JWTCodec(settings.SECRET_KEY)
+    codec_no_cache = JWTCodec(settings.SECRET_KEY, cache_size=0)
+
+    cases = {
+        "encode  python-jose": lambda: jwt.encode(claims, settings.SECRET_KEY, algorithm=ALGORITHM),
+        "encode  JWTCodec": lambda: codec.encode(claims),
+        "decode  python-jose": lambda: jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM]),
+        "decode  JWTCodec (không cache)": lambda: codec_no_cache.decode(token),
+        "decode  JWTCodec (cache)": lambda: codec.decode(token),
+    }
+    print(f"{'case':<34}{'µs/op':>10}")
+    for name, fn in cases.items():
+        seconds = min(timeit.repeat(fn, number=number, repeat=3))
+        print(f"{name:<34}{seconds / number * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
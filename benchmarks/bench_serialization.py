@@ -0,0 +1,78 @@
+"""Micro-benchmark serialize response của /auth/login và /users/me (không qua HTTP).
+
+So sánh:
+- response_model: handler trả TokenResponse/ORM object, FastAPI validate lại rồi dump_json (mặc định).
+- response_model + json/orjson: như trên nhưng qua default_response_class tùy chỉnh không bọc Default(...)
+  (FastAPI bỏ đường dump_json, serialize ra dict rồi json.dumps/orjson.dumps).
+- dump_response: validate một lần bằng TypeAdapter dựng sẵn, trả bytes JSON (RESPONSE_FAST_PATH).
+
+Chạy: python -m benchmarks.bench_serialization [số vòng]
+"""
+import sys
+import timeit
+from datetime import datetime
+
+from fastapi.responses import JSONResponse, Response
+
+from app.api.v1.endpoints import auth, users
+from app.core.serialization import ORJSONResponse, dump_response, orjson
+from app.models.user import User
+from app.schemas.user import user_adapter
+
+
+def _response_field(router, path: str):
+    for route in router.routes:
+        if getattr(route, "path", None) == path:
+            return route.response_field
+    raise LookupError(path)
+
+
+def _via_response_model(field, content, response_class=None) -> bytes:
+    """Giống fastapi.routing.serialize_response (handler async)."""
+    value, errors = field.validate(content, {}, loc=("response",))
+    assert not errors, errors
+    if response_class is None:
+        return Response(field.serialize_json(value), media_type="application/json").body
+    return response_class(field.serialize(value)).body
+
+
+def main(number: int = 20000):
+    now = datetime.utcnow()
+    user = User(
+        id=42, email="bench@example.com", username="bench", full_name="Bench User",
+        is_active=True, is_superuser=False, created_at=now, updated_at=now,
+    )
+    token = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9." + "x" * 80 + "." + "y" * 43
+    login_field = _response_field(auth.router, "/login")
+    me_field = _response_field(users.router, "/me")
+
+    def login_token_response():
+        return auth.TokenResponse(access_token=token, token_type="bearer", user=user)
+
+    def login_payload():
+        return {"access_token": token, "token_type": "bearer", "user": user}
+
+    cases = {
+        "login  response_model": lambda: _via_response_model(login_field, login_token_response()),
+        "login  response_model + json": lambda: _via_response_model(login_field, login_token_response(), JSONResponse),
+        "login  dump_response": lambda: dump_response(auth.token_response_adapter, login_payload()).body,
+        "me     response_model": lambda: _via_response_model(me_field, user),
+        "me     response_model + json": lambda: _via_response_model(me_field, user, JSONResponse),
+        "me     dump_response": lambda: dump_response(user_adapter, user).body,
+    }
+    if orjson is not None:
+        cases["login  response_model + orjson"] = lambda: _via_response_model(login_field, login_token_response(), ORJSONResponse)
+        cases["me     response_model + orjson"] = lambda: _via_response_model(me_field, user, ORJSONResponse)
+
+    # Các cách phải ra cùng JSON
+    assert dump_response(user_adapter, user).body == _via_response_model(me_field, user)
+    assert dump_response(auth.token_response_adapter, login_payload()).body == _via_response_model(login_field, login_token_response())
+
+    print(f"{'case':<34}{'µs/op':>10}")
+    for name, fn in sorted(cases.items()):
+        seconds = min(timeit.repeat(fn, number=number, repeat=5))
+        print(f"{name:<34}{seconds / number * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
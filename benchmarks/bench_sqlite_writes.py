@@ -0,0 +1,90 @@
+"""Benchmark ghi đồng thời trên SQLite: engine mặc định so với engine đã tinh chỉnh (WAL + PRAGMA + pool).
+
+Mỗi giao dịch mô phỏng đăng ký: SELECT user theo email, INSERT user, ghi OTP vào state_entries, commit.
+Chạy: python -m benchmarks.bench_sqlite_writes [số giao dịch] [số request đồng thời]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+from app.core.config import get_settings
+from app.core.database import Base, install_sqlite_pragmas
+from app.models.state_entry import StateEntry
+from app.models.user import User
+
+settings = get_settings()
+
+
+def _default_engine(url: str) -> AsyncEngine:
+    """Engine như trước khi tinh chỉnh: journal mặc định, pool mặc định, không PRAGMA."""
+    return create_async_engine(url)
+
+
+def _tuned_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(
+        url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+    install_sqlite_pragmas(engine.sync_engine)
+    return engine
+
+
+async def _register(session_factory: async_sessionmaker, i: int):
+    email = f"bench{i}@example.com"
+    async with session_factory() as db:
+        await db.execute(select(User.id).where(User.email == email))
+        db.add(User(email=email, username=f"bench{i}", hashed_password="x"))
+        db.add(StateEntry(key=f"otp:activation:{email}", value="123456",
+                          expires_at=datetime.utcnow() + timedelta(seconds=90)))
+        await db.commit()
+
+
+async def run_case(name: str, engine: AsyncEngine, total: int, concurrency: int) -> dict:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    slots = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with slots:
+            try:
+                await _register(session_factory, i)
+            except OperationalError:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    ok = total - errors
+    return {"case": name, "ok": ok, "errors": errors, "seconds": elapsed, "tx_per_s": ok / elapsed}
+
+
+async def main(total: int = 2000, concurrency: int = 50):
+    tmp = tempfile.mkdtemp()
+    results = []
+    for name, factory in (("mặc định", _default_engine), ("WAL + PRAGMA + pool", _tuned_engine)):
+        url = f"sqlite+aiosqlite:///{os.path.join(tmp, name.split()[0] + '.db')}"
+        results.append(await run_case(name, factory(url), total, concurrency))
+
+    print(f"{total} giao dịch ghi, {concurrency} đồng thời")
+    print(f"{'case':<24}{'ok':>8}{'lỗi lock':>10}{'giây':>10}{'tx/s':>10}")
+    for r in results:
+        print(f"{r['case']:<24}{r['ok']:>8}{r['errors']:>10}{r['seconds']:>10.2f}{r['tx_per_s']:>10.0f}")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    asyncio.run(main(*args))
@@ -0,0 +1,48 @@
+"""Cấu hình chung cho pytest: database SQLite tạm, state store memory, bcrypt cost thấp.
+
+Biến môi trường được đặt một lần trong pytest_configure, trước khi module test nào import app
+(settings đọc lúc import). Test cần giá trị khác thì monkeypatch settings/đối tượng liên quan.
+"""
+import os
+import tempfile
+
+import pytest
+
+TEST_ENV = {
+    "DATABASE_REPLICA_URLS": "",
+    "STATE_STORE_BACKEND": "memory",
+    "RATE_LIMIT_BACKEND": "memory",
+    "PASSWORD_HASH_ROUNDS": "4",
+    "PASSWORD_HASH_TARGET_MS": "0",
+}
+
+
+def pytest_configure(config):
+    tmp = tempfile.mkdtemp(prefix="kebook-test-")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tmp, 'test.db')}"
+    os.environ.update(TEST_ENV)
+
+
+@pytest.fixture(scope="session")
+async def connected_database():
+    """Tạo bảng một lần cho cả phiên test, đóng engine khi xong."""
+    from app.core.database import database
+
+    await database.connect()
+    yield database
+    await database.disconnect()
+
+
+@pytest.fixture
+async def clean_db(connected_database):
+    """Database rỗng cho mỗi test: xóa dữ liệu mọi bảng (giữ schema) và cache user."""
+    from app.core.cache import user_cache
+    from app.core.database import Base, engine
+
+    async with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            if table.name != "schema_meta":
+                await conn.execute(table.delete())
+    user_cache.clear()
+    yield
+    user_cache.clear()
@@ -0,0 +1,126 @@
+"""Test admission control (app.core.admission): hàng chờ đầy thì từ chối ngay, chờ quá max_wait thì từ chối,
+request chờ bị hủy không làm mất slot, phân nhóm route và middleware trả 503 + Retry-After.
+Chạy: pytest test_admission.py
+"""
+import asyncio
+
+import pytest
+
+from app.core import admission, metrics
+from app.core.admission import AdmissionMiddleware, AdmissionPool
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+async def waiting(pool: AdmissionPool) -> asyncio.Task:
+    """Task đang xếp hàng chờ slot của pool."""
+    task = asyncio.create_task(pool.acquire())
+    await asyncio.sleep(0)
+    assert not task.done()
+    return task
+
+
+async def test_queue_full_rejected_immediately():
+    pool = AdmissionPool("test", max_concurrent=1, max_queue=1, max_wait=5)
+    assert await pool.acquire()
+    queued = await waiting(pool)
+    assert await pool.acquire() is False  # Không chờ: hàng chờ đã đầy
+    assert len(pool._waiters) == 1
+
+    # Trả slot: trao thẳng cho request chờ, active giữ nguyên
+    pool.release()
+    assert await queued is True
+    assert pool.active == 1 and not pool._waiters
+    pool.release()
+    assert pool.active == 0
+
+
+async def test_max_wait_timeout():
+    pool = AdmissionPool("test", max_concurrent=1, max_queue=4, max_wait=0.05)
+    assert await pool.acquire()
+    assert await asyncio.wait_for(pool.acquire(), 1) is False
+    assert pool.active == 1 and not pool._waiters
+    pool.release()
+    assert pool.active == 0
+    # Có slot trống thì lấy ngay
+    assert await pool.acquire()
+    pool.release()
+
+
+async def test_cancelled_waiter_does_not_take_slot():
+    pool = AdmissionPool("test", max_concurrent=1, max_queue=4, max_wait=5)
+    assert await pool.acquire()
+    queued = await waiting(pool)
+    queued.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+    assert not pool._waiters
+    pool.release()
+    assert pool.active == 0
+
+
+async def test_cancelled_after_grant_hands_slot_on():
+    pool = AdmissionPool("test", max_concurrent=1, max_queue=4, max_wait=5)
+    assert await pool.acquire()
+    first, second = await waiting(pool), await waiting(pool)
+    # Slot được trao cho first nhưng request bị hủy trước khi chạy tiếp: slot chuyển sang second
+    pool.release()
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert await second is True
+    assert pool.active == 1 and not pool._waiters
+    pool.release()
+    assert pool.active == 0
+
+
+def test_classify():
+    middleware = AdmissionMiddleware(app=None)
+    api = settings.API_V1_STR
+    auth, db = admission.pools["auth"], admission.pools["db"]
+    assert middleware.classify("POST", f"{api}/auth/login") is auth
+    assert middleware.classify("POST", f"{api}/users/") is auth
+    # Sửa user có thể đổi mật khẩu (bcrypt)
+    assert middleware.classify("PATCH", f"{api}/users/5") is auth
+    assert middleware.classify("GET", f"{api}/users/5") is db
+    assert middleware.classify("GET", f"{api}/users/") is db
+    assert middleware.classify("DELETE", f"{api}/users/5") is db
+    for path in ("/", "/kaithhealthcheck", "/metrics"):
+        assert middleware.classify("GET", path) is None
+
+
+async def test_middleware_sheds_with_503(monkeypatch):
+    pool = AdmissionPool("db", max_concurrent=1, max_queue=0, max_wait=5)
+    monkeypatch.setitem(admission.pools, "db", pool)
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", True)
+    started, finish = asyncio.Event(), asyncio.Event()
+
+    async def app(scope, receive, send):
+        started.set()
+        await finish.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def call() -> list[dict]:
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": f"{settings.API_V1_STR}/users/1", "headers": []}
+        await AdmissionMiddleware(app)(scope, None, send)
+        return messages
+
+    shed_before = metrics.admission_shed_total._values.get(("db",), 0)
+    running = asyncio.create_task(call())
+    await started.wait()
+    rejected = await call()
+    start = rejected[0]
+    assert start["status"] == 503
+    assert (b"retry-after", str(settings.ADMISSION_RETRY_AFTER_SECONDS).encode()) in start["headers"]
+    assert metrics.admission_shed_total._values[("db",)] == shed_before + 1
+
+    finish.set()
+    assert (await running)[0]["status"] == 200
+    assert pool.active == 0
@@ -0,0 +1,140 @@
+"""Test ghi hàng loạt của BaseRepository (create_many, update_many, upsert_many) trên SQLite tạm.
+
+Kiểm tra ID trả về đúng thứ tự input (kể cả khi chia chunk), create_many khi dialect không có RETURNING
+(MySQL: tra ID theo cột unique, không có thì INSERT từng dòng) và câu SELECT lấy ID của upsert_many
+trên MySQL (so sánh cả bộ giá trị, không trả dòng ngoài chunk).
+Chạy: pytest test_bulk_repository.py
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import mysql
+
+from app.core.cache import user_cache
+from app.core.database import PrimarySessionLocal, engine
+from app.models.email_outbox import EmailOutbox
+from app.models.user import User
+from app.repositories.base_repository import BaseRepository
+from app.repositories.user_repository import user_repository
+
+
+def user_row(name: str, **extra) -> dict:
+    return {"email": f"{name}@x.com", "username": name, "hashed_password": "x", **extra}
+
+
+async def usernames(ids: list[int]) -> list[str]:
+    async with PrimarySessionLocal() as db:
+        by_id = dict((await db.execute(select(User.id, User.username).where(User.id.in_(ids)))).all())
+    return [by_id[id] for id in ids]
+
+
+@pytest.fixture
+async def ids(clean_db) -> list[int]:
+    """7 user c6..c0 tạo qua create_many (chia chunk 3), ID theo thứ tự input."""
+    async with PrimarySessionLocal() as db:
+        # Chèn trước vài dòng để ID không trùng vị trí trong input
+        await user_repository.create_many(db, [user_row("seed0"), user_row("seed1")])
+        ids = await user_repository.create_many(db, [user_row(f"c{i}") for i in reversed(range(7))], chunk_size=3)
+        await db.commit()
+    return ids
+
+
+async def test_create_many(ids: list[int]):
+    assert len(ids) == 7 and len(set(ids)) == 7
+    assert await usernames(ids) == [f"c{i}" for i in reversed(range(7))], ids
+    async with PrimarySessionLocal() as db:
+        assert await user_repository.create_many(db, []) == []
+
+
+@pytest.fixture
+def no_returning(monkeypatch):
+    """Giả lập dialect không có INSERT ... RETURNING (như MySQL): create_many đi nhánh lastrowid/SELECT lại."""
+    monkeypatch.setattr(engine.dialect, "insert_executemany_returning", False)
+
+
+async def test_create_many_without_returning(ids: list[int], no_returning):
+    async with PrimarySessionLocal() as db:
+        assert user_repository._unique_key([user_row("a")]) == ("email",)
+        # Xóa một dòng ở giữa để dãy ID có khoảng trống, rồi tạo xen kẽ: ID tra lại theo email
+        await db.execute(User.__table__.delete().where(User.id == ids[3]))
+        created = await user_repository.create_many(db, [user_row(f"m{i}") for i in range(5)], chunk_size=2)
+        await db.commit()
+    assert await usernames(created) == [f"m{i}" for i in range(5)], created
+
+    # Model không có cột unique (email_outbox): INSERT từng dòng, ID từ lastrowid
+    outbox = BaseRepository(EmailOutbox)
+    rows = [{"email": f"o{i}@x.com", "email_type": "activation", "otp_code": str(i) * 6} for i in range(3)]
+    assert outbox._unique_key(rows) is None
+    async with PrimarySessionLocal() as db:
+        outbox_ids = await outbox.create_many(db, rows, chunk_size=2)
+        await db.commit()
+        by_id = dict((await db.execute(select(EmailOutbox.id, EmailOutbox.email))).all())
+    assert [by_id[id] for id in outbox_ids] == [row["email"] for row in rows]
+
+
+async def test_update_many(ids: list[int]):
+    user_cache.set(ids[0], {"id": ids[0]})
+    async with PrimarySessionLocal() as db:
+        updated = await user_repository.update_many(
+            db, [{"id": id, "full_name": f"Full {id}"} for id in ids], chunk_size=4
+        )
+        assert user_cache.get(ids[0]) is None
+        # Request khác nạp lại bản cũ trước khi commit: bị xóa lần nữa sau commit
+        user_cache.set(ids[0], {"id": ids[0]})
+        await db.commit()
+    assert updated == ids
+    assert user_cache.get(ids[0]) is None
+    async with PrimarySessionLocal() as db:
+        names = dict((await db.execute(select(User.id, User.full_name).where(User.id.in_(ids)))).all())
+    assert all(names[id] == f"Full {id}" for id in ids), names
+
+
+async def test_upsert_many(ids: list[int]):
+    async with PrimarySessionLocal() as db:
+        before = {
+            row.id: row.updated_at
+            for row in (await db.execute(select(User).where(User.id.in_(ids)))).scalars()
+        }
+    await asyncio.sleep(0.01)
+    # Xen kẽ dòng mới và dòng đã có (trùng email), thứ tự khác thứ tự ID
+    existing = await usernames(ids)
+    rows = []
+    for i, name in enumerate(existing[:3]):
+        rows.append(user_row(f"new{i}", full_name=f"New {i}"))
+        rows.append(user_row(name, full_name=f"Upserted {name}"))
+    async with PrimarySessionLocal() as db:
+        result = await user_repository.upsert_many(db, rows, conflict_columns=["email"], chunk_size=4)
+        await db.commit()
+    assert len(result) == len(rows)
+    assert await usernames(result) == [row["username"] for row in rows], result
+    assert result[1::2] == ids[:3]
+    async with PrimarySessionLocal() as db:
+        users = {u.id: u for u in (await db.execute(select(User).where(User.id.in_(result)))).scalars()}
+    for id, row in zip(result, rows):
+        assert users[id].full_name == row["full_name"]
+    for id in ids[:3]:
+        assert users[id].updated_at != before[id], "updated_at phải được cập nhật khi trùng"
+    async with PrimarySessionLocal() as db:
+        assert await user_repository.upsert_many(db, [], conflict_columns=["email"]) == []
+
+
+async def test_select_ids_by_keys(clean_db):
+    # (a, ub) và (b, ua) không phải dòng nào; IN riêng từng cột sẽ trả cả hai user a và b
+    async with PrimarySessionLocal() as db:
+        await user_repository.create_many(db, [user_row("ua"), user_row("ub")])
+        await db.commit()
+    keys = [("ua@x.com", "ub"), ("ub@x.com", "ua")]
+    stmt = user_repository._select_ids_by_keys(["email", "username"], keys)
+    compiled = str(stmt.compile(dialect=mysql.dialect()))
+    assert "(users.email, users.username) IN" in compiled, compiled
+    async with PrimarySessionLocal() as db:
+        assert (await db.execute(stmt)).all() == []
+        found = (await db.execute(user_repository._select_ids_by_keys(["email", "username"], [("ua@x.com", "ua")]))).all()
+    assert [row[1:] for row in found] == [("ua@x.com", "ua")]
+    # Collation không phân biệt hoa thường (MySQL): giá trị lưu khác hoa thường vẫn khớp đúng dòng
+    assert user_repository._ids_in_order([("A@x.com",), ("b@x.com",)], [(2, "b@x.com"), (1, "a@x.com")]) == [1, 2]
+    # Dòng không tìm thấy: lỗi nói rõ khóa nào
+    with pytest.raises(LookupError, match="c@x.com"):
+        user_repository._ids_in_order([("a@x.com",), ("c@x.com",)], [(1, "a@x.com")])
+
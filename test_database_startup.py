@@ -0,0 +1,99 @@
+"""Test khởi động database (app.core.database.Database) trên file SQLite riêng: connect bỏ qua DDL khi fingerprint
+schema trùng bản đã lưu, chạy lại khi model đổi; prewarm mở đúng số kết nối.
+Chạy: pytest test_database_startup.py
+"""
+import pytest
+from sqlalchemy import Column, Index, Integer, MetaData, Table, inspect, select
+
+from app.core import database as database_module
+from app.core.database import Base, Database, _create_engine, schema_fingerprint
+from app.models.schema_meta import SchemaMeta
+from app.models.user import User
+
+
+@pytest.fixture
+async def fresh(tmp_path) -> Database:
+    """Database trỏ vào file SQLite mới (chưa có bảng)."""
+    db = Database()
+    db.engine = _create_engine(f"sqlite+aiosqlite:///{tmp_path / 'startup.db'}")
+    yield db
+    await db.engine.dispose()
+
+
+async def stored_fingerprint(db: Database) -> str:
+    async with db.engine.connect() as conn:
+        return (await conn.execute(select(SchemaMeta.fingerprint))).scalar_one()
+
+
+@pytest.fixture
+def metadata():
+    """Metadata của model; bảng/index test thêm vào được gỡ lại sau test."""
+    users = User.__table__
+    indexes = set(users.indexes)
+    tables = set(Base.metadata.tables)
+    yield Base.metadata
+    users.indexes.intersection_update(indexes)
+    for name in set(Base.metadata.tables) - tables:
+        Base.metadata.remove(Base.metadata.tables[name])
+
+
+async def test_connect_skips_ddl_when_fingerprint_matches(fresh: Database):
+    assert await fresh.connect() is True
+    async with fresh.engine.connect() as conn:
+        tables = set(await conn.run_sync(lambda c: inspect(c).get_table_names()))
+    assert {table.name for table in Base.metadata.sorted_tables} <= tables
+    assert await stored_fingerprint(fresh) == schema_fingerprint(Base.metadata, fresh.engine.dialect)
+
+    assert await fresh.connect() is False
+    # Process khác (engine khác) khởi động trên cùng file cũng bỏ qua
+    other = Database()
+    other.engine = _create_engine(fresh.engine.url.render_as_string(hide_password=False))
+    try:
+        assert await other.connect() is False
+    finally:
+        await other.engine.dispose()
+
+
+async def test_connect_reruns_ddl_after_model_change(fresh: Database, metadata: MetaData):
+    assert await fresh.connect() is True
+    before = await stored_fingerprint(fresh)
+
+    # Thêm bảng mới: fingerprint đổi, create_all chạy lại và tạo bảng
+    Table("startup_test", metadata, Column("id", Integer, primary_key=True))
+    assert await fresh.connect() is True
+    async with fresh.engine.connect() as conn:
+        assert await conn.run_sync(lambda c: inspect(c).has_table("startup_test"))
+    changed = await stored_fingerprint(fresh)
+    assert changed != before
+    assert await fresh.connect() is False
+
+    # Thêm index vào bảng đã có cũng đổi fingerprint (create_all chạy lại, index phải tạo tay, xem README)
+    Index("ix_users_full_name_test", User.__table__.c.full_name)
+    assert await fresh.connect() is True
+    assert await stored_fingerprint(fresh) != changed
+    assert await fresh.connect() is False
+
+
+async def test_connect_without_fingerprint_always_runs_ddl(fresh: Database, monkeypatch):
+    monkeypatch.setattr(database_module.settings, "DB_SCHEMA_FINGERPRINT", False)
+    assert await fresh.connect() is True
+    assert await fresh.connect() is True
+
+
+async def test_prewarm(fresh: Database):
+    pool = fresh.engine.pool
+    assert await fresh.prewarm(0) == 0
+    assert await fresh.prewarm(2) == 2
+    assert pool.checkedin() == 2 and pool.checkedout() == 0
+    # Không mở quá pool_size
+    assert await fresh.prewarm(pool.size() + 10) == pool.size()
+    assert pool.checkedin() == pool.size()
+
+
+async def test_prewarm_skips_static_pool():
+    db = Database()
+    db.engine = _create_engine("sqlite+aiosqlite:///:memory:")
+    try:
+        assert await db.prewarm(2) == 0
+    finally:
+        await db.engine.dispose()
@@ -0,0 +1,97 @@
+"""Test DataLoader: gộp load() cùng vòng event loop thành một batch, bỏ key trùng, nhớ kết quả,
+lỗi không được nhớ (load lại thì thử lại); loader user của request chạy một IN query trên SQLite tạm.
+Chạy: pytest test_dataloader.py
+"""
+import asyncio
+
+from sqlalchemy import event
+
+from app.api.dependencies import get_user_loader
+from app.core.database import AsyncSessionLocal, PrimarySessionLocal, engine
+from app.core.dataloader import DataLoader
+from app.models.user import User
+
+
+class FakeSource:
+    """batch_fn giả: ghi lại các batch nhận được, có thể cho lỗi lần gọi kế tiếp."""
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.calls: list[list] = []
+        self.fail_next = False
+
+    async def __call__(self, keys: list) -> dict:
+        self.calls.append(list(keys))
+        await asyncio.sleep(0)
+        if self.fail_next:
+            self.fail_next = False
+            raise RuntimeError("database down")
+        return {key: self.data[key] for key in keys if key in self.data}
+
+
+async def test_batches_same_tick():
+    source = FakeSource({1: "a", 2: "b", 3: "c"})
+    loader = DataLoader(source)
+
+    async def resolve(key):
+        return await loader.load(key)
+
+    # Các coroutine chạy cùng vòng event loop, mỗi cái load() một key → một batch
+    results = await asyncio.gather(resolve(1), resolve(2), resolve(3), resolve(1))
+    assert results == ["a", "b", "c", "a"], results
+    assert source.calls == [[1, 2, 3]] and loader.batches == 1, source.calls
+
+
+async def test_dedup_cache_and_missing():
+    source = FakeSource({1: "a", 2: "b"})
+    loader = DataLoader(source)
+    assert await loader.load_many([2, 1, 2, 99, 1]) == ["b", "a", "b", None, "a"]
+    assert source.calls == [[2, 1, 99]]
+    # Đã load (kể cả key không tìm thấy): nhớ kết quả, không gọi batch lại
+    assert await loader.load_many([1, 99]) == ["a", None]
+    # Chỉ key mới vào batch kế tiếp
+    source.data[3] = "c"
+    assert await loader.load_many([3, 2]) == ["c", "b"]
+    assert source.calls == [[2, 1, 99], [3]] and loader.batches == 2, source.calls
+
+
+async def test_error_fails_batch_then_retries():
+    source = FakeSource({1: "a", 2: "b"})
+    loader = DataLoader(source)
+    assert await loader.load(2) == "b"
+    source.fail_next = True
+    results = await asyncio.gather(loader.load(1), loader.load(3), loader.load(2), return_exceptions=True)
+    # Cả batch lỗi; key đã load xong trước đó vẫn trả kết quả nhớ
+    assert isinstance(results[0], RuntimeError) and isinstance(results[1], RuntimeError), results
+    assert results[2] == "b"
+    assert source.calls == [[2], [1, 3]]
+    # Lỗi không được nhớ: load lại thì chạy batch mới
+    assert await loader.load_many([1, 3]) == ["a", None]
+    assert source.calls == [[2], [1, 3], [1, 3]] and loader.batches == 3, source.calls
+
+
+async def test_user_loader_single_query(clean_db):
+    async with PrimarySessionLocal() as db:
+        users = [User(email=f"u{i}@x.com", username=f"u{i}", hashed_password="x") for i in range(3)]
+        db.add_all(users)
+        await db.commit()
+    ids = [user.id for user in users]
+
+    selects: list[str] = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if "FROM users" in statement:
+            selects.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    try:
+        async with AsyncSessionLocal() as db:
+            loader = await get_user_loader(db)
+            loaded = await loader.load_many([ids[2], ids[0], 999999, ids[2]])
+            again = await loader.load(ids[0])
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+    assert [user and user.username for user in loaded] == ["u2", "u0", None, "u2"]
+    assert again is loaded[1]
+    assert len(selects) == 1 and " IN " in selects[0], selects
+
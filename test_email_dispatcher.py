@@ -0,0 +1,144 @@
+"""Test EmailDispatcher trên SQLite tạm, email_service thay bằng bản giả (không gửi SMTP).
+
+Kiểm tra: không giữ kết nối DB trong lúc gửi, worker hết lease không ghi đè email đã bị nhận lại,
+retry/dead-letter xóa mã OTP, email có OTP hết hạn không được gửi, purge_dead xóa dead-letter cũ.
+Chạy: pytest test_email_dispatcher.py
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app.core.config import get_settings
+from app.core.database import PrimarySessionLocal, engine
+from app.models.email_outbox import EmailOutbox, OutboxStatus
+from app.services import email_dispatcher as dispatcher_module
+from app.services.email_dispatcher import EmailDispatcher
+
+settings = get_settings()
+
+
+class FakeEmailService:
+    """Ghi lại email đã gửi; fail=True thì báo lỗi; hook chạy trong lúc "gửi"."""
+
+    def __init__(self):
+        self.sent: list[tuple[str, str]] = []
+        self.fail = False
+        self.hook = None
+
+    async def send_otp_email(self, email: str, otp_code: str, email_type: str) -> bool:
+        if self.hook is not None:
+            await self.hook()
+        if self.fail:
+            raise RuntimeError("SMTP lỗi")
+        self.sent.append((email, otp_code))
+        return True
+
+
+async def enqueue(email: str, created_at: datetime | None = None) -> int:
+    async with PrimarySessionLocal() as db:
+        item = EmailDispatcher.enqueue_otp(db, email, "123456", "activation")
+        if created_at is not None:
+            item.created_at = created_at
+        await db.commit()
+        return item.id
+
+
+async def rows() -> dict[int, EmailOutbox]:
+    async with PrimarySessionLocal() as db:
+        return {row.id: row for row in (await db.execute(select(EmailOutbox))).scalars()}
+
+
+@pytest.fixture
+def service(monkeypatch) -> FakeEmailService:
+    """email_service giả cho dispatcher; tối đa 2 lần gửi trước khi dead-letter."""
+    service = FakeEmailService()
+    monkeypatch.setattr(dispatcher_module, "email_service", service)
+    monkeypatch.setattr(dispatcher_module.settings, "EMAIL_OUTBOX_MAX_ATTEMPTS", 2)
+    return service
+
+
+@pytest.fixture
+def dispatcher(clean_db, service) -> EmailDispatcher:
+    return EmailDispatcher()
+
+
+async def test_no_connection_held_while_sending(dispatcher: EmailDispatcher, service: FakeEmailService):
+    await enqueue("a@x.com")
+    checked_out = []
+
+    async def hook():
+        checked_out.append(engine.pool.checkedout())
+
+    service.hook = hook
+    assert await dispatcher.dispatch_once(PrimarySessionLocal) == 1
+    service.hook = None
+    assert checked_out == [0], checked_out
+    assert service.sent == [("a@x.com", "123456")] and await rows() == {}
+
+
+async def test_stale_worker_does_not_overwrite(dispatcher: EmailDispatcher, service: FakeEmailService):
+    item_id = await enqueue("b@x.com")
+
+    async def reclaimed_by_other_worker():
+        # Lease hết hạn trong lúc gửi: worker khác nhận lại email (claim_token mới)
+        async with PrimarySessionLocal() as db:
+            await db.execute(update(EmailOutbox).where(EmailOutbox.id == item_id).values(claim_token="other"))
+            await db.commit()
+
+    for fail in (False, True):
+        service.hook, service.fail = reclaimed_by_other_worker, fail
+        await dispatcher.dispatch_once(PrimarySessionLocal)
+        row = (await rows())[item_id]
+        assert row.claim_token == "other" and row.status == OutboxStatus.SENDING and row.attempts == 0, row.__dict__
+        # Trả về trạng thái chờ gửi cho lượt sau
+        async with PrimarySessionLocal() as db:
+            await db.execute(
+                update(EmailOutbox).where(EmailOutbox.id == item_id)
+                .values(status=OutboxStatus.PENDING, claim_token=None, next_attempt_at=datetime.utcnow())
+            )
+            await db.commit()
+
+
+async def test_retry_then_dead_letter(dispatcher: EmailDispatcher, service: FakeEmailService):
+    item_id = await enqueue("c@x.com")
+    service.fail = True
+    await dispatcher.dispatch_once(PrimarySessionLocal)
+    row = (await rows())[item_id]
+    assert row.status == OutboxStatus.PENDING and row.attempts == 1 and row.otp_code == "123456"
+    assert row.next_attempt_at > datetime.utcnow()
+
+    async with PrimarySessionLocal() as db:
+        await db.execute(update(EmailOutbox).values(next_attempt_at=datetime.utcnow()))
+        await db.commit()
+    await dispatcher.dispatch_once(PrimarySessionLocal)
+    row = (await rows())[item_id]
+    assert row.status == OutboxStatus.DEAD and row.attempts == 2, row.__dict__
+    assert row.otp_code == "" and row.claim_token is None and row.last_error == "SMTP lỗi"
+
+
+async def test_expired_otp_not_sent(dispatcher: EmailDispatcher, service: FakeEmailService):
+    old = datetime.utcnow() - timedelta(seconds=settings.OTP_EXPIRE_SECONDS + 1)
+    expired_id = await enqueue("d@x.com", created_at=old)
+    await enqueue("e@x.com")
+    assert await dispatcher.dispatch_once(PrimarySessionLocal) == 2
+    assert service.sent == [("e@x.com", "123456")], service.sent
+    remaining = await rows()
+    assert list(remaining) == [expired_id]
+    assert remaining[expired_id].status == OutboxStatus.DEAD and remaining[expired_id].otp_code == ""
+
+
+async def test_purge_dead(dispatcher: EmailDispatcher):
+    keep_id = await enqueue("f@x.com")
+    purge_id = await enqueue("g@x.com")
+    retention = timedelta(seconds=settings.EMAIL_OUTBOX_DEAD_RETENTION_SECONDS)
+    async with PrimarySessionLocal() as db:
+        for item_id, dead_since in ((keep_id, datetime.utcnow()), (purge_id, datetime.utcnow() - retention - timedelta(minutes=1))):
+            await db.execute(
+                update(EmailOutbox).where(EmailOutbox.id == item_id)
+                .values(status=OutboxStatus.DEAD, next_attempt_at=dead_since)
+            )
+        await db.commit()
+    assert await dispatcher.purge_dead(PrimarySessionLocal) == 1
+    assert list(await rows()) == [keep_id]
+
@@ -0,0 +1,73 @@
+"""Test HTTP conditional GET (app.core.http_cache): ETag yếu, so khớp If-None-Match,
+If-Modified-Since theo Last-Modified, If-None-Match được ưu tiên hơn If-Modified-Since.
+Chạy: pytest test_http_cache.py
+"""
+from datetime import datetime, timedelta
+
+from fastapi import Request
+
+from app.core.http_cache import cache_headers, etag_matches, is_not_modified, resource_etag
+
+UPDATED_AT = datetime(2024, 5, 1, 8, 30, 15, 123456)  # updated_at lưu naive theo UTC
+
+
+def request(**headers: str) -> Request:
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def http_date(value: datetime) -> str:
+    return value.strftime("%a, %d %b %Y %H:%M:%S GMT")
+
+
+def test_resource_etag_and_headers():
+    etag = resource_etag(7, UPDATED_AT)
+    assert etag.startswith('W/"7-') and etag.endswith('"'), etag
+    # Đổi 1 micro giây cũng đổi ETag; không có updated_at → phiên bản 0
+    assert resource_etag(7, UPDATED_AT + timedelta(microseconds=1)) != etag
+    assert resource_etag(8, UPDATED_AT) != etag
+    assert resource_etag(7, None) == 'W/"7-0"'
+
+    headers = cache_headers(etag, UPDATED_AT, "private, max-age=0")
+    assert headers == {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=0",
+        "Last-Modified": "Wed, 01 May 2024 08:30:15 GMT",
+    }, headers
+    assert "Last-Modified" not in cache_headers(etag, None, "no-cache")
+
+
+def test_etag_matches():
+    etag = resource_etag(7, UPDATED_AT)
+    strong = etag.removeprefix("W/")
+    assert etag_matches(etag, etag)
+    assert etag_matches(strong, etag)  # So khớp yếu: bỏ W/ hai phía
+    assert etag_matches(etag, strong)
+    assert etag_matches(" * ", etag)
+    assert etag_matches(f'"other", {etag} ,W/"x"', etag)
+    assert not etag_matches('"other", W/"7-0"', etag)
+    assert not etag_matches(etag.replace("7-", "70-"), etag)
+    assert not etag_matches("", etag)
+
+
+def test_is_not_modified():
+    etag = resource_etag(7, UPDATED_AT)
+    headers = cache_headers(etag, UPDATED_AT, "private, max-age=0")
+    same_second = http_date(UPDATED_AT)  # Last-Modified chỉ tới giây
+    later = http_date(UPDATED_AT + timedelta(hours=1))
+    earlier = http_date(UPDATED_AT - timedelta(seconds=1))
+
+    assert not is_not_modified(request(), headers)
+    assert is_not_modified(request(if_none_match=etag), headers)
+    assert not is_not_modified(request(if_none_match='W/"7-0"'), headers)
+
+    # Chỉ If-Modified-Since: so với Last-Modified
+    assert is_not_modified(request(if_modified_since=same_second), headers)
+    assert is_not_modified(request(if_modified_since=later), headers)
+    assert not is_not_modified(request(if_modified_since=earlier), headers)
+    assert not is_not_modified(request(if_modified_since="không phải ngày"), headers)
+    assert not is_not_modified(request(if_modified_since=later), cache_headers(etag, None, "no-cache"))
+
+    # Có If-None-Match thì bỏ qua If-Modified-Since (cả hai chiều)
+    assert not is_not_modified(request(if_none_match='"stale"', if_modified_since=later), headers)
+    assert is_not_modified(request(if_none_match=etag, if_modified_since=earlier), headers)
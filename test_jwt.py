@@ -0,0 +1,134 @@
+"""Test JWTCodec (HS256 tự viết, cache token đã verify): tương thích python-jose và các token phải bị từ chối
+(sửa chữ ký/payload, alg khác HS256, hết hạn kể cả khi đã nằm trong cache, nbf, payload không phải object,
+token sai định dạng).
+Chạy: pytest test_jwt.py
+"""
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from jose import jwt as jose_jwt
+from jose.exceptions import ExpiredSignatureError, JWTClaimsError, JWTError
+
+from app.core import security
+from app.core.security import JWTCodec, _b64encode, create_access_token, decode_access_token
+
+SECRET = "test-secret"
+
+
+@pytest.fixture
+def codec() -> JWTCodec:
+    return JWTCodec(SECRET, cache_size=100, cache_ttl=300)
+
+
+@pytest.fixture
+def clock(monkeypatch) -> SimpleNamespace:
+    """Đồng hồ giả cho decode (security.time.time)."""
+    clock = SimpleNamespace(now=time.time())
+    monkeypatch.setattr(security, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def signed(codec: JWTCodec, payload, header: dict | None = None) -> str:
+    """Token có chữ ký đúng với payload bất kỳ (kể cả không phải object JSON)."""
+    header_b64 = _b64encode(json.dumps(header or {"alg": "HS256", "typ": "JWT"}).encode())
+    body_b64 = _b64encode(json.dumps(payload).encode())
+    signing_input = header_b64 + b"." + body_b64
+    return (signing_input + b"." + _b64encode(codec._sign(signing_input))).decode()
+
+
+def test_round_trip_and_jose_compatibility(codec: JWTCodec):
+    claims = {"sub": "42", "exp": int(time.time()) + 60, "scope": ["a", "b"]}
+    token = codec.encode(claims)
+    assert codec.decode(token) == claims
+    assert jose_jwt.decode(token, SECRET, algorithms=["HS256"]) == claims
+    # Token do jose ký (thứ tự header khác) vẫn decode được
+    other = jose_jwt.encode({"sub": "7", "exp": int(time.time()) + 60}, SECRET, algorithm="HS256")
+    assert codec.decode(other)["sub"] == "7"
+
+
+def test_access_token_helpers():
+    token = create_access_token({"sub": "alice"})
+    payload = decode_access_token(token)
+    assert payload["sub"] == "alice" and payload["exp"] > time.time()
+
+
+def test_tampered_tokens_rejected(codec: JWTCodec):
+    token = codec.encode({"sub": "1", "exp": int(time.time()) + 60})
+    header, body, signature = token.split(".")
+    flipped = signature[:-2] + ("A" if signature[-2] != "A" else "B") + signature[-1]
+    forged_body = _b64encode(json.dumps({"sub": "admin", "exp": int(time.time()) + 60}).encode()).decode()
+    foreign = JWTCodec("other-secret").encode({"sub": "1", "exp": int(time.time()) + 60})
+    for bad in (f"{header}.{body}.{flipped}", f"{header}.{forged_body}.{signature}", foreign):
+        with pytest.raises(JWTError):
+            codec.decode(bad)
+    assert codec.cache.stats()["size"] == 0  # Token lỗi không được cache
+
+
+def test_other_algorithms_rejected(codec: JWTCodec):
+    payload = {"sub": "1", "exp": int(time.time()) + 60}
+    none_header = _b64encode(json.dumps({"alg": "none", "typ": "JWT"}).encode()).decode()
+    body = _b64encode(json.dumps(payload).encode()).decode()
+    for bad in (
+        f"{none_header}.{body}.",
+        jose_jwt.encode(payload, SECRET, algorithm="HS512"),
+        signed(codec, payload, header={"alg": "HS512", "typ": "JWT"}),
+    ):
+        with pytest.raises(JWTError):
+            codec.decode(bad)
+
+
+def test_expired(codec: JWTCodec, clock: SimpleNamespace):
+    with pytest.raises(ExpiredSignatureError):
+        codec.decode(codec.encode({"sub": "1", "exp": int(clock.now) - 1}))
+
+    # Đã verify (nằm trong cache) rồi hết hạn: vẫn bị từ chối và bị xóa khỏi cache
+    token = codec.encode({"sub": "1", "exp": int(clock.now) + 10})
+    assert codec.decode(token)["sub"] == "1"
+    assert codec.decode(token)["sub"] == "1"
+    assert codec.cache.stats()["size"] == 1
+    clock.now += 11
+    with pytest.raises(ExpiredSignatureError):
+        codec.decode(token)
+    assert codec.cache.stats()["size"] == 0
+    with pytest.raises(ExpiredSignatureError):
+        codec.decode(token)
+
+    with pytest.raises(JWTClaimsError):
+        codec.decode(signed(codec, {"sub": "1", "exp": "tomorrow"}))
+
+
+def test_not_before(codec: JWTCodec, clock: SimpleNamespace):
+    future = codec.encode({"sub": "1", "nbf": int(clock.now) + 30})
+    with pytest.raises(JWTClaimsError):
+        codec.decode(future)
+    assert codec.cache.stats()["size"] == 0
+    clock.now += 31
+    assert codec.decode(future)["sub"] == "1"
+    with pytest.raises(JWTClaimsError):
+        codec.decode(signed(codec, {"sub": "1", "nbf": "now"}))
+
+
+def test_non_object_payload_rejected(codec: JWTCodec):
+    for payload in ([1, 2], "sub", 42, None):
+        with pytest.raises(JWTError):
+            codec.decode(signed(codec, payload))
+
+
+def test_malformed_tokens_rejected(codec: JWTCodec):
+    valid = codec.encode({"sub": "1"})
+    header, body, signature = valid.split(".")
+    for bad in (
+        "",
+        "abc",
+        "a.b",
+        f"{valid}.extra",
+        f"{header}.{body}",
+        f"{header}.!!!.{signature}",
+        f"{_b64encode(b'not json').decode()}.{body}.{signature}",
+        f"{_b64encode(b'[1]').decode()}.{body}.{signature}",
+        f"{header}.{_b64encode(b'not json').decode()}.{signature}",
+    ):
+        with pytest.raises(JWTError):
+            codec.decode(bad)
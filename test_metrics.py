@@ -0,0 +1,133 @@
+"""Test metrics (app.core.metrics): text format Prometheus của Counter/Histogram/GaugeFunc, endpoint /metrics
+và tách thời gian bcrypt khỏi thời gian chờ pool hash.
+Chạy: pytest test_metrics.py
+"""
+import asyncio
+import re
+import time
+
+import httpx
+import pytest
+
+from app.core import metrics
+from app.core.security import PasswordHasher
+
+# Dòng sample: tên{label="giá trị",...} số
+LABEL = r'[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*"'
+SAMPLE = re.compile(rf"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{{{LABEL}(?:,{LABEL})*\}})? (\S+)$")
+
+
+@pytest.fixture
+def registry(monkeypatch) -> metrics.Registry:
+    """Registry riêng để metric tạo trong test không lẫn vào /metrics của app."""
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, "registry", registry)
+    return registry
+
+
+def test_counter_format(registry: metrics.Registry):
+    counter = metrics.Counter("test_requests_total", "Số request", ("method", "status"))
+    counter.inc("GET", "200")
+    counter.inc("GET", "200", amount=2)
+    counter.inc("POST", 'a"b\\c\nd')
+    assert registry.render() == (
+        "# HELP test_requests_total Số request\n"
+        "# TYPE test_requests_total counter\n"
+        'test_requests_total{method="GET",status="200"} 3\n'
+        'test_requests_total{method="POST",status="a\\"b\\\\c\\nd"} 1\n'
+    )
+
+
+def test_histogram_format(registry: metrics.Registry):
+    histogram = metrics.Histogram("test_seconds", "Thời gian", ("op",), buckets=(0.5, 0.1, 1.0))
+    for value in (0.05, 0.1, 0.7, 3.0):
+        histogram.observe(value, "hash")
+    assert registry.render().splitlines() == [
+        "# HELP test_seconds Thời gian",
+        "# TYPE test_seconds histogram",
+        # Bucket sắp tăng dần, đếm cộng dồn, le=0.1 tính cả giá trị bằng đúng 0.1
+        'test_seconds_bucket{op="hash",le="0.1"} 2',
+        'test_seconds_bucket{op="hash",le="0.5"} 2',
+        'test_seconds_bucket{op="hash",le="1.0"} 3',
+        'test_seconds_bucket{op="hash",le="+Inf"} 4',
+        'test_seconds_sum{op="hash"} 3.85',
+        'test_seconds_count{op="hash"} 4',
+    ]
+
+
+def test_gauge_func_format(registry: metrics.Registry):
+    metrics.GaugeFunc("test_plain", "Không label", lambda: 7)
+    metrics.GaugeFunc("test_pool", "Theo pool", lambda: {("auth",): 1, ("db",): 2.5}, ("pool",))
+    metrics.GaugeFunc("test_none", "Chưa có giá trị", lambda: None)
+    metrics.GaugeFunc("test_broken", "Lỗi khi đọc", lambda: 1 / 0)
+    metrics.CounterFunc("test_hits_total", "Counter đọc lúc scrape", lambda: 5)
+    assert registry.render().splitlines() == [
+        "# HELP test_plain Không label",
+        "# TYPE test_plain gauge",
+        "test_plain 7",
+        "# HELP test_pool Theo pool",
+        "# TYPE test_pool gauge",
+        'test_pool{pool="auth"} 1',
+        'test_pool{pool="db"} 2.5',
+        # Không có giá trị hoặc lỗi: chỉ bỏ sample, scrape không hỏng
+        "# HELP test_none Chưa có giá trị",
+        "# TYPE test_none gauge",
+        "# HELP test_broken Lỗi khi đọc",
+        "# TYPE test_broken gauge",
+        "# HELP test_hits_total Counter đọc lúc scrape",
+        "# TYPE test_hits_total counter",
+        "test_hits_total 5",
+    ]
+
+
+async def test_metrics_endpoint():
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        assert (await client.get("/api/v1/users/5")).status_code == 401
+        response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+    types: dict[str, str] = {}
+    labels: dict[str, set[str]] = {}
+    for line in response.text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert name not in types, f"TYPE trùng: {name}"
+            types[name] = kind
+            continue
+        if line.startswith("# HELP "):
+            continue
+        match = SAMPLE.match(line)
+        assert match, f"Dòng sai định dạng: {line!r}"
+        name, label_text, value = match.groups()
+        float(value)
+        base = re.sub(r"_(bucket|sum|count)$", "", name) if name not in types else name
+        assert base in types, f"Sample không có TYPE: {line!r}"
+        labels.setdefault(base, set()).update(re.findall(r'([a-zA-Z_]\w*)="', label_text or ""))
+
+    assert types["http_requests_total"] == "counter"
+    assert types["http_request_duration_seconds"] == "histogram"
+    assert types["password_hash_seconds"] == types["password_hash_queue_seconds"] == "histogram"
+    assert types["admission_active"] == "gauge"
+    assert labels["http_requests_total"] == {"method", "route", "status"}
+    assert labels["http_request_duration_seconds"] == {"method", "route", "le"}
+    # Route template, không phải path thật
+    assert 'http_requests_total{method="GET",route="/api/v1/users/{user_id}",status="401"}' in response.text
+
+
+async def test_hash_time_excludes_queue_wait():
+    hasher = PasswordHasher("thread", max_workers=1, max_queue=4)
+    try:
+        # Một worker, hai lần "hash" 0.1 giây: lần sau chờ ~0.1 giây trong hàng
+        await asyncio.gather(*(hasher.run_timed("test", time.sleep, 0.1) for _ in range(2)))
+    finally:
+        hasher.shutdown()
+
+    hashed = metrics.password_hash_seconds._children[("test",)]
+    queued = metrics.password_hash_queue_seconds._children[("test",)]
+    assert hashed.count == queued.count == 2
+    assert 0.2 <= hashed.sum < 0.3  # Chỉ thời gian chạy: 2 × 0.1
+    assert 0.08 <= queued.sum < 0.2  # Lần thứ hai chờ lần đầu xong
@@ -0,0 +1,129 @@
+"""Test phân trang keyset bằng cursor: encode/decode_page_cursor (cursor bị sửa hoặc ký bằng key khác bị từ chối),
+BaseRepository.get_page (thứ tự theo ID, lọc is_active qua nhiều trang, trang cuối next=None)
+và GET /api/v1/users/ (cursor sai → 400).
+Chạy: pytest test_pagination.py
+"""
+import httpx
+import pytest
+from sqlalchemy import insert
+
+from app.core import security
+from app.core.database import AsyncSessionLocal, engine
+from app.core.security import JWTCodec, create_access_token, decode_page_cursor, encode_page_cursor
+from app.models.user import User
+from app.repositories.user_repository import user_repository
+
+USERS_URL = "/api/v1/users/"
+
+
+@pytest.fixture
+async def users(clean_db) -> dict[str, list[int]]:
+    """Admin (ID nhỏ nhất, active) và 9 user xen kẽ active/inactive. Trả về ID theo nhóm."""
+    rows = [
+        {
+            "email": f"{name}@x.com",
+            "username": name,
+            "hashed_password": "x",
+            "is_active": active,
+            "is_superuser": name == "admin",
+        }
+        for name, active in [("admin", True)] + [(f"u{i}", i % 2 == 0) for i in range(9)]
+    ]
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), rows)
+    async with AsyncSessionLocal() as db:
+        everyone, _ = await user_repository.get_page(db, limit=100)
+    return {
+        "all": [user.id for user in everyone],
+        "active": [user.id for user in everyone if user.is_active],
+        "inactive": [user.id for user in everyone if not user.is_active],
+        "admin": [everyone[0].id],
+    }
+
+
+def forged_cursors() -> list[str]:
+    """Cursor không được chấp nhận: bị sửa, ký bằng key khác, sai định dạng."""
+    body, sig = encode_page_cursor(5).split(".")
+    other_body, _ = encode_page_cursor(500).split(".")
+    flipped = sig[:-1] + ("A" if sig[-1] != "A" else "B")
+    foreign = JWTCodec("other-secret")
+    foreign_sig = security._b64encode(foreign._sign(b"cursor." + body.encode())[:16]).decode()
+    return [f"{other_body}.{sig}", f"{body}.{flipped}", f"{body}.{foreign_sig}", body, f"{body}.{sig}.x", "!!!.!!!"]
+
+
+def test_cursor_round_trip_and_forgery():
+    for last_id in (0, 1, 42, 2**40):
+        assert decode_page_cursor(encode_page_cursor(last_id)) == last_id
+    for bad in forged_cursors():
+        with pytest.raises(ValueError):
+            decode_page_cursor(bad)
+
+
+def test_cursor_signed_with_other_key_rejected(monkeypatch):
+    monkeypatch.setattr(security, "token_codec", JWTCodec("other-secret"))
+    foreign = encode_page_cursor(5)
+    monkeypatch.undo()
+    assert encode_page_cursor(5) != foreign
+    with pytest.raises(ValueError):
+        decode_page_cursor(foreign)
+
+
+async def walk(limit: int, filters=None) -> list[list[int]]:
+    """Đi hết các trang của get_page, trả về ID từng trang."""
+    pages, after_id = [], None
+    async with AsyncSessionLocal() as db:
+        while True:
+            items, after_id = await user_repository.get_page(db, after_id, limit, filters)
+            pages.append([user.id for user in items])
+            if filters:
+                assert all(user.is_active == filters["is_active"] for user in items)
+            if after_id is None:
+                return pages
+            assert after_id == items[-1].id
+
+
+async def test_get_page_order_and_filter(users):
+    pages = await walk(4)
+    assert [len(page) for page in pages] == [4, 4, 2]
+    assert sum(pages, []) == sorted(users["all"])
+
+    # Lọc is_active: 6 user active (admin + 5), trang cuối vừa đủ limit vẫn trả next=None (không có trang rỗng)
+    pages = await walk(3, {"is_active": True})
+    assert [len(page) for page in pages] == [3, 3]
+    assert sum(pages, []) == sorted(users["active"])
+    pages = await walk(3, {"is_active": False})
+    assert sum(pages, []) == sorted(users["inactive"]) and len(pages) == 2
+
+    async with AsyncSessionLocal() as db:
+        assert await user_repository.get_page(db, max(users["all"]), 10) == ([], None)
+        with pytest.raises(ValueError):
+            await user_repository.get_page(db, filters={"no_such_column": 1})
+
+
+async def test_list_users_endpoint(users):
+    from app.main import app
+
+    admin = {"Authorization": f"Bearer {create_access_token({'sub': str(users['admin'][0])})}"}
+    member = {"Authorization": f"Bearer {create_access_token({'sub': str(users['active'][1])})}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, "is_active": "false"}
+            if cursor:
+                params["cursor"] = cursor
+            response = await client.get(USERS_URL, params=params, headers=admin)
+            assert response.status_code == 200, response.text
+            page = response.json()
+            seen += [item["id"] for item in page["items"]]
+            assert all(item["is_active"] is False for item in page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert seen == sorted(users["inactive"])
+
+        for bad in forged_cursors():
+            response = await client.get(USERS_URL, params={"cursor": bad}, headers=admin)
+            assert response.status_code == 400, bad
+            assert response.json()["detail"] == "Cursor không hợp lệ"
+        assert (await client.get(USERS_URL, headers=member)).status_code == 403
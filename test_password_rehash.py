@@ -0,0 +1,102 @@
+"""Test hash lại mật khẩu theo cost mới trên SQLite tạm: needs_rehash (cost cố định / tự chọn),
+UPDATE có điều kiện của replace_password_hash không ghi đè mật khẩu vừa đổi ở request khác,
+rehash giữ nguyên updated_at và xóa cache user.
+Chạy: pytest test_password_rehash.py
+"""
+import asyncio
+
+import pytest
+
+from app.core import metrics
+from app.core.cache import user_cache
+from app.core.database import PrimarySessionLocal
+from app.core.security import get_password_hash, hash_rounds, needs_rehash, password_hasher, settings, verify_password
+from app.models.user import User
+from app.repositories.user_repository import user_repository
+from app.schemas.user import UserCreate, UserUpdate
+from app.services.user_service import user_service
+
+PASSWORD = "pw123456"
+
+
+@pytest.fixture(autouse=True)
+def current_rounds(monkeypatch):
+    """Cost hiện tại 5, cost cố định (PASSWORD_HASH_ROUNDS); hash cũ của test dùng cost 4 hoặc 6."""
+    monkeypatch.setattr(password_hasher, "rounds", 5)
+    monkeypatch.setattr(settings, "PASSWORD_HASH_TARGET_MS", 0.0)
+
+
+async def load(user_id: int) -> User:
+    async with PrimarySessionLocal() as db:
+        return await db.get(User, user_id)
+
+
+async def create_user(name: str, rounds: int) -> User:
+    async with PrimarySessionLocal() as db:
+        user = User(email=f"{name}@x.com", username=name, hashed_password=get_password_hash(PASSWORD, rounds))
+        db.add(user)
+        await db.commit()
+    return user
+
+
+def test_needs_rehash(monkeypatch):
+    low, current, high = (get_password_hash(PASSWORD, rounds) for rounds in (4, 5, 6))
+    assert hash_rounds(low) == 4 and hash_rounds(high) == 6
+    assert hash_rounds("không phải bcrypt") is None
+    assert not needs_rehash("không phải bcrypt")
+
+    # Cost cố định (PASSWORD_HASH_ROUNDS): khác cost hiện tại là hash lại, kể cả hạ cost
+    assert needs_rehash(low) and needs_rehash(high) and not needs_rehash(current)
+    # Cost tự chọn (PASSWORD_HASH_TARGET_MS): chỉ nâng, không hạ
+    monkeypatch.setattr(settings, "PASSWORD_HASH_TARGET_MS", 50.0)
+    assert needs_rehash(low) and not needs_rehash(high) and not needs_rehash(current)
+
+
+async def test_replace_keeps_updated_at_and_invalidates_cache(clean_db):
+    user = await create_user("rehash", rounds=4)
+    new_hash = get_password_hash(PASSWORD)
+    user_cache.set(user.id, {"id": user.id})
+    async with PrimarySessionLocal() as db:
+        assert await user_repository.replace_password_hash(db, user.id, user.hashed_password, new_hash)
+        # Request khác nạp lại bản cũ trước khi commit: bị xóa lần nữa sau commit
+        user_cache.set(user.id, {"id": user.id})
+        await db.commit()
+    assert user_cache.get(user.id) is None
+    stored = await load(user.id)
+    assert stored.hashed_password == new_hash
+    assert stored.updated_at == user.updated_at, "đổi cost hash không được đổi updated_at (ETag)"
+
+
+async def test_replace_does_not_overwrite_concurrent_reset(clean_db):
+    user = await create_user("reset", rounds=4)
+    old_hash = user.hashed_password
+    # Login đọc old_hash rồi bắt đầu hash lại; trong lúc đó request khác đổi mật khẩu
+    async with PrimarySessionLocal() as db:
+        await user_service.update_user(db, user.id, UserUpdate(password="newpass123"))
+        await db.commit()
+    reset = await load(user.id)
+    async with PrimarySessionLocal() as db:
+        assert not await user_repository.replace_password_hash(db, user.id, old_hash, get_password_hash(PASSWORD))
+        await db.commit()
+    stored = await load(user.id)
+    assert stored.hashed_password == reset.hashed_password and stored.updated_at == reset.updated_at
+    assert verify_password("newpass123", stored.hashed_password)
+    assert not verify_password(PASSWORD, stored.hashed_password)
+
+
+async def test_rehash_password(clean_db):
+    user = await create_user("login", rounds=4)
+    assert needs_rehash(user.hashed_password)
+    assert await user_service.rehash_password(user.id, PASSWORD, user.hashed_password)
+    stored = await load(user.id)
+    assert hash_rounds(stored.hashed_password) == password_hasher.rounds
+    assert verify_password(PASSWORD, stored.hashed_password) and not needs_rehash(stored.hashed_password)
+    assert stored.updated_at == user.updated_at
+
+    # old_hash đã cũ (mật khẩu đổi hoặc đã hash lại ở request khác): không ghi, đếm "stale"
+    stale_before = metrics.password_rehash_total._values.get(("stale",), 0)
+    user_service.schedule_rehash(user.id, PASSWORD, user.hashed_password)
+    await asyncio.gather(*user_service._background)
+    assert metrics.password_rehash_total._values.get(("stale",), 0) == stale_before + 1
+    assert (await load(user.id)).hashed_password == stored.hashed_password
+
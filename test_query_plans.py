@@ -0,0 +1,156 @@
+"""Test query plan: chạy các query thật của repository/service trên SQLite tạm, chạy EXPLAIN QUERY PLAN
+cho từng câu lệnh và báo lỗi nếu query nóng phải quét toàn bảng (full table scan).
+
+Chạy: pytest test_query_plans.py -s   (-s để in plan của từng query)
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select
+
+from app.core.database import AsyncSessionLocal, PrimarySessionLocal, engine
+from app.core.state_store import SQLStateStore
+from app.models.otp import OTPType
+from app.models.pending_activation import PendingActivation
+from app.models.user import User
+from app.repositories.user_repository import user_repository
+from app.schemas.user import UserCreate, UserUpdate
+from app.services import otp_service as otp_service_module
+from app.services.email_dispatcher import email_dispatcher
+from app.services.otp_service import otp_service
+from app.services.scheduler import Scheduler
+from app.services.user_service import user_service
+
+# Bảng cần kiểm tra full scan
+HOT_TABLES = ("users", "email_outbox", "state_entries", "job_leases", "pending_activations")
+
+_captured: list[tuple[str, str, tuple]] = []
+_current_label = "?"
+_allow_scan = False
+
+
+@contextmanager
+def label(name: str, allow_scan: bool = False):
+    """Gắn nhãn cho các câu lệnh chạy trong block (allow_scan: query không nóng, cho phép scan)."""
+    global _current_label, _allow_scan
+    _current_label, _allow_scan = name, allow_scan
+    try:
+        yield
+    finally:
+        _current_label, _allow_scan = "?", False
+
+
+def _is_full_scan(detail: str) -> bool:
+    """'SCAN users' là full scan; 'SCAN users USING [COVERING] INDEX' thì không."""
+    if not detail.startswith("SCAN "):
+        return False
+    table = detail.split()[1]
+    return table in HOT_TABLES and "USING" not in detail
+
+
+def _capture(conn, cursor, statement, parameters, context, executemany):
+    verb = statement.lstrip().split(None, 1)[0].upper()
+    if verb in ("SELECT", "UPDATE", "DELETE") and not _allow_scan:
+        _captured.append((_current_label, statement, tuple(parameters or ())))
+
+
+async def test_hot_queries_use_indexes(clean_db, monkeypatch):
+    # OTP lưu trong bảng state_entries (backend sql) để kiểm tra cả query của state store
+    state_store = SQLStateStore(PrimarySessionLocal)
+    monkeypatch.setattr(otp_service_module, "state_store", state_store)
+    _captured.clear()
+    event.listen(engine.sync_engine, "before_cursor_execute", _capture)
+    try:
+        await _run_queries(state_store)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", _capture)
+
+    failures = []
+    seen = set()
+    async with engine.connect() as conn:
+        for name, statement, params in _captured:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            rows = (await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params)).fetchall()
+            details = [row[-1] for row in rows]
+            scans = [d for d in details if _is_full_scan(d)]
+            status = "FULL SCAN" if scans else "ok"
+            print(f"[{status:>9}] {name}: {' | '.join(details)}")
+            if scans:
+                failures.append(f"{name}: {scans}\n    {' '.join(statement.split())}")
+    assert not failures, f"{len(failures)} query nóng bị full table scan:\n" + "\n".join(failures)
+    print(f"{len(seen)} query, không có full table scan trên {', '.join(HOT_TABLES)}")
+
+
+
+async def _run_queries(state_store: SQLStateStore):
+    """Chạy các query nóng của repository/service trên dữ liệu mẫu."""
+    # Dữ liệu mẫu để planner không coi bảng là rỗng
+    async with AsyncSessionLocal() as db:
+        old = datetime.utcnow() - timedelta(days=1)
+        for i in range(200):
+            db.add(User(email=f"seed{i}@x.com", username=f"seed{i}", hashed_password="x",
+                        is_active=i % 3 != 0, created_at=old))
+        await db.flush()
+        # Vài user đăng ký không kích hoạt kịp (job dọn xóa) và nhiều user còn trong hạn kích hoạt
+        seeds = (await db.execute(select(User.id).where(User.is_active == False))).scalars().all()
+        for i, user_id in enumerate(seeds):
+            db.add(PendingActivation(user_id=user_id, expires_at=old if i < 5 else datetime.utcnow() + timedelta(hours=1)))
+        await db.commit()
+
+    async with AsyncSessionLocal() as db:
+        with label("UserService.create_user"):
+            user = await user_service.create_user(
+                db, UserCreate(email="plan@x.com", username="plan", password="pw123456")
+            )
+        with label("UserRepository.get"):
+            await user_repository.get(db, user.id)
+        with label("BaseRepository.get_many"):
+            await user_repository.get_many(db, [user.id, user.id + 1, user.id])
+        with label("UserRepository.get_by_email"):
+            await user_repository.get_by_email(db, "plan@x.com")
+        with label("UserRepository.get_by_username"):
+            await user_repository.get_by_username(db, "plan")
+        with label("UserRepository.get_by_email_or_username"):
+            await user_repository.get_by_email_or_username(db, "plan")
+        with label("BaseRepository.get_multi", allow_scan=True):
+            await user_repository.get_multi(db, skip=0, limit=10)
+        with label("BaseRepository.get_page"):
+            await user_repository.get_page(db, after_id=100, limit=10)
+            await user_repository.get_page(db, after_id=100, limit=10, filters={"is_active": True})
+        with label("UserService.update_user"):
+            await user_service.update_user(db, user.id, UserUpdate(full_name="Plan"))
+        with label("OTPService.create_and_send_otp"):
+            code = await otp_service.create_and_send_otp(db, "plan@x.com", OTPType.ACTIVATION)
+        with label("OTPService.verify_otp"):
+            await otp_service.verify_otp(db, "plan@x.com", code, OTPType.ACTIVATION)
+        await db.commit()
+
+    with label("StateStore (sql)"):
+        await state_store.set("plan:k", "v", ttl=60)
+        await state_store.get("plan:k")
+        await state_store.get_and_delete("plan:k")
+        await state_store.incr("plan:c", ttl=60)
+        await state_store.incr("plan:c", ttl=60)
+        await state_store.delete("plan:c")
+    with label("EmailDispatcher.dispatch_once"):
+        await email_dispatcher.dispatch_once(AsyncSessionLocal)
+    with label("EmailDispatcher.purge_dead"):
+        await email_dispatcher.purge_dead(AsyncSessionLocal)
+    with label("Scheduler lease"):
+        scheduler = Scheduler()
+
+        async def _noop(session_factory):
+            return 0
+
+        job = scheduler.add_job("plan", _noop, interval=60)
+        await scheduler.run_job_once(AsyncSessionLocal, job)
+        await scheduler.run_job_once(AsyncSessionLocal, job)
+        await Scheduler().try_acquire(AsyncSessionLocal, job)
+    async with AsyncSessionLocal() as db:
+        with label("OTPService.cleanup_expired_otps_and_inactive_users"):
+            await otp_service.cleanup_expired_otps_and_inactive_users(db)
+        with label("BaseRepository.delete"):
+            await user_repository.delete(db, user.id)
+            await db.commit()
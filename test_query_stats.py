@@ -0,0 +1,112 @@
+"""Test thống kê SQL (app.core.query_stats): chuẩn hóa fingerprint (literal, IN-list, tuple IN, VALUES nhiều dòng
+gom về một nhóm), p95/mean/max của snapshot (số liệu của /admin/sql-stats) và event hook trên engine thật.
+Chạy: pytest test_query_stats.py
+"""
+import pytest
+from sqlalchemy import create_engine, select, text, tuple_
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.exc import OperationalError
+
+from app.core import query_stats as query_stats_module
+from app.core.query_stats import QueryStats, fingerprint
+from app.models.user import User
+
+
+def rendered(statement, dialect) -> str:
+    """SQL như lúc gửi tới driver (IN mở rộng thành từng tham số)."""
+    return str(statement.compile(dialect=dialect, compile_kwargs={"render_postcompile": True}))
+
+
+def test_fingerprint_literals():
+    assert fingerprint("SELECT *\n  FROM t   WHERE a = 'x''y' AND b = -1.5 LIMIT 10 OFFSET 20") == (
+        "SELECT * FROM t WHERE a = ? AND b = ? LIMIT ? OFFSET ?"
+    )
+    assert fingerprint("SELECT * FROM t WHERE a = 'it''s'") == fingerprint("SELECT * FROM t WHERE a = 'b'")
+    # Số trong tên bảng/cột/alias không bị thay
+    assert fingerprint("SELECT users_1.id, anon_2.x FROM t2 AS users_1") == "SELECT users_1.id, anon_2.x FROM t2 AS users_1"
+
+
+def test_fingerprint_in_lists_collapse():
+    statements = [
+        "SELECT * FROM t WHERE id IN (1, 2, 3)",
+        "SELECT * FROM t WHERE id IN (7)",
+        "SELECT * FROM t WHERE id in ('a','b')",
+        "SELECT * FROM t WHERE id IN (?, ?, ?, ?)",
+        "SELECT * FROM t WHERE id IN (%s, %s)",
+        "SELECT * FROM t WHERE id IN (:id_1, :id_2)",
+    ]
+    assert {fingerprint(s) for s in statements} == {"SELECT * FROM t WHERE id IN (...)"}
+    # Subquery không bị gộp
+    assert fingerprint("SELECT * FROM t WHERE id IN (SELECT id FROM u)") == "SELECT * FROM t WHERE id IN (SELECT id FROM u)"
+
+
+@pytest.mark.parametrize("dialect", [sqlite.dialect(), mysql.dialect(paramstyle="format")], ids=["sqlite", "mysql"])
+def test_fingerprint_in_lists_from_sqlalchemy(dialect):
+    by_ids = {fingerprint(rendered(select(User.id).where(User.id.in_(range(n))), dialect)) for n in (1, 2, 50)}
+    assert len(by_ids) == 1 and "IN (...)" in by_ids.pop()
+    # Tuple IN (upsert_many/create_many tra ID): SQLite IN (VALUES (?, ?), ...), MySQL IN ((%s, %s), ...)
+    keys = tuple_(User.email, User.username)
+    by_keys = {
+        fingerprint(rendered(select(User.id).where(keys.in_([(f"e{i}", f"u{i}") for i in range(n)])), dialect))
+        for n in (1, 3, 20)
+    }
+    assert len(by_keys) == 1 and by_keys.pop().endswith("IN (...)")
+
+
+def test_fingerprint_multi_row_values():
+    rows = {fingerprint("INSERT INTO t (a, b) VALUES " + ", ".join(["(?, ?)"] * n)) for n in (2, 3, 100)}
+    assert rows == {"INSERT INTO t (a, b) VALUES (?, ?), ..."}
+    assert fingerprint("INSERT INTO t (a, b) VALUES (%s, %s)") == "INSERT INTO t (a, b) VALUES (%s, %s)"
+
+
+def test_snapshot_p95():
+    stats = QueryStats(sample_size=1000)
+    for ms in range(1, 101):
+        stats.record("q", ms / 1000)
+    [row] = stats.snapshot()
+    # Nearest-rank: phần tử thứ ceil(0.95 × 100) = 95
+    assert row == {"statement": "q", "count": 100, "total_ms": 5050.0, "mean_ms": 50.5, "p95_ms": 95.0, "max_ms": 100.0}
+
+    small = QueryStats()
+    for ms in range(1, 21):
+        small.record("q", ms / 1000)
+    assert small.snapshot()[0]["p95_ms"] == 19.0  # Không lấy max khi chỉ có 20 mẫu
+    one = QueryStats()
+    one.record("q", 0.004)
+    assert one.snapshot()[0]["p95_ms"] == 4.0
+
+
+def test_snapshot_window_order_and_limits():
+    stats = QueryStats(max_fingerprints=2, sample_size=10)
+    for _ in range(90):
+        stats.record("slow", 1.0)
+    for _ in range(10):
+        stats.record("slow", 0.001)
+    stats.record("fast", 0.002)
+    stats.record("ignored", 5.0)  # Đã đủ max_fingerprints: bỏ qua nhóm mới
+    rows = stats.snapshot()
+    assert [row["statement"] for row in rows] == ["slow", "fast"]
+    # p95 chỉ tính trên sample_size lần gần nhất; count/total/max tính mọi lần
+    assert rows[0]["p95_ms"] == 1.0 and rows[0]["max_ms"] == 1000.0 and rows[0]["count"] == 100
+    assert stats.snapshot(limit=1) == rows[:1]
+    stats.reset()
+    assert stats.snapshot() == []
+
+
+def test_install_records_statements(monkeypatch):
+    stats = QueryStats()
+    monkeypatch.setattr(query_stats_module, "query_stats", stats)
+    engine = create_engine("sqlite://")
+    query_stats_module.install(engine)
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY)"))
+        for n in (1, 2, 3):
+            conn.execute(text(f"SELECT id FROM t WHERE id IN ({', '.join(str(i) for i in range(n))})"))
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM missing"))
+        # Câu lỗi không để lại mốc thời gian thừa
+        assert conn.info["query_start"] == []
+    engine.dispose()
+    counts = {row["statement"]: row["count"] for row in stats.snapshot()}
+    assert counts["SELECT id FROM t WHERE id IN (...)"] == 3
+    assert "SELECT * FROM missing" not in counts
@@ -0,0 +1,124 @@
+"""Test rate limit: công thức sliding window counter, Retry-After và thứ tự kiểm tra IP → tài khoản → route.
+
+Đồng hồ của backend memory được thay bằng đồng hồ giả để kiểm tra chính xác theo cửa sổ.
+Chạy: pytest test_rate_limit.py
+"""
+import pytest
+from starlette.requests import Request
+
+from app.core import rate_limit
+from app.core.rate_limit import MemoryRateLimitBackend, RateLimitBackend, RateLimiter, RateLimitExceeded, parse_rule
+
+
+class FakeClock:
+    """Thay module time trong rate_limit: time() trả giá trị đặt tay."""
+
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+class FixedBackend(RateLimitBackend):
+    """Backend trả sẵn (count trước, count hiện tại, số giây đã qua) để kiểm tra công thức."""
+
+    def __init__(self, previous: int, current: int, elapsed: float):
+        self.result = (previous, current, elapsed)
+
+    async def hit(self, key: str, window: float) -> tuple[int, int, float]:
+        return self.result
+
+
+def make_request(ip: str) -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": [], "client": (ip, 50000)})
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    """Đồng hồ cố định (đầu cửa sổ index 10 với window 60): các request không rơi vào hai cửa sổ."""
+    clock = FakeClock(600.0)
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    """enforce chỉ kiểm tra khi bật RATE_LIMIT_ENABLED."""
+    monkeypatch.setattr(rate_limit.settings, "RATE_LIMIT_ENABLED", True)
+
+
+def make_limiter(route: str, ip: str, account: str) -> RateLimiter:
+    limiter = RateLimiter(MemoryRateLimitBackend(max_keys=1000))
+    limiter.route_rule = parse_rule(route)
+    limiter.ip_rule = parse_rule(ip)
+    limiter.account_rule = parse_rule(account)
+    return limiter
+
+
+async def rejected(limiter: RateLimiter, ip: str, account: str, route: str = "login"):
+    """Retry-After nếu request bị chặn, None nếu được qua."""
+    try:
+        await limiter.enforce(make_request(ip), route, account=account)
+    except RateLimitExceeded as e:
+        return e.retry_after
+    return None
+
+
+def test_parse_rule():
+    assert parse_rule("20/60") == (20, 60.0)
+    assert parse_rule("") == (0, 0.0)
+
+
+async def test_sliding_window_math():
+    # 10 request cửa sổ trước, đã qua 1/4 cửa sổ hiện tại: ước lượng 10 * 0.75 + current
+    limiter = RateLimiter(FixedBackend(previous=10, current=2, elapsed=15))
+    assert await limiter.check("k", limit=10, window=60) is None  # 9.5 <= 10
+    limiter.backend = FixedBackend(previous=10, current=4, elapsed=15)
+    # 11.5 > 10: cần phần cửa sổ trước giảm thêm 1.5/10 cửa sổ = 9 giây
+    assert await limiter.check("k", limit=10, window=60) == 9
+    # Riêng cửa sổ hiện tại đã vượt: chờ hết cửa sổ hiện tại
+    limiter.backend = FixedBackend(previous=10, current=11, elapsed=15)
+    assert await limiter.check("k", limit=10, window=60) == 45
+    # Retry-After tối thiểu 1 giây
+    limiter.backend = FixedBackend(previous=0, current=11, elapsed=59.9)
+    assert await limiter.check("k", limit=10, window=60) == 1
+
+
+async def test_memory_backend_windows(clock: FakeClock):
+    backend = MemoryRateLimitBackend(max_keys=2)
+    for _ in range(3):
+        result = await backend.hit("a", 60)
+    assert result == (0, 3, 0.0), result
+    clock.now = 690.0  # Cửa sổ kế tiếp: count cũ thành count cửa sổ trước
+    assert await backend.hit("a", 60) == (3, 1, 30.0)
+    clock.now = 870.0  # Bỏ qua một cửa sổ: cửa sổ trước rỗng
+    assert await backend.hit("a", 60) == (0, 1, 30.0)
+    # LRU: vượt max_keys thì bỏ key ít dùng nhất
+    await backend.hit("b", 60)
+    await backend.hit("c", 60)
+    assert list(backend._data) == ["b", "c"]
+
+
+async def test_rejected_requests_do_not_consume_route_budget(clock: FakeClock):
+    limiter = make_limiter(route="20/60", ip="5/60", account="100/60")
+    # Một IP spam 50 request: chỉ 5 request đầu qua được giới hạn IP
+    blocked = [await rejected(limiter, "10.0.0.1", f"user{i}") for i in range(50)]
+    assert sum(r is None for r in blocked) == 5, blocked
+    # IP và tài khoản khác vẫn login được: route chỉ tính 5 request đã qua
+    assert await rejected(limiter, "10.0.0.2", "alice") is None
+
+    limiter = make_limiter(route="20/60", ip="100/60", account="3/60")
+    # Dò mật khẩu một tài khoản: bị chặn theo tài khoản, không làm cạn ngân sách route
+    blocked = [await rejected(limiter, "10.0.0.1", "victim") for _ in range(50)]
+    assert sum(r is None for r in blocked) == 3, blocked
+    assert await rejected(limiter, "10.0.0.2", "alice") is None
+
+
+async def test_route_limit_still_applies(clock: FakeClock):
+    limiter = make_limiter(route="10/60", ip="100/60", account="100/60")
+    results = [await rejected(limiter, f"10.0.1.{i}", f"user{i}") for i in range(12)]
+    assert results[:10] == [None] * 10 and all(r is not None for r in results[10:]), results
+    # Route khác có bộ đếm riêng
+    assert await rejected(limiter, "10.0.1.99", "user99", route="register") is None
+
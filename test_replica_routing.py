@@ -0,0 +1,140 @@
+"""Test định tuyến đọc replica của RoutingSession: primary (database test) và replica là các file SQLite
+khác nhau, mỗi bên có một user riêng nên kết quả SELECT cho biết câu lệnh chạy ở đâu.
+
+Kiểm tra: SELECT đi replica (round-robin), sau khi ghi thì session ghim primary, use_primary(),
+SELECT ... FOR UPDATE đi primary, replica không kết nối được thì bị bỏ qua và đọc về primary.
+Chạy: pytest test_replica_routing.py
+"""
+import pytest
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import OperationalError
+
+from app.core import database as database_module
+from app.core.database import (
+    AsyncSessionLocal,
+    Base,
+    PrimarySessionLocal,
+    ReplicaSet,
+    _create_engine,
+    engine,
+    use_primary,
+)
+from app.models.user import User
+
+USERNAMES = select(User.username).order_by(User.id)
+
+
+async def served_by(db) -> str:
+    """Username duy nhất của database đã trả lời SELECT ("primary", "replica-0", ...)."""
+    return (await db.execute(USERNAMES)).scalars().one()
+
+
+async def seed(target, username: str):
+    async with target.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User).values(email=f"{username}@x.com", username=username, hashed_password="x"))
+
+
+@pytest.fixture
+async def primary(clean_db):
+    await seed(engine, "primary")
+
+
+def route_to(monkeypatch, engines) -> ReplicaSet:
+    """Dùng các engine này làm replica (thay cho DATABASE_REPLICA_URLS)."""
+    replica_set = ReplicaSet(engines, retry_seconds=30)
+    monkeypatch.setattr(database_module, "replicas", replica_set)
+    return replica_set
+
+
+@pytest.fixture
+async def healthy(primary, tmp_path):
+    """Hai replica khỏe."""
+    engines = [_create_engine(f"sqlite+aiosqlite:///{tmp_path / f'replica{i}.db'}") for i in range(2)]
+    for i, replica in enumerate(engines):
+        await seed(replica, f"replica-{i}")
+    yield engines
+    for replica in engines:
+        await replica.dispose()
+
+
+@pytest.fixture
+async def down(tmp_path):
+    """Replica không kết nối được (thư mục của file SQLite không tồn tại)."""
+    replica = _create_engine(f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    yield replica
+    await replica.dispose()
+
+
+@pytest.fixture
+def replicas(healthy, monkeypatch) -> ReplicaSet:
+    return route_to(monkeypatch, healthy)
+
+
+async def test_reads_go_to_replicas_round_robin(replicas: ReplicaSet):
+    async with AsyncSessionLocal() as db:
+        assert [await served_by(db) for _ in range(4)] == ["replica-0", "replica-1", "replica-0", "replica-1"]
+        assert db.sync_session.get_bind(clause=USERNAMES) in {r.sync_engine for r in replicas.engines}
+    # Session chỉ dùng primary không đi replica
+    async with PrimarySessionLocal() as db:
+        assert await served_by(db) == "primary"
+
+
+async def test_write_pins_session_to_primary(replicas: ReplicaSet):
+    async with AsyncSessionLocal() as db:
+        assert (await served_by(db)).startswith("replica")
+        await db.execute(update(User).where(User.username == "primary").values(full_name="x"))
+        assert db.sync_session.info[database_module._USE_PRIMARY]
+        assert [await served_by(db) for _ in range(3)] == ["primary"] * 3
+        assert db.sync_session.get_bind(clause=USERNAMES) is engine.sync_engine
+        await db.rollback()
+
+    # Flush của ORM (INSERT) cũng ghim primary; đọc sau đó thấy dòng vừa ghi chưa commit
+    async with AsyncSessionLocal() as db:
+        db.add(User(email="new@x.com", username="new", hashed_password="x"))
+        await db.flush()
+        assert set((await db.execute(USERNAMES)).scalars()) == {"primary", "new"}
+        await db.rollback()
+
+    # Session mới của request khác lại đọc replica
+    async with AsyncSessionLocal() as db:
+        assert (await served_by(db)).startswith("replica")
+
+
+async def test_use_primary_forces_primary(replicas: ReplicaSet):
+    async with AsyncSessionLocal() as db:
+        use_primary(db)
+        assert [await served_by(db) for _ in range(2)] == ["primary"] * 2
+
+
+async def test_select_for_update_goes_to_primary(replicas: ReplicaSet):
+    async with AsyncSessionLocal() as db:
+        locked = USERNAMES.with_for_update()
+        assert db.sync_session.get_bind(clause=locked) is engine.sync_engine
+        assert (await db.execute(locked)).scalars().one() == "primary"
+        # Sau khi khóa dòng để ghi: các lần đọc tiếp theo cũng ở primary
+        assert await served_by(db) == "primary"
+
+
+async def test_unavailable_replica_falls_back(primary, down, monkeypatch):
+    replica_set = route_to(monkeypatch, [down])
+    async with AsyncSessionLocal() as db:
+        # Lần đọc gặp lỗi kết nối thì báo lỗi và đánh dấu replica hỏng
+        with pytest.raises(OperationalError):
+            await served_by(db)
+    assert replica_set.pick() is None
+    async with AsyncSessionLocal() as db:
+        assert [await served_by(db) for _ in range(2)] == ["primary"] * 2
+
+    # Hết DB_REPLICA_RETRY_SECONDS thì replica được thử lại
+    replica_set._down_until = [0.0]
+    assert replica_set.pick() is down
+
+
+async def test_unavailable_replica_skipped_for_healthy_ones(healthy, down, monkeypatch):
+    route_to(monkeypatch, [down, *healthy])
+    async with AsyncSessionLocal() as db:
+        with pytest.raises(OperationalError):
+            await served_by(db)
+    async with AsyncSessionLocal() as db:
+        assert [await served_by(db) for _ in range(3)] == ["replica-0", "replica-1", "replica-0"]
@@ -0,0 +1,76 @@
+"""Test lease của Scheduler trên SQLite tạm: hạn lease theo đồng hồ database, không theo giờ của node.
+
+Giờ hệ thống của process bị lệch (datetime giả chạy nhanh 1 giờ) vẫn không giành được lease còn hạn.
+Chạy: pytest test_scheduler.py
+"""
+import asyncio
+import datetime as datetime_module
+
+from sqlalchemy import select
+
+from app.core.database import PrimarySessionLocal, db_utcnow
+from app.models.job_lease import JobLease
+from app.services import scheduler as scheduler_module
+from app.services.scheduler import Scheduler
+
+
+class SkewedDatetime(datetime_module.datetime):
+    """datetime có đồng hồ chạy nhanh 1 giờ (node lệch giờ)."""
+
+    @classmethod
+    def utcnow(cls):
+        return datetime_module.datetime.utcnow() + datetime_module.timedelta(hours=1)
+
+    @classmethod
+    def now(cls, tz=None):
+        return datetime_module.datetime.now(tz) + datetime_module.timedelta(hours=1)
+
+
+async def noop(session_factory) -> int:
+    return 0
+
+
+async def lease() -> JobLease:
+    async with PrimarySessionLocal() as db:
+        return (await db.execute(select(JobLease).where(JobLease.name == "job"))).scalar_one()
+
+
+async def test_db_utcnow(clean_db):
+    async with PrimarySessionLocal() as db:
+        now, later = (await db.execute(select(db_utcnow(), db_utcnow(90)))).one()
+    local = datetime_module.datetime.utcnow()
+    assert abs((now - local).total_seconds()) < 2, (now, local)
+    assert abs((later - now).total_seconds() - 90) < 0.01, (now, later)
+
+
+async def test_lease_uses_database_clock(clean_db, monkeypatch):
+    first, second = Scheduler(), Scheduler()
+    job = first.add_job("job", noop, interval=60, lease_seconds=0.5)
+    assert await first.try_acquire(PrimarySessionLocal, job)
+    held = await lease()
+    assert held.owner == first.owner
+    assert 0.3 < (held.expires_at - datetime_module.datetime.utcnow()).total_seconds() <= 0.6, held.expires_at
+
+    # Node lệch giờ 1 tiếng (giờ Python của process chạy nhanh): không được coi lease là hết hạn
+    with monkeypatch.context() as patch:
+        patch.setattr(scheduler_module, "datetime", SkewedDatetime, raising=False)
+        assert not await second.try_acquire(PrimarySessionLocal, job)
+    assert (await lease()).owner == first.owner
+
+    # Chủ lease gia hạn được; hết hạn thật (theo database) thì node khác nhận
+    assert await first.try_acquire(PrimarySessionLocal, job)
+    await asyncio.sleep(0.7)
+    assert await second.try_acquire(PrimarySessionLocal, job)
+    assert (await lease()).owner == second.owner
+
+
+async def test_release_keeps_lease_until_next_run(clean_db):
+    scheduler, other = Scheduler(), Scheduler()
+    job = scheduler.add_job("job", noop, interval=60, max_interval=600, lease_seconds=0.5)
+    next_in = await scheduler.run_job_once(PrimarySessionLocal, job)
+    assert next_in == 120  # Không có việc: giãn gấp đôi
+    held = await lease()
+    assert held.owner == scheduler.owner and held.last_run_at is not None
+    assert 119 < (held.expires_at - held.last_run_at).total_seconds() <= 120.01, held.__dict__
+    assert await other.run_job_once(PrimarySessionLocal, job) is None
+
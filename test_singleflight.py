@@ -0,0 +1,161 @@
+"""Test SingleFlight và đọc repository qua singleflight (_read_one) trên SQLite tạm.
+
+Kiểm tra: gộp lời gọi đồng thời cùng key, key khác/lần sau chạy riêng, lỗi và hủy, số query thật sự
+chạy, mỗi session nhận object riêng, session đã ghi hoặc chỉ dùng primary thì tự truy vấn (bypass).
+Chạy: pytest test_singleflight.py
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import event, update
+
+from app.core import metrics
+from app.core.database import AsyncSessionLocal, PrimarySessionLocal, engine
+from app.core.singleflight import SingleFlight
+from app.models.user import User
+from app.repositories.user_repository import UserRepository
+
+
+@pytest.fixture
+def selects() -> list[str]:
+    """Các câu SELECT trên bảng users chạy thật trong test."""
+    captured: list[str] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            captured.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    yield captured
+    event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+
+@pytest.fixture
+async def user_id(clean_db) -> int:
+    async with PrimarySessionLocal() as db:
+        user = User(email="sf@x.com", username="sf", hashed_password="x", is_active=True)
+        db.add(user)
+        await db.commit()
+    return user.id
+
+
+@pytest.fixture
+def repository() -> UserRepository:
+    return UserRepository(User, singleflight=True)
+
+
+async def test_shares_concurrent_calls():
+    flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def fn():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return object()
+
+    tasks = [asyncio.create_task(flight.do("k", fn)) for _ in range(5)]
+    other = asyncio.create_task(flight.do("other", fn))
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*tasks)
+    await other
+    assert calls == 2, calls  # "k" một lần, "other" một lần
+    assert len({id(result) for result, _ in results}) == 1
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert flight._inflight == {}
+
+    # Không phải cache: xong lần chạy thì lời gọi sau chạy lại
+    await flight.do("k", fn)
+    assert calls == 3
+
+
+async def test_errors_and_cancellation():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise RuntimeError("boom")
+
+    tasks = [asyncio.create_task(flight.do("k", failing)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results), results
+    assert flight._inflight == {}
+
+    async def ok():
+        return "ok"
+
+    assert await flight.do("k", ok) == ("ok", False)  # Lỗi không bị giữ lại
+
+    # Lời gọi khởi tạo bị hủy: lời gọi đang chờ vẫn nhận kết quả
+    release = asyncio.Event()
+
+    async def slow():
+        await release.wait()
+        return "done"
+
+    first = asyncio.create_task(flight.do("slow", slow))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(flight.do("slow", slow))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    assert await second == ("done", True)
+    assert first.cancelled()
+
+
+async def test_repository_shares_reads(repository: UserRepository, user_id: int, selects: list[str]):
+    sessions = [AsyncSessionLocal() for _ in range(5)]
+    try:
+        selects.clear()
+        users = await asyncio.gather(*(repository.get(db, user_id) for db in sessions))
+        assert len(selects) == 1, selects
+        assert len({id(user) for user in users}) == 5, "mỗi session phải nhận object riêng"
+        for db, user in zip(sessions, users):
+            assert user in db and user.username == "sf" and not db.dirty
+        users[0].full_name = "chỉ session 0"
+        assert users[1].full_name is None
+
+        # Session 0 có thay đổi chưa flush: tự truy vấn, 4 session còn lại dùng chung một query
+        selects.clear()
+        found = await asyncio.gather(*(repository.get_by_email(db, "sf@x.com") for db in sessions))
+        missing = await asyncio.gather(*(repository.get(db, 999999) for db in sessions))
+        assert len(selects) == 4, selects
+        assert found == users and missing == [None] * 5, (found, missing)
+        assert users[0].full_name == "chỉ session 0"
+    finally:
+        for db in sessions:
+            await db.close()
+
+
+async def test_repository_bypass(repository: UserRepository, user_id: int, selects: list[str]):
+    # Session đã ghi (transaction ghi), session có thay đổi chờ flush, session chỉ dùng primary
+    async with AsyncSessionLocal() as written, AsyncSessionLocal() as pending, PrimarySessionLocal() as primary:
+        await written.execute(update(User).where(User.id == user_id).values(full_name="đang ghi"))
+        pending.add(User(email="pending@x.com", username="pending", hashed_password="x"))
+        selects.clear()
+        bypass_before = metrics.repository_reads_total._values.get(("get", "bypass"), 0)
+        users = await asyncio.gather(*(repository.get(db, user_id) for db in (written, pending, primary)))
+        assert len(selects) == 3, selects
+        assert metrics.repository_reads_total._values.get(("get", "bypass"), 0) == bypass_before + 3
+        # Session đã ghi đọc thấy thay đổi chưa commit của chính nó
+        assert users[0].full_name == "đang ghi"
+        await written.rollback()
+
+
+async def test_without_singleflight(user_id: int, selects: list[str]):
+    repository = UserRepository(User)
+    sessions = [AsyncSessionLocal() for _ in range(3)]
+    try:
+        selects.clear()
+        await asyncio.gather(*(repository.get(db, user_id) for db in sessions))
+        assert len(selects) == 3, selects
+    finally:
+        for db in sessions:
+            await db.close()
+
@@ -1,79 +1,236 @@
-"""Script test SMTP connection."""
+"""Test SMTP connection.
+
+`pytest test_smtp.py`: test pool SMTP của app với một SMTP server giả lập local (không cần mạng,
+không cần credential). `python test_smtp.py`: gửi thử một email qua SMTP thật cấu hình trong .env.
+"""
+import asyncio
 import smtplib
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
 from dotenv import load_dotenv
 
-load_dotenv()
-
-SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
-SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
-SMTP_USER = os.getenv("SMTP_USER")
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
-SMTP_FROM_EMAIL = os.getenv("SMTP_FROM_EMAIL", SMTP_USER)
-
-if not SMTP_USER or not SMTP_PASSWORD:
-    print("❌ Chưa config SMTP_USER và SMTP_PASSWORD trong .env")
-    print("\nVui lòng thêm vào file .env:")
-    print("SMTP_USER=your-email@gmail.com")
-    print("SMTP_PASSWORD=your-app-password")
-    exit(1)
-
-print(f"\n{'='*60}")
-print("TEST SMTP CONNECTION")
-print(f"{'='*60}")
-print(f"SMTP Host: {SMTP_HOST}")
-print(f"SMTP Port: {SMTP_PORT}")
-print(f"SMTP User: {SMTP_USER}")
-print(f"SMTP From: {SMTP_FROM_EMAIL}")
-print(f"{'='*60}\n")
-
-try:
-    msg = MIMEMultipart()
-    msg["From"] = SMTP_FROM_EMAIL
-    msg["To"] = SMTP_USER  # Gửi cho chính mình để test
-    msg["Subject"] = "Test SMTP - Backend Kebook"
-
-    body = """
-    <html>
-    <body style="font-family: Arial, sans-serif;">
-        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-            <h2 style="color: #667eea;">✅ Test Email thành công!</h2>
-            <p>Nếu bạn nhận được email này, SMTP đã được cấu hình đúng.</p>
-            <p>Bạn có thể sử dụng SMTP để gửi OTP cho users.</p>
-            <hr>
-            <p style="color: #666; font-size: 12px;">Backend Kebook API</p>
-        </div>
-    </body>
-    </html>
-    """
-    msg.attach(MIMEText(body, "html"))
-
-    print("📧 Đang kết nối đến SMTP server...")
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-        print("🔐 Đang bật TLS...")
-        server.starttls()
-        print("🔑 Đang đăng nhập...")
-        server.login(SMTP_USER, SMTP_PASSWORD)
-        print("📤 Đang gửi email...")
-        server.send_message(msg)
-    
-    print(f"\n✅ Gửi email thành công!")
-    print(f"📬 Kiểm tra hộp thư của {SMTP_USER}")
-    print(f"   (Có thể trong Spam/Junk folder)\n")
-except smtplib.SMTPAuthenticationError as e:
-    print(f"\n❌ Lỗi xác thực: {e}")
-    print("\nKiểm tra:")
-    print("1. SMTP_USER và SMTP_PASSWORD đúng chưa?")
-    print("2. Nếu dùng Gmail: Đã tạo App Password chưa?")
-    print("3. App Password có đúng 16 ký tự không?")
-except smtplib.SMTPConnectError as e:
-    print(f"\n❌ Lỗi kết nối: {e}")
-    print("\nKiểm tra:")
-    print(f"1. SMTP_HOST đúng chưa? (hiện tại: {SMTP_HOST})")
-    print(f"2. SMTP_PORT đúng chưa? (hiện tại: {SMTP_PORT})")
-    print("3. Firewall có chặn port không?")
-except Exception as e:
-    print(f"\n❌ Lỗi: {e}")
-    print("\nXem hướng dẫn trong file HUONG_DAN_SETUP_SMTP.md")
+
+class LocalSMTPServer:
+    """SMTP server giả lập tối thiểu (EHLO/MAIL/RCPT/DATA/NOOP/RSET/QUIT), lưu email nhận được."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, stall: float = 0.0):
+        self.host = host
+        self.port = port
+        self.stall = stall  # Chờ bao lâu trước khi trả lời sau DATA (giả lập relay chậm)
+        self.messages: list[bytes] = []
+        self.connections = 0
+        self.closed = 0
+        self.replied_at: list[float] = []
+        self._server = None
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            await self._serve(reader, writer)
+        except ConnectionError:
+            pass
+        finally:
+            self.closed += 1
+            writer.close()
+
+    async def _serve(self, reader, writer):
+        writer.write(b"220 local ESMTP\r\n")
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            cmd = line.decode(errors="replace").strip().upper()
+            if cmd.startswith(("EHLO", "HELO")):
+                writer.write(b"250-local\r\n250 OK\r\n")
+            elif cmd == "DATA":
+                writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                await writer.drain()
+                data = b""
+                while True:
+                    chunk = await reader.readline()
+                    if chunk in (b".\r\n", b""):
+                        break
+                    data += chunk
+                await asyncio.sleep(self.stall)
+                self.messages.append(data)
+                self.replied_at.append(time.monotonic())
+                writer.write(b"250 OK queued\r\n")
+            elif cmd == "QUIT":
+                writer.write(b"221 Bye\r\n")
+                await writer.drain()
+                break
+            else:
+                writer.write(b"250 OK\r\n")
+            await writer.drain()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+
+async def test_pool_reuses_connection():
+    """Gửi vài email qua SMTPConnectionPool tới server giả lập, kiểm tra kết nối được tái sử dụng."""
+    from app.services.smtp_pool import SMTPConnectionPool
+
+    server = LocalSMTPServer()
+    await server.start()
+    pool = SMTPConnectionPool(
+        host=server.host, port=server.port, user="", password="",
+        size=2, timeout=5, use_tls=False,
+    )
+    try:
+        for i in range(5):
+            msg = MIMEText(f"Test {i}")
+            msg["From"] = "kebook@localhost"
+            msg["To"] = "user@localhost"
+            msg["Subject"] = f"Test SMTP local {i}"
+            await pool.send(msg)
+    finally:
+        await pool.close()
+        await server.stop()
+
+    assert len(server.messages) == 5 and server.connections == 1, (len(server.messages), server.connections)
+
+
+def _message(subject: str) -> MIMEText:
+    msg = MIMEText(subject)
+    msg["From"] = "kebook@localhost"
+    msg["To"] = "user@localhost"
+    msg["Subject"] = subject
+    return msg
+
+
+async def test_timeout_and_cancel(monkeypatch):
+    """Relay chậm hơn timeout: lỗi do socket timeout của smtplib; gửi bị hủy thì kết nối chỉ bị đóng
+    sau khi thread gửi xong (không đóng socket đang dùng), không rò kết nối."""
+    from app.services import smtp_pool
+    from app.services.smtp_pool import SMTPConnectionPool
+
+    closed_at: list[float] = []
+    original_close = smtp_pool._PooledConnection.close
+
+    def recording_close(conn):
+        closed_at.append(time.monotonic())
+        original_close(conn)
+
+    monkeypatch.setattr(smtp_pool._PooledConnection, "close", recording_close)
+    server = LocalSMTPServer(stall=1.0)
+    await server.start()
+    pool = SMTPConnectionPool(host=server.host, port=server.port, user="", password="", timeout=0.3, use_tls=False)
+    try:
+        start = time.perf_counter()
+        try:
+            await pool.send(_message("timeout"))
+        except (OSError, smtplib.SMTPException):
+            pass
+        else:
+            raise AssertionError("send phải lỗi khi relay chậm hơn timeout")
+        assert time.perf_counter() - start < 0.9, "timeout phải do socket timeout (0.3s)"
+        assert pool._idle == []
+
+        # Chờ relay xử lý xong email bị timeout ở trên
+        await asyncio.sleep(1.0)
+        server.stall = 0.5
+        pool.timeout = 2.0
+        closed_at.clear()
+        server.replied_at.clear()
+        task = asyncio.create_task(pool.send(_message("cancel")))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(1.0)
+        # Kết nối chỉ bị đóng sau khi relay trả lời lệnh gửi dở (thread gửi đã xong)
+        assert len(closed_at) == 1 and closed_at[0] >= server.replied_at[-1], (closed_at, server.replied_at)
+        assert server.closed == server.connections, (server.closed, server.connections)
+        assert pool._idle == []
+    finally:
+        await pool.close()
+        await server.stop()
+
+
+def main():
+    """Gửi một email thử qua SMTP thật (SMTP_* trong .env) cho chính SMTP_USER."""
+    load_dotenv()
+    SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+    SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+    SMTP_USER = os.getenv("SMTP_USER")
+    SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+    SMTP_FROM_EMAIL = os.getenv("SMTP_FROM_EMAIL", SMTP_USER)
+
+    if not SMTP_USER or not SMTP_PASSWORD:
+        print("❌ Chưa config SMTP_USER và SMTP_PASSWORD trong .env")
+        print("\nVui lòng thêm vào file .env:")
+        print("SMTP_USER=your-email@gmail.com")
+        print("SMTP_PASSWORD=your-app-password")
+        exit(1)
+
+    print(f"\n{'='*60}")
+    print("TEST SMTP CONNECTION")
+    print(f"{'='*60}")
+    print(f"SMTP Host: {SMTP_HOST}")
+    print(f"SMTP Port: {SMTP_PORT}")
+    print(f"SMTP User: {SMTP_USER}")
+    print(f"SMTP From: {SMTP_FROM_EMAIL}")
+    print(f"{'='*60}\n")
+
+    try:
+        msg = MIMEMultipart()
+        msg["From"] = SMTP_FROM_EMAIL
+        msg["To"] = SMTP_USER  # Gửi cho chính mình để test
+        msg["Subject"] = "Test SMTP - Backend Kebook"
+
+        body = """
+        <html>
+        <body style="font-family: Arial, sans-serif;">
+            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+                <h2 style="color: #667eea;">✅ Test Email thành công!</h2>
+                <p>Nếu bạn nhận được email này, SMTP đã được cấu hình đúng.</p>
+                <p>Bạn có thể sử dụng SMTP để gửi OTP cho users.</p>
+                <hr>
+                <p style="color: #666; font-size: 12px;">Backend Kebook API</p>
+            </div>
+        </body>
+        </html>
+        """
+        msg.attach(MIMEText(body, "html"))
+
+        print("📧 Đang kết nối đến SMTP server...")
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
+            print("🔐 Đang bật TLS...")
+            server.starttls()
+            print("🔑 Đang đăng nhập...")
+            server.login(SMTP_USER, SMTP_PASSWORD)
+            print("📤 Đang gửi email...")
+            server.send_message(msg)
+
+        print(f"\n✅ Gửi email thành công!")
+        print(f"📬 Kiểm tra hộp thư của {SMTP_USER}")
+        print(f"   (Có thể trong Spam/Junk folder)\n")
+    except smtplib.SMTPAuthenticationError as e:
+        print(f"\n❌ Lỗi xác thực: {e}")
+        print("\nKiểm tra:")
+        print("1. SMTP_USER và SMTP_PASSWORD đúng chưa?")
+        print("2. Nếu dùng Gmail: Đã tạo App Password chưa?")
+        print("3. App Password có đúng 16 ký tự không?")
+    except smtplib.SMTPConnectError as e:
+        print(f"\n❌ Lỗi kết nối: {e}")
+        print("\nKiểm tra:")
+        print(f"1. SMTP_HOST đúng chưa? (hiện tại: {SMTP_HOST})")
+        print(f"2. SMTP_PORT đúng chưa? (hiện tại: {SMTP_PORT})")
+        print("3. Firewall có chặn port không?")
+    except Exception as e:
+        print(f"\n❌ Lỗi: {e}")
+        print("\nXem hướng dẫn trong file HUONG_DAN_SETUP_SMTP.md")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Test StateStore: chạy cùng một bộ kiểm tra cho các backend memory, sql (SQLite tạm) và redis.
+
+Backend redis được test với một Redis server giả lập local (FakeRedisServer), không cần Redis thật.
+Chạy: pytest test_state_store.py
+"""
+import asyncio
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.core.database import Base
+from app.core.state_store import MemoryStateStore, RedisStateStore, SQLStateStore, StateStore
+
+
+class FakeRedisServer:
+    """Redis server giả lập tối thiểu (RESP2): PING, AUTH, SELECT, SET [PX] [NX], GET, GETDEL, DEL, INCR."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.data: dict[bytes, tuple[float | None, bytes]] = {}
+        self._server = None
+
+    def _get(self, key: bytes):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self.data[key]
+            return None
+        return value
+
+    @staticmethod
+    def _bulk(value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _dispatch(self, args: list[bytes]) -> bytes:
+        cmd = args[0].upper()
+        if cmd in (b"PING",):
+            return b"+PONG\r\n"
+        if cmd in (b"AUTH", b"SELECT"):
+            return b"+OK\r\n"
+        if cmd == b"SET":
+            key, value, opts = args[1], args[2], [a.upper() for a in args[3:]]
+            expires_at = None
+            if b"PX" in opts:
+                expires_at = time.monotonic() + int(args[3 + opts.index(b"PX") + 1]) / 1000
+            if b"NX" in opts and self._get(key) is not None:
+                return b"$-1\r\n"
+            self.data[key] = (expires_at, value)
+            return b"+OK\r\n"
+        if cmd == b"GET":
+            return self._bulk(self._get(args[1]))
+        if cmd == b"GETDEL":
+            value = self._get(args[1])
+            self.data.pop(args[1], None)
+            return self._bulk(value)
+        if cmd == b"DEL":
+            n = sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+            return b":%d\r\n" % n
+        if cmd == b"INCR":
+            value = self._get(args[1])
+            expires_at = self.data[args[1]][0] if value is not None else None
+            count = int(value or 0) + 1
+            self.data[args[1]] = (expires_at, str(count).encode())
+            return b":%d\r\n" % count
+        return b"-ERR unknown command\r\n"
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args = []
+                for _ in range(int(line[1:-2])):
+                    length = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                writer.write(self._dispatch(args))
+                await writer.drain()
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+
+async def check_store(store: StateStore):
+    """Kiểm tra hành vi chung của StateStore."""
+    await store.set("k", "v1", ttl=60)
+    assert await store.get("k") == "v1"
+    await store.set("k", "v2", ttl=60)
+    assert await store.get("k") == "v2"
+
+    results = await asyncio.gather(*(store.get_and_delete("k") for _ in range(5)))
+    assert results.count("v2") == 1 and results.count(None) == 4, results
+    assert await store.get("k") is None
+
+    await store.set("short", "x", ttl=0.2)
+    await asyncio.sleep(0.4)
+    assert await store.get("short") is None
+    assert await store.get_and_delete("short") is None
+
+    assert [await store.incr("c", ttl=60) for _ in range(3)] == [1, 2, 3]
+    await store.set("d", "x", ttl=60)
+    await store.delete("d")
+    assert await store.get("d") is None
+
+
+async def test_memory_store():
+    await check_store(MemoryStateStore())
+
+
+async def test_sql_store(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'state.db'}")
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await check_store(SQLStateStore(async_sessionmaker(engine, expire_on_commit=False)))
+    finally:
+        await engine.dispose()
+
+
+async def test_redis_store():
+    server = FakeRedisServer()
+    await server.start()
+    store = RedisStateStore(f"redis://{server.host}:{server.port}/0")
+    try:
+        await check_store(store)
+    finally:
+        await store.close()
+        await server.stop()
@@ -0,0 +1,100 @@
+"""Test UserService/OTPService trên SQLite tạm: đổi lỗi unique constraint thành lỗi nghiệp vụ,
+job dọn chỉ xóa user đăng ký không kích hoạt kịp.
+
+Thông báo lỗi MySQL/PostgreSQL được dựng lại theo đúng định dạng của driver (không cần server thật).
+Chạy: pytest test_user_service.py
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app.core.database import AsyncSessionLocal
+from app.models.pending_activation import PendingActivation
+from app.models.user import User
+from app.schemas.user import UserCreate, UserUpdate
+from app.services.otp_service import otp_service
+from app.services.user_service import user_service
+
+EMAIL_TAKEN = "Email đã được đăng ký"
+USERNAME_TAKEN = "Username đã được sử dụng"
+
+
+def violation(*orig_args) -> str:
+    error = IntegrityError("INSERT INTO users ...", {}, Exception(*orig_args))
+    return str(user_service._unique_violation(error))
+
+
+def test_unique_violation_messages():
+    cases = [
+        # MySQL 1062 (8.0: key có tiền tố bảng; 5.7: chỉ tên index); giá trị trùng chứa tên cột khác
+        ((1062, "Duplicate entry 'myemail' for key 'users.ix_users_username'"), USERNAME_TAKEN),
+        ((1062, "Duplicate entry 'username@x.com' for key 'users.ix_users_email'"), EMAIL_TAKEN),
+        ((1062, "Duplicate entry 'email' for key 'ix_users_username'"), USERNAME_TAKEN),
+        ((1062, "Duplicate entry 'a@x.com' for key 'users.email'"), EMAIL_TAKEN),
+        # PostgreSQL (index do SQLAlchemy đặt tên, hoặc constraint mặc định <bảng>_<cột>_key)
+        (('duplicate key value violates unique constraint "ix_users_email"\nDETAIL:  Key (email)=(username@x.com) already exists.',), EMAIL_TAKEN),
+        (('duplicate key value violates unique constraint "users_username_key"\nDETAIL:  Key (username)=(email) already exists.',), USERNAME_TAKEN),
+        # SQLite
+        (("UNIQUE constraint failed: users.email",), EMAIL_TAKEN),
+        (("UNIQUE constraint failed: users.username",), USERNAME_TAKEN),
+        # Không nhận ra constraint: không đoán theo nội dung thông báo
+        ((1062, "Duplicate entry 'email' for key 'users.ix_other'"), "Dữ liệu bị trùng"),
+        (("NOT NULL constraint failed: users.email",), "Dữ liệu bị trùng"),
+    ]
+    for args, expected in cases:
+        assert violation(*args) == expected, (args, violation(*args))
+
+
+async def test_unique_violation_sqlite(clean_db):
+    async with AsyncSessionLocal() as db:
+        await user_service.create_user(db, UserCreate(email="a@x.com", username="myemail", password="pw123456"))
+        other = await user_service.create_user(db, UserCreate(email="b@x.com", username="other", password="pw123456"))
+        await db.commit()
+    for user_in, expected in (
+        (UserCreate(email="a@x.com", username="fresh", password="pw123456"), EMAIL_TAKEN),
+        (UserCreate(email="c@x.com", username="myemail", password="pw123456"), USERNAME_TAKEN),
+    ):
+        async with AsyncSessionLocal() as db:
+            try:
+                await user_service.create_user(db, user_in)
+            except ValueError as e:
+                assert str(e) == expected, e
+            else:
+                raise AssertionError(f"{user_in} không bị báo trùng")
+    async with AsyncSessionLocal() as db:
+        try:
+            await user_service.update_user(db, other.id, UserUpdate(username="myemail"))
+        except ValueError as e:
+            assert str(e) == USERNAME_TAKEN, e
+        else:
+            raise AssertionError("update không bị báo trùng")
+
+
+async def test_cleanup_only_expired_registrations(clean_db):
+    old = datetime.utcnow() - timedelta(days=1)
+    async with AsyncSessionLocal() as db:
+        users = {}
+        for name in ("expired", "pending", "admin_created", "deactivated", "activated"):
+            user = await user_service.create_user(db, UserCreate(email=f"{name}@c.com", username=name, password="pw123456"))
+            user.created_at = old
+            users[name] = user.id
+        await db.flush()
+        # Đăng ký qua /auth/register: có mốc chờ kích hoạt
+        for name, expires_at in (("expired", old), ("pending", datetime.utcnow() + timedelta(minutes=1)), ("activated", old)):
+            db.add(PendingActivation(user_id=users[name], expires_at=expires_at))
+        await db.flush()
+        await otp_service.clear_pending_activation(db, users["activated"])
+        for name in ("deactivated", "activated"):
+            (await db.get(User, users[name])).is_active = name == "activated"
+        await db.commit()
+
+    async with AsyncSessionLocal() as db:
+        users_deleted, _ = await otp_service.cleanup_expired_otps_and_inactive_users(db)
+        await db.commit()
+        remaining = set((await db.execute(select(User.username).where(User.id.in_(users.values())))).scalars())
+        markers = set((await db.execute(select(PendingActivation.user_id))).scalars())
+    assert users_deleted == 1, users_deleted
+    assert remaining == {"pending", "admin_created", "deactivated", "activated"}, remaining
+    assert markers == {users["pending"]}, markers
+